@@ -0,0 +1,136 @@
+"""
+Stateless JWT authentication.
+
+Access tokens carry the user's `role` and `username`, so authenticating a
+request and checking permissions needs no database query: ClaimsJWTAuthentication
+returns a ClaimsUser built from the token. Code that needs the full User row
+can use `request.user.instance`, served from a short-TTL in-process cache.
+
+Role changes and deactivation take effect when the user next obtains or
+refreshes a token (refresh re-reads the user), i.e. within ACCESS_TOKEN_LIFETIME.
+Tokens issued without a role claim fall back to loading the user from the
+database.
+
+Browser EventSource clients cannot send headers, so the change feed also
+accepts a StreamToken in `?token=`: a separate token type, valid for
+CHANGE_FEED_TOKEN_LIFETIME seconds, that no other endpoint accepts.
+"""
+
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+
+class UserCache:
+    """
+        Per-process {pk: User} cache whose entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, pk):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(pk)
+            if entry and entry[0] > now:
+                return entry[1]
+        user = get_user_model().objects.filter(pk=pk).first()
+        with self._lock:
+            self._entries[pk] = (now + self.ttl, user)
+        return user
+
+    def invalidate(self, pk=None):
+        with self._lock:
+            if pk is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(pk, None)
+
+
+user_cache = UserCache(ttl=getattr(settings, 'AUTH_USER_CACHE_TTL', 30.0))
+
+
+class ClaimsUser(TokenUser):
+    """
+        Request user built from token claims. Supports the role checks the views
+        use and exposes the full User as `instance` when it is really needed.
+    """
+
+    @property
+    def role(self):
+        return self.token.get('role')
+
+    def is_manager(self) -> bool:
+        return self.role == get_user_model().Role.MANAGER
+
+    def is_agent(self) -> bool:
+        return self.role == get_user_model().Role.AGENT
+
+    @property
+    def instance(self):
+        return user_cache.get(self.pk)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if 'role' not in validated_token:
+            return super().get_user(validated_token)
+        return ClaimsUser(validated_token)
+
+
+def add_role_claims(token, user):
+    token['role'] = user.role
+    token['username'] = user.get_username()
+    return token
+
+
+def tokens_for_user(user) -> RefreshToken:
+    """
+        Refresh token (with `.access_token`) carrying the role claims.
+    """
+    return add_role_claims(RefreshToken.for_user(user), user)
+
+
+class StreamToken(AccessToken):
+    """
+        Short-lived token carried in a URL. Its type differs from "access", so
+        it is rejected as a Bearer token and access tokens are rejected in URLs.
+    """
+    token_type = 'stream'
+    lifetime = timedelta(seconds=getattr(settings, 'CHANGE_FEED_TOKEN_LIFETIME', 60))
+
+
+class QueryTokenAuthentication(ClaimsJWTAuthentication):
+    """
+        Authenticates a StreamToken passed as `?token=`.
+    """
+
+    def authenticate(self, request):
+        raw_token = request.query_params.get('token')
+        if not raw_token:
+            return None
+        try:
+            validated_token = StreamToken(raw_token)
+        except TokenError as e:
+            raise InvalidToken({'detail': str(e)})
+        return self.get_user(validated_token), validated_token
+
+
+def stream_token_for(user) -> StreamToken:
+    """
+        StreamToken with the role claims of `user`, a User or ClaimsUser.
+    """
+    token = StreamToken.for_user(user)
+    token['role'] = user.role
+    token['username'] = user.username
+    return token
@@ -2,7 +2,9 @@ from django.contrib.auth import get_user_model
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.serializers import Serializer, CharField, EmailField, ChoiceField
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .authentication import tokens_for_user
+from .serializers import RoleTokenObtainPairSerializer, RoleTokenRefreshSerializer
 
 
 User = get_user_model()
@@ -15,6 +17,14 @@ class RegisterSerializer(Serializer):
     role = ChoiceField(choices=[('MANAGER', 'Manager'), ('AGENT', 'Agent')])
 
 
+class RoleTokenObtainPairView(TokenObtainPairView):
+    serializer_class = RoleTokenObtainPairSerializer
+
+
+class RoleTokenRefreshView(TokenRefreshView):
+    serializer_class = RoleTokenRefreshSerializer
+
+
 class RegisterAPIView(generics.GenericAPIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = RegisterSerializer
@@ -29,7 +39,7 @@ class RegisterAPIView(generics.GenericAPIView):
         user.set_password(data['password'])
         user.is_active = True
         user.save()
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens_for_user(user)
         return Response({
             'message': 'Registration successful',
             'user': {
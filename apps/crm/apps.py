@@ -1,8 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def install_search_tables(sender, using='default', **kwargs):
+    from apps.crm.services.search import install_search_tables
+    install_search_tables(using=using)
 
 
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.crm'
 
+    def ready(self):
+        from apps.crm import signals  # noqa: F401
+        post_migrate.connect(install_search_tables, sender=self)
 
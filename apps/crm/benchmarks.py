@@ -0,0 +1,485 @@
+"""
+Endpoint benchmarks driven through the Django test client.
+
+`manage.py benchmark` seeds a synthetic dataset into a throwaway test
+database (SQLite or PostgreSQL, whichever DATABASES points at), runs every
+scenario below and reports latency percentiles, SQL queries per request and
+peak Python allocations. Results are emitted as JSON so two runs can be
+compared with `--compare`.
+
+A scenario is one request shape. `prepare(ctx)` runs untimed before every
+request and returns overrides for the path / body, e.g. a fresh row to delete.
+"""
+
+import io
+import json
+import math
+import random
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, resolve
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from apps.accounts.authentication import tokens_for_user
+from apps.crm.models import AuditTrail, Contact, Correspondence, Lead, Note, Reminder
+from apps.crm.services.ai_stub import StubModel
+from apps.crm.services.ai_summary import ai_summary_service, invalidate_lead_summary
+from apps.crm.services.dashboard import invalidate_dashboard
+from apps.crm.services.search import SEARCH_FIELDS, index_instances
+from core.fastjson import FastJSONParser, FastJSONRenderer
+
+# Routes that are not part of the API surface being measured.
+SKIPPED_ROUTES = {'schema', 'docs'}
+
+WORDS = (
+    'acme globex initech umbrella hooli stark wayne wonka cyberdyne soylent '
+    'renewal pricing demo contract pilot onboarding budget proposal follow '
+    'meeting call email signed blocked procurement legal security review'
+).split()
+
+
+class Scenario:
+    def __init__(self, name, method, path, data=None, prepare=None, multipart=False, user='manager', expect=200,
+                 first_chunk=False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.prepare = prepare
+        self.multipart = multipart
+        self.user = user
+        self.expect = expect
+        # Long-lived streams: stop after the first chunk instead of draining them.
+        self.first_chunk = first_chunk
+
+    def request(self, ctx):
+        values = {'path': self.path, 'data': self.data, 'headers': {}}
+        if self.prepare:
+            values.update(self.prepare(ctx))
+        for key in ('path', 'data'):
+            if callable(values[key]):
+                values[key] = values[key](ctx)
+        return values['path'], values['data'], values['headers']
+
+    @property
+    def route(self):
+        return resolve(self.path.split('?')[0]).url_name
+
+
+def _sentence(rng, words=8):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed(leads=200, contacts_per_lead=2, notes_per_lead=5, reminders_per_lead=1, seed_value=1):
+    """
+        Populate the database with a deterministic synthetic dataset and return
+        the context shared by the scenarios.
+    """
+    User = get_user_model()
+    rng = random.Random(seed_value)
+    manager = User.objects.create_user('bench-manager', 'manager@example.com', 'bench-pass', role='MANAGER')
+    agent = User.objects.create_user('bench-agent', 'agent@example.com', 'bench-pass', role='AGENT')
+    owners = [manager, agent]
+
+    lead_rows = Lead.objects.bulk_create([
+        Lead(
+            name=f'{rng.choice(WORDS).title()} {i}',
+            owner=owners[i % 2],
+            status=rng.choice(Lead.Status.values),
+            description=_sentence(rng, 20),
+            value=rng.randint(100, 100000),
+            source=rng.choice(['website', 'referral', 'cold call', 'event']),
+        )
+        for i in range(leads)
+    ], batch_size=1000)
+    contact_rows = Contact.objects.bulk_create([
+        Contact(
+            name=f'Contact {lead.pk}-{j}',
+            email=f'contact{lead.pk}-{j}@example.com',
+            linked_lead=lead,
+            company=rng.choice(WORDS).title(),
+            title=rng.choice(['CEO', 'CTO', 'Buyer', 'Engineer']),
+            is_primary=j == 0,
+        )
+        for lead in lead_rows for j in range(contacts_per_lead)
+    ], batch_size=1000)
+    note_rows = Note.objects.bulk_create([
+        Note(lead=lead, created_by=lead.owner, content=_sentence(rng, 40))
+        for lead in lead_rows for _ in range(notes_per_lead)
+    ], batch_size=1000)
+    now = timezone.now()
+    reminder_rows = Reminder.objects.bulk_create([
+        Reminder(
+            lead=lead,
+            created_by=lead.owner,
+            message=_sentence(rng, 6),
+            scheduled_time=now + timedelta(days=rng.randint(1, 60)),
+        )
+        for lead in lead_rows for _ in range(reminders_per_lead)
+    ], batch_size=1000)
+    correspondence_rows = Correspondence.objects.bulk_create([
+        Correspondence(
+            contact=contact,
+            created_by=manager,
+            type=rng.choice(Correspondence.Type.values),
+            notes=_sentence(rng, 15),
+            outcome=rng.choice(['positive', 'neutral', 'no answer']),
+        )
+        for contact in contact_rows
+    ], batch_size=1000)
+    AuditTrail.objects.bulk_create([
+        AuditTrail(
+            user=lead.owner,
+            action=action,
+            model='crm.Lead',
+            object_id=str(lead.pk),
+            changes={'name': [None, lead.name]},
+            user_agent='benchmark',
+        )
+        for lead in lead_rows for action in ('create', 'update')
+    ], batch_size=1000)
+
+    for model, rows in ((Lead, lead_rows), (Contact, contact_rows), (Note, note_rows),
+                        (Reminder, reminder_rows), (Correspondence, correspondence_rows)):
+        if model in SEARCH_FIELDS:
+            index_instances(model, rows)
+
+    return SimpleNamespace(
+        rng=rng,
+        users={'manager': manager, 'agent': agent},
+        lead_ids=[lead.pk for lead in lead_rows],
+        contact_ids=[contact.pk for contact in contact_rows],
+        note_ids=[note.pk for note in note_rows],
+        reminder_ids=[reminder.pk for reminder in reminder_rows],
+        correspondence_ids=[row.pk for row in correspondence_rows],
+        counter=0,
+    )
+
+
+def _unique(ctx):
+    ctx.counter += 1
+    return ctx.counter
+
+
+def _pick(attr):
+    return lambda ctx: ctx.rng.choice(getattr(ctx, attr))
+
+
+def _fresh_lead(ctx):
+    return Lead.objects.create(name=f'Disposable {_unique(ctx)}', owner=ctx.users['manager']).pk
+
+
+def _fresh_contact(ctx):
+    n = _unique(ctx)
+    return Contact.objects.create(
+        name=f'Disposable {n}', email=f'disposable{n}@example.com', linked_lead_id=_pick('lead_ids')(ctx)
+    ).pk
+
+
+def _import_file(ctx):
+    n = _unique(ctx)
+    rows = ['name,email,linked_lead']
+    rows += [f'Imported {n}-{i},imported{n}-{i}@example.com,{_pick("lead_ids")(ctx)}' for i in range(50)]
+    upload = io.BytesIO(('\n'.join(rows) + '\n').encode())
+    upload.name = 'contacts.csv'
+    return {'kind': 'contacts', 'file': upload}
+
+
+def _cold_summary(ctx):
+    lead_id = _pick('lead_ids')(ctx)
+    invalidate_lead_summary(lead_id)
+    return {'path': f'/api/leads/{lead_id}/summary/'}
+
+
+def _timeline(ctx):
+    return {'path': f'/api/leads/{_pick("lead_ids")(ctx)}/timeline/'}
+
+
+def _cold_dashboard(ctx):
+    invalidate_dashboard()
+    return {}
+
+
+def _revalidate(path):
+    """
+        Send the ETag of the current response back, as a polling client would.
+    """
+    def prepare(ctx):
+        etag = _client_for(ctx.users['manager']).get(path)['ETag']
+        return {'headers': {'HTTP_IF_NONE_MATCH': etag}}
+    return prepare
+
+
+def build_scenarios():
+    scenarios = [
+        Scenario('leads.list', 'get', '/api/leads/'),
+        Scenario('leads.list.epoch', 'get', '/api/leads/?timestamps=epoch'),
+        Scenario('leads.list.agent', 'get', '/api/leads/', user='agent'),
+        Scenario('leads.list.not_modified', 'get', '/api/leads/', prepare=_revalidate('/api/leads/'), expect=304),
+        Scenario('leads.list.cursor', 'get', '/api/leads/?pagination=cursor&rows=50'),
+        Scenario('leads.search', 'get', '/api/leads/?search=acme'),
+        Scenario('leads.create', 'post', '/api/leads/',
+                 data=lambda ctx: {'name': f'Bench {_unique(ctx)}', 'value': '1500', 'status': 'NEW'}, expect=201),
+        Scenario('leads.update', 'put', '/api/leads/',
+                 data=lambda ctx: {'id': _pick('lead_ids')(ctx), 'description': f'Updated {_unique(ctx)}'}),
+        Scenario('leads.delete', 'delete', '/api/leads/',
+                 prepare=lambda ctx: {'path': f'/api/leads/?id={_fresh_lead(ctx)}'}),
+        Scenario('leads.summary', 'get', '/api/leads/1/summary/', prepare=_cold_summary),
+        Scenario('leads.timeline', 'get', '/api/leads/1/timeline/', prepare=_timeline),
+        Scenario('leads.bulk.create', 'post', '/api/leads/bulk/',
+                 data=lambda ctx: {'leads': [{'name': f'Bulk {_unique(ctx)}'} for _ in range(50)]}),
+        Scenario('leads.bulk.update', 'put', '/api/leads/bulk/',
+                 data=lambda ctx: {'leads': [
+                     {'id': lead_id, 'source': f'bulk {_unique(ctx)}'}
+                     for lead_id in ctx.rng.sample(ctx.lead_ids, 50)
+                 ]}),
+        Scenario('leads.export', 'get', '/api/leads/export/'),
+        Scenario('contacts.list', 'get', '/api/contacts/'),
+        Scenario('contacts.search', 'get', '/api/contacts/?search=contact'),
+        Scenario('contacts.create', 'post', '/api/contacts/',
+                 data=lambda ctx: {
+                     'name': 'Bench', 'email': f'bench{_unique(ctx)}@example.com',
+                     'linked_lead': _pick('lead_ids')(ctx),
+                 }, expect=201),
+        Scenario('contacts.update', 'put', '/api/contacts/',
+                 data=lambda ctx: {'id': _pick('contact_ids')(ctx), 'title': f'Title {_unique(ctx)}'}),
+        Scenario('contacts.delete', 'delete', '/api/contacts/',
+                 prepare=lambda ctx: {'path': f'/api/contacts/?id={_fresh_contact(ctx)}'}),
+        Scenario('contacts.bulk.create', 'post', '/api/contacts/bulk/',
+                 data=lambda ctx: {'contacts': [
+                     {'name': 'Bulk', 'email': f'bulk{_unique(ctx)}@example.com', 'linked_lead': _pick('lead_ids')(ctx)}
+                     for _ in range(50)
+                 ]}),
+        Scenario('contacts.bulk.update', 'put', '/api/contacts/bulk/',
+                 data=lambda ctx: {'contacts': [
+                     {'id': contact_id, 'company': f'Co {_unique(ctx)}'}
+                     for contact_id in ctx.rng.sample(ctx.contact_ids, 50)
+                 ]}),
+        Scenario('contacts.export', 'get', '/api/contacts/export/'),
+        Scenario('notes.list', 'get', '/api/notes/'),
+        Scenario('notes.search', 'get', '/api/notes/?search=pricing'),
+        Scenario('notes.create', 'post', '/api/notes/',
+                 data=lambda ctx: {'lead': _pick('lead_ids')(ctx), 'content': f'Bench note {_unique(ctx)}'},
+                 expect=201),
+        Scenario('notes.update', 'put', '/api/notes/',
+                 data=lambda ctx: {'id': _pick('note_ids')(ctx), 'content': f'Edited {_unique(ctx)}'}),
+        Scenario('reminders.list', 'get', '/api/reminders/'),
+        Scenario('reminders.list.not_modified', 'get', '/api/reminders/',
+                 prepare=_revalidate('/api/reminders/'), expect=304),
+        Scenario('reminders.search', 'get', '/api/reminders/?search=demo'),
+        Scenario('reminders.create', 'post', '/api/reminders/',
+                 data=lambda ctx: {
+                     'lead_id': _pick('lead_ids')(ctx), 'message': f'Bench {_unique(ctx)}',
+                     'scheduled_time': (timezone.now() + timedelta(days=3)).isoformat(),
+                 }, expect=201),
+        Scenario('reminders.update', 'put', '/api/reminders/',
+                 data=lambda ctx: {'id': _pick('reminder_ids')(ctx), 'message': f'Moved {_unique(ctx)}'}),
+        Scenario('correspondence.list', 'get', '/api/correspondence/'),
+        Scenario('correspondence.search', 'get', '/api/correspondence/?search=call'),
+        Scenario('correspondence.create', 'post', '/api/correspondence/',
+                 data=lambda ctx: {'contact': _pick('contact_ids')(ctx), 'type': 'email', 'notes': 'bench'},
+                 expect=201),
+        Scenario('correspondence.update', 'put', '/api/correspondence/',
+                 data=lambda ctx: {'id': _pick('correspondence_ids')(ctx), 'outcome': f'out {_unique(ctx)}'}),
+        Scenario('audit.list', 'get', '/api/audit/'),
+        Scenario('audit.list.cursor', 'get', '/api/audit/?pagination=cursor&rows=50'),
+        Scenario('audit.export', 'get', '/api/audit/export/'),
+        Scenario('import.contacts', 'post', '/api/import/', data=_import_file, multipart=True),
+        Scenario('webhooks.create', 'post', '/api/webhooks/',
+                 data=lambda ctx: {'url': f'https://hooks.example.com/{_unique(ctx)}'}, expect=201),
+        Scenario('webhooks.list', 'get', '/api/webhooks/'),
+        Scenario('changes', 'get', '/api/changes/', first_chunk=True),
+        Scenario('changes.token', 'post', '/api/changes/token/'),
+        Scenario('dashboard.cold', 'get', '/api/dashboard/', prepare=_cold_dashboard),
+        Scenario('dashboard.warm', 'get', '/api/dashboard/'),
+        Scenario('dashboard.not_modified', 'get', '/api/dashboard/',
+                 prepare=_revalidate('/api/dashboard/'), expect=304),
+        Scenario('auth.token', 'post', '/api/auth/token/',
+                 data={'username': 'bench-manager', 'password': 'bench-pass'}),
+        Scenario('auth.token.refresh', 'post', '/api/auth/token/refresh/',
+                 data=lambda ctx: {'refresh': str(tokens_for_user(ctx.users['manager']))}),
+        Scenario('auth.register', 'post', '/api/auth/register/',
+                 data=lambda ctx: {
+                     'username': f'bench-user-{_unique(ctx)}', 'email': 'user@example.com',
+                     'password': 'bench-pass', 'role': 'AGENT',
+                 }, expect=201),
+    ]
+    return scenarios
+
+
+def api_routes():
+    """
+        Names of every URL pattern under api/, including included URLconfs.
+    """
+    names = set()
+
+    def walk(patterns, prefix):
+        for pattern in patterns:
+            route = prefix + str(pattern.pattern)
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns, route)
+            elif isinstance(pattern, URLPattern) and pattern.name and route.startswith('api/'):
+                names.add(pattern.name)
+
+    walk(get_resolver().url_patterns, '')
+    return names
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    # Nearest-rank percentile.
+    index = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def _client_for(user):
+    client = Client()
+    client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {tokens_for_user(user).access_token}'
+    return client
+
+
+def _send(client, scenario, path, data, headers):
+    send = getattr(client, scenario.method)
+    if scenario.multipart:
+        response = send(path, data, **headers)
+    elif data is None:
+        response = send(path, **headers)
+    else:
+        response = send(path, json.dumps(data), content_type='application/json', **headers)
+    if response.streaming and scenario.first_chunk:
+        next(iter(response.streaming_content), b'')
+        response.close()
+    elif response.streaming:
+        # Consume the body so the streamed queries and serialization are timed.
+        b''.join(response.streaming_content)
+    return response
+
+
+def run_scenario(scenario, ctx, iterations=30, warmup=3, alloc_iterations=3):
+    client = _client_for(ctx.users[scenario.user])
+    latencies, queries, statuses = [], [], set()
+
+    for i in range(warmup + iterations):
+        path, data, headers = scenario.request(ctx)
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connection)) for connection in connections.all()]
+            start = time.perf_counter()
+            response = _send(client, scenario, path, data, headers)
+            elapsed = time.perf_counter() - start
+        statuses.add(response.status_code)
+        if i >= warmup:
+            latencies.append(elapsed * 1000)
+            queries.append(sum(len(queries_run) for queries_run in captured))
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_iterations):
+            path, data, headers = scenario.request(ctx)
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            _send(client, scenario, path, data, headers)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'method': scenario.method.upper(),
+        'route': scenario.route,
+        'status': sorted(statuses),
+        'ok': statuses == {scenario.expect},
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'queries': statistics.median_low(queries),
+        'queries_max': max(queries),
+        'alloc_peak_kib': round(statistics.median(peaks) / 1024, 1),
+    }
+
+
+def run_benchmarks(ctx, scenarios, iterations=30, warmup=3, alloc_iterations=3, ai_latency=0.0, progress=None):
+    results = {}
+    original_model = ai_summary_service.model
+    ai_summary_service.model = StubModel(ai_latency)
+    try:
+        cache.clear()
+        # The test client is a WSGI client, which the change feed otherwise refuses.
+        with override_settings(CHANGE_FEED_WSGI_STREAMS=True):
+            for scenario in scenarios:
+                results[scenario.name] = run_scenario(scenario, ctx, iterations, warmup, alloc_iterations)
+                if progress:
+                    progress(scenario.name, results[scenario.name])
+    finally:
+        ai_summary_service.model = original_model
+
+    covered = {scenario.route for scenario in scenarios}
+    return results, sorted(api_routes() - covered - SKIPPED_ROUTES)
+
+
+def _time_ms(func, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return percentile(timings, 50)
+
+
+def run_json_benchmarks(ctx, scenarios, iterations=30, progress=None):
+    """
+        Compare DRF's stdlib JSONRenderer / JSONParser with the fast ones on
+        real payloads: every response body the scenarios render and every JSON
+        request body they send.
+    """
+    results = {}
+    original_model = ai_summary_service.model
+    ai_summary_service.model = StubModel()
+    try:
+        for scenario in scenarios:
+            client = _client_for(ctx.users[scenario.user])
+            path, data, headers = scenario.request(ctx)
+            response = _send(client, scenario, path, data, headers)
+            cases = []
+            if getattr(response, 'data', None) is not None and not response.streaming:
+                cases.append(('render', response.data))
+            if data is not None and not scenario.multipart:
+                cases.append(('parse', json.dumps(data).encode()))
+
+            for kind, payload in cases:
+                if kind == 'render':
+                    stdlib, fast = JSONRenderer(), FastJSONRenderer()
+                    size = len(stdlib.render(payload))
+                    stdlib_ms = _time_ms(lambda: stdlib.render(payload), iterations)
+                    fast_ms = _time_ms(lambda: fast.render(payload), iterations)
+                else:
+                    stdlib, fast = JSONParser(), FastJSONParser()
+                    size = len(payload)
+                    stdlib_ms = _time_ms(lambda: stdlib.parse(io.BytesIO(payload)), iterations)
+                    fast_ms = _time_ms(lambda: fast.parse(io.BytesIO(payload)), iterations)
+                name = f'{scenario.name}:{kind}'
+                results[name] = {
+                    'bytes': size,
+                    'stdlib_ms': round(stdlib_ms, 3),
+                    'fast_ms': round(fast_ms, 3),
+                    'speedup': round(stdlib_ms / fast_ms, 2) if fast_ms else None,
+                }
+                if progress:
+                    progress(name, results[name])
+    finally:
+        ai_summary_service.model = original_model
+    return results
@@ -0,0 +1,95 @@
+"""
+Conditional GET (ETag) for polled endpoints.
+
+A list response is fully determined by the rows it is built from, so its
+validators are derived from `max(updated_at)` and `COUNT(*)` of each queryset
+that feeds the payload (the filtered rows plus any nested relations), fetched
+together in a single UNION ALL query. Inserts and updates move the max, deletes
+move the count, so any change that could alter the payload changes the ETag.
+
+No Last-Modified is derived from them: a delete leaves `max(updated_at)`
+where it was, so a client revalidating with If-Modified-Since alone would be
+told its stale copy is current. Only If-None-Match can produce a 304.
+
+The ETag also covers the user and the full query string, because scoping,
+filters and the page all change the body.
+
+Usage in a view:
+
+    etag = queryset_validators(request, leads, notes_of_leads)
+    not_modified = not_modified_response(request, etag)
+    if not_modified:
+        return not_modified
+    ...
+    return set_validators(Response(...), etag)
+"""
+
+import hashlib
+
+from django.db.models import Count, IntegerField, Max, Value
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+
+def _request_scope(request):
+    return f'{request.user.pk}|{request.get_full_path()}'
+
+
+def _versions_query(querysets):
+    combined = None
+    for index, queryset in enumerate(querysets):
+        part = queryset.order_by().annotate(
+            part=Value(index, output_field=IntegerField()),
+        ).values('part').annotate(
+            last=Max('updated_at'),
+            rows=Count('pk'),
+        ).values_list('part', 'last', 'rows')
+        combined = part if combined is None else combined.union(part, all=True)
+    return combined
+
+
+def _validators(request, count, rows):
+    versions = {part: (last, total) for part, last, total in rows}
+    digest = hashlib.sha1(_request_scope(request).encode())
+    for last, total in (versions.get(i, (None, 0)) for i in range(count)):
+        digest.update(f'|{last.isoformat() if last else ""}:{total}'.encode())
+    return digest.hexdigest()
+
+
+def queryset_validators(request, *querysets):
+    """
+        ETag of a response built from `querysets`, which must all have an
+        `updated_at` field.
+    """
+    return _validators(request, len(querysets), list(_versions_query(querysets)))
+
+
+async def aqueryset_validators(request, *querysets):
+    rows = [row async for row in _versions_query(querysets)]
+    return _validators(request, len(querysets), rows)
+
+
+def key_validators(request, key):
+    """
+        ETag of a response identified by a cache key, e.g. one that embeds a
+        generation bumped on every write.
+    """
+    digest = hashlib.sha1(f'{_request_scope(request)}|{key}'.encode())
+    return digest.hexdigest()
+
+
+def not_modified_response(request, etag):
+    """
+        304 response if the client's If-None-Match matches, else None.
+    """
+    response = get_conditional_response(request, etag=quote_etag(etag))
+    if response is not None:
+        set_validators(response, etag)
+    return response
+
+
+def set_validators(response, etag):
+    response['ETag'] = quote_etag(etag)
+    # Clients must revalidate, but may keep the body to replay on 304.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
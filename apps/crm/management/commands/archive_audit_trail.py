@@ -0,0 +1,38 @@
+import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.crm.services.audit_archive import archive_before, archive_month
+
+
+class Command(BaseCommand):
+    help = "Move old months of the audit trail to compressed JSONL archives."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--directory', default=None, help="Defaults to AUDIT_ARCHIVE_DIR")
+        parser.add_argument('--keep-months', type=int, default=None,
+                            help="Months kept in the hot table, including the current one")
+        parser.add_argument('--month', default=None, help="Archive a single month (YYYY-MM)")
+
+    def handle(self, *args, **options):
+        using = options['database']
+        try:
+            if options['month']:
+                month = datetime.datetime.strptime(options['month'], '%Y-%m').date()
+                archives = [archive_month(month, options['directory'], using=using)]
+            else:
+                keep = options['keep_months']
+                if keep is None:
+                    keep = settings.AUDIT_HOT_MONTHS
+                cutoff = timezone.localdate() - relativedelta(months=max(keep - 1, 0))
+                archives = archive_before(cutoff, options['directory'], using=using)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        for archive in archives:
+            self.stdout.write(f"{archive.month:%Y-%m}: {archive.row_count} rows -> {archive.path}")
+        self.stdout.write(self.style.SUCCESS(f"Archived {len(archives)} month(s)"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from apps.crm.services.audit_archive import convert_to_partitioned, ensure_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = "Partition the audit trail by month (PostgreSQL) and create the upcoming partitions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--convert', action='store_true',
+                            help="Convert the existing table to a partitioned one first")
+        parser.add_argument('--months-ahead', type=int, default=None)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if options['convert'] and convert_to_partitioned(using=using):
+            self.stdout.write("Converted the audit trail to a partitioned table")
+        if not is_partitioned(using=using):
+            self.stdout.write("Audit trail is not partitioned; months are rolled over by archive_audit_trail")
+            return
+        for name in ensure_partitions(months_ahead=options['months_ahead'], using=using):
+            self.stdout.write(f"Created partition {name}")
@@ -0,0 +1,147 @@
+import json
+import logging
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from apps.crm.benchmarks import build_scenarios, run_benchmarks, run_json_benchmarks, seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and benchmark every API route: "
+        "p50/p95/p99 latency, queries per request and peak allocations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leads', type=int, default=200)
+        parser.add_argument('--contacts-per-lead', type=int, default=2)
+        parser.add_argument('--notes-per-lead', type=int, default=5)
+        parser.add_argument('--reminders-per-lead', type=int, default=1)
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--alloc-iterations', type=int, default=3)
+        parser.add_argument('--ai-latency', type=float, default=0.0,
+                            help="Seconds the stub AI model sleeps per summary")
+        parser.add_argument('--only', nargs='*', default=None,
+                            help="Run only scenarios whose name starts with one of these prefixes")
+        parser.add_argument('--serializers', choices=['compiled', 'drf'], default='compiled',
+                            help="List serialization path to measure")
+        parser.add_argument('--json', action='store_true',
+                            help="Also compare the stdlib and fast JSON renderer/parser on the scenario payloads")
+        parser.add_argument('--output', default=None, help="Write the JSON report to this file")
+        parser.add_argument('--compare', default=None, help="Baseline JSON report to diff against")
+
+    def handle(self, *args, **options):
+        scenarios = build_scenarios()
+        if options['only']:
+            scenarios = [s for s in scenarios if s.name.startswith(tuple(options['only']))]
+
+        dataset = {
+            'leads': options['leads'],
+            'contacts_per_lead': options['contacts_per_lead'],
+            'notes_per_lead': options['notes_per_lead'],
+            'reminders_per_lead': options['reminders_per_lead'],
+        }
+
+        # Query counts are part of the report; don't also log budget warnings.
+        metrics_logger = logging.getLogger('crm.metrics')
+        metrics_logger.disabled = True
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(
+                AUDIT_DURABILITY='sync',
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                REQUEST_METRICS_SAMPLE_RATE=0.0,
+                COMPILED_LIST_SERIALIZERS=options['serializers'] == 'compiled',
+            ):
+                self.stdout.write(f"Seeding {connection.vendor} test database...")
+                ctx = seed(**dataset)
+                results, uncovered = run_benchmarks(
+                    ctx,
+                    scenarios,
+                    iterations=options['iterations'],
+                    warmup=options['warmup'],
+                    alloc_iterations=options['alloc_iterations'],
+                    ai_latency=options['ai_latency'],
+                    progress=self.write_row,
+                )
+                json_results = None
+                if options['json']:
+                    self.stdout.write("\nJSON renderer / parser (stdlib vs fast):")
+                    json_results = run_json_benchmarks(
+                        ctx, scenarios, iterations=options['iterations'], progress=self.write_json_row,
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            metrics_logger.disabled = False
+
+        report = {
+            'meta': {
+                'commit': self.git_commit(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'iterations': options['iterations'],
+                'dataset': dataset,
+                'serializers': options['serializers'],
+            },
+            'results': results,
+            'uncovered_routes': uncovered,
+        }
+        if json_results is not None:
+            report['json'] = json_results
+        if uncovered and not options['only']:
+            self.stderr.write(f"Routes without a scenario: {', '.join(uncovered)}")
+        failed = [name for name, result in results.items() if not result['ok']]
+        if failed:
+            self.stderr.write(f"Unexpected status codes: {', '.join(failed)}")
+
+        if options['compare']:
+            with open(options['compare']) as handle:
+                self.write_comparison(json.load(handle), report)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def write_row(self, name, result):
+        self.stdout.write(
+            f"{name:<30} {result['method']:<6} p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  "
+            f"p99 {result['p99_ms']:>8.2f}ms  {result['queries']:>4} queries  {result['alloc_peak_kib']:>9.1f} KiB"
+            + ('' if result['ok'] else f"  status {result['status']}")
+        )
+
+    def write_json_row(self, name, result):
+        self.stdout.write(
+            f"{name:<38} {result['bytes'] / 1024:>9.1f} KiB  stdlib {result['stdlib_ms']:>8.3f}ms  "
+            f"fast {result['fast_ms']:>8.3f}ms  x{result['speedup'] or 0:.2f}"
+        )
+
+    def write_comparison(self, baseline, report):
+        self.stdout.write(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'}:")
+        for name, result in report['results'].items():
+            before = baseline['results'].get(name)
+            if not before:
+                continue
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0.0
+            self.stdout.write(
+                f"{name:<30} p50 {before['p50_ms']:>8.2f} -> {result['p50_ms']:>8.2f}ms ({change:+.1f}%)  "
+                f"queries {before['queries']} -> {result['queries']}"
+            )
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
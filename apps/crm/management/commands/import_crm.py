@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.crm.services.importer import IMPORT_KINDS, import_csv
+
+
+class Command(BaseCommand):
+    help = "Import leads or contacts from a CSV file in bounded-memory chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=IMPORT_KINDS)
+        parser.add_argument('path', help="CSV file with a header row")
+        parser.add_argument('--user', required=True, help="Username recorded as owner / audit actor")
+        parser.add_argument('--chunk-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']!r} does not exist")
+
+        def progress(report):
+            self.stdout.write(
+                f"{report.rows} rows: {report.created} created, {report.updated} updated, {report.failed} failed"
+            )
+
+        with open(options['path'], newline='', encoding='utf-8-sig') as stream:
+            report = import_csv(options['kind'], stream, user, chunk_size=options['chunk_size'], progress=progress)
+
+        for error in report.errors:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report.rows} rows: {report.created} created, {report.updated} updated, {report.failed} failed"
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from apps.crm.services.search import SEARCH_FIELDS, index_instances, install_search_tables
+
+
+class Command(BaseCommand):
+    help = "Create the full-text search tables and (re)index every searchable row."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        chunk_size = options['chunk_size']
+        install_search_tables(using=using)
+
+        for model, fields in SEARCH_FIELDS.items():
+            queryset = model.objects.using(using).only('pk', *fields).order_by()
+            batch = []
+            total = 0
+            for obj in queryset.iterator(chunk_size=chunk_size):
+                batch.append(obj)
+                if len(batch) >= chunk_size:
+                    index_instances(model, batch, using=using)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                index_instances(model, batch, using=using)
+                total += len(batch)
+            self.stdout.write(f"{model._meta.label}: indexed {total} rows")
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from apps.crm.services.ai_stub import StubModel
+from apps.crm.services.ai_summary import ai_summary_service
+from apps.crm.services.summary_batch import summarize_leads
+
+
+class Command(BaseCommand):
+    help = "Refresh the cached AI summaries of open leads (what the refresh_lead_summaries task runs)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lead', type=int, nargs='*', default=None, help="Summarize these leads instead")
+        parser.add_argument('--force', action='store_true', help="Also redo summaries that are up to date")
+        parser.add_argument('--concurrency', type=int, default=None, help="Defaults to AI_SUMMARY_BATCH_CONCURRENCY")
+        parser.add_argument('--rate', type=float, default=None, help="Model calls per second; defaults to AI_SUMMARY_RATE")
+        parser.add_argument('--timeout', type=float, default=None, help="Defaults to AI_SUMMARY_TIMEOUT")
+        parser.add_argument('--stub', action='store_true', help="Use a local stub instead of Gemini")
+        parser.add_argument('--stub-latency', type=float, default=0.0, help="Seconds the stub takes per summary")
+        parser.add_argument('--stub-failure-rate', type=float, default=0.0, help="Fraction of stub calls that fail")
+
+    def handle(self, *args, **options):
+        original_model = ai_summary_service.model
+        if options['stub']:
+            ai_summary_service.model = StubModel(options['stub_latency'], options['stub_failure_rate'])
+        try:
+            counts = summarize_leads(
+                lead_ids=options['lead'],
+                force=options['force'],
+                concurrency=options['concurrency'],
+                rate=options['rate'],
+                timeout=options['timeout'],
+            )
+        finally:
+            ai_summary_service.model = original_model
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['summarized']} summarized, {counts['fresh']} up to date, "
+            f"{counts['fallback']} fell back, {counts['no_notes']} without notes"
+        ))
@@ -4,5 +4,5 @@ from .contact import Contact
 from .note import Note
 from .reminder import Reminder
 from .correspondence import Correspondence
-from .audit import AuditTrail
-
+from .audit import AuditTrail, AuditArchive
+from .outbox import OutboxEvent, WebhookEndpoint
@@ -1,5 +1,7 @@
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 from .timestamp import TimestampedModel
 
 
@@ -13,13 +15,20 @@ class AuditTrail(TimestampedModel):
     object_id = models.CharField(max_length=50)
     old_value = models.JSONField(null=True, blank=True)
     new_value = models.JSONField(null=True, blank=True)
+    # {field: [old, new]} for the fields the action changed. old_value/new_value
+    # are only set on entries recorded before field-level diffs were introduced.
+    changes = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
+    # Set when the entry is built rather than when it is inserted, so entries
+    # written by the audit buffer keep the time of their change.
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['model', 'object_id']),
+            # Also serves an object's history newest first (lead timeline).
+            models.Index(fields=['model', 'object_id', 'created_at']),
             models.Index(fields=['user', 'action']),
             models.Index(fields=['created_at']),
         ]
@@ -28,3 +37,19 @@ class AuditTrail(TimestampedModel):
         return f"{self.action} on {self.model} by {self.user.username if self.user else 'System'}"
 
 
+
+
+class AuditArchive(models.Model):
+    """
+        A month of audit entries moved out of the hot table into a compressed JSONL file.
+    """
+    month = models.DateField(unique=True)
+    path = models.CharField(max_length=500)
+    row_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-month']
+
+    def __str__(self) -> str:
+        return f"Audit archive {self.month:%Y-%m} ({self.row_count} rows)"
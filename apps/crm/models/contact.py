@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 from .timestamp import TimestampedModel
 from .lead import Lead
 
@@ -16,6 +17,10 @@ class Contact(TimestampedModel):
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Serves de-duplication lookups on normalized email during imports.
+            models.Index(Lower('email'), name='crm_contact_email_lower_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"{self.name} <{self.email}>"
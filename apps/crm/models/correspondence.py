@@ -33,6 +33,10 @@ class Correspondence(TimestampedModel):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A contact's correspondence newest first (lead timeline).
+            models.Index(fields=['contact', 'created_at'], name='crm_corr_contact_created_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"{self.type.title()} with {self.contact.name}"
@@ -25,6 +25,10 @@ class Note(TimestampedModel):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A lead's notes newest first (lead timeline, summaries).
+            models.Index(fields=['lead', 'created_at'], name='crm_note_lead_created_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"Note by {self.created_by.username} on {self.lead.name}"
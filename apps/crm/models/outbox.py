@@ -0,0 +1,49 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from .timestamp import TimestampedModel
+
+
+class OutboxEvent(models.Model):
+    """
+        A CRM change, written in the transaction that made it and delivered to
+        the webhook endpoints afterwards (apps.crm.services.outbox).
+    """
+    class Action(models.TextChoices):
+        CREATE = 'create', 'Create'
+        UPDATE = 'update', 'Update'
+        DELETE = 'delete', 'Delete'
+
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=50)
+    action = models.CharField(max_length=10, choices=Action.choices)
+    # Field values after the change; null for deletes.
+    data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self) -> str:
+        return f"{self.action} {self.model} #{self.object_id}"
+
+
+class WebhookEndpoint(TimestampedModel):
+    """
+        A URL receiving batches of outbox events. Each endpoint keeps its own
+        position in the outbox and backs off on its own when it fails.
+    """
+    url = models.URLField(max_length=500)
+    secret = models.CharField(max_length=200, blank=True, help_text="Signs deliveries (X-CRM-Signature, HMAC-SHA256)")
+    model_labels = models.JSONField(default=list, blank=True, help_text="Models to deliver, e.g. ['crm.Lead']; empty for all")
+    is_active = models.BooleanField(default=True)
+    last_event_id = models.BigIntegerField(default=0, help_text="Outbox id delivered up to")
+    failures = models.PositiveIntegerField(default=0, help_text="Consecutive failed deliveries")
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self) -> str:
+        return self.url
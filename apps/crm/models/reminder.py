@@ -30,9 +30,24 @@ class Reminder(TimestampedModel):
         ],
         default='FOLLOW_UP'
     )
+    attempts = models.PositiveSmallIntegerField(default=0, help_text="Delivery attempts made so far")
+    last_error = models.TextField(blank=True, help_text="Error from the last failed delivery attempt")
+    claimed_at = models.DateTimeField(
+        null=True, blank=True, help_text="When a dispatcher claimed this reminder for delivery; cleared with the outcome"
+    )
 
     class Meta:
         ordering = ['scheduled_time']
+        indexes = [
+            # Due-reminder scans only ever look at PENDING rows; keep SENT history out of the index.
+            models.Index(
+                fields=['scheduled_time'],
+                name='crm_reminder_pending_due_idx',
+                condition=models.Q(status='PENDING'),
+            ),
+            # A lead's reminders in creation order (lead timeline).
+            models.Index(fields=['lead', 'created_at'], name='crm_reminder_lead_created_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"Reminder: {self.message} for {self.lead.name}"
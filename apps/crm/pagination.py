@@ -0,0 +1,205 @@
+"""
+Pagination helpers shared by the list endpoints.
+
+Two modes are supported:
+- page mode (default): `?page=N&rows=M`, backed by Django's Paginator.
+- cursor mode (opt-in): `?pagination=cursor` for the first page, then
+  `?cursor=<token>` using the returned `next_cursor` / `prev_cursor`.
+  Cursor mode uses keyset filtering on the view's ordering, so it never runs
+  COUNT(*) or OFFSET and every page costs the same as the first.
+"""
+
+import base64
+import json
+from operator import itemgetter
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+
+def is_cursor_request(request):
+    params = request.query_params
+    return params.get('pagination') == 'cursor' or 'cursor' in params
+
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps({'v': values, 'r': reverse}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return payload['v'], bool(payload['r'])
+    except (ValueError, KeyError, TypeError):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+
+
+class KeysetPaginator:
+    """
+        Keyset paginator over a fixed ordering, e.g. ['-created_at', 'id'].
+        The last ordering field must be unique so every row has a distinct key.
+    """
+
+    def __init__(self, queryset, ordering, rows):
+        if 'search_rank' in queryset.query.annotations:
+            # Keys don't carry the rank, so pages would come back in date order.
+            raise ValidationError({'cursor': 'Cursor pagination cannot be combined with search.'})
+        self.queryset = queryset
+        self.ordering = [(f.lstrip('-'), f.startswith('-')) for f in ordering]
+        self.rows = rows
+
+    def _row_key(self, row):
+        if isinstance(row, dict):
+            return [row[name] for name, _ in self.ordering]
+        return [getattr(row, name) for name, _ in self.ordering]
+
+    def _after(self, values, reverse):
+        """
+            Q for rows strictly after `values` in the (possibly reversed) ordering:
+            (a > x) OR (a = x AND b > y) OR ...
+        """
+        query = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            query |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return query
+
+    def _ordered_queryset(self, cursor):
+        values, reverse = decode_cursor(cursor) if cursor else (None, False)
+
+        order_by = [
+            ('-' if descending != reverse else '') + name
+            for name, descending in self.ordering
+        ]
+        queryset = self.queryset.order_by(*order_by)
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse))
+        return queryset, values, reverse
+
+    def _page_queryset(self, cursor):
+        queryset, values, reverse = self._ordered_queryset(cursor)
+        return queryset[:self.rows + 1], values, reverse
+
+    def page_queryset(self, cursor=None):
+        """
+            The page's rows as an unevaluated queryset, e.g. for a subquery.
+        """
+        return self._ordered_queryset(cursor)[0][:self.rows]
+
+    def _page_result(self, items, values, reverse):
+        has_more = len(items) > self.rows
+        items = items[:self.rows]
+        if reverse:
+            items.reverse()
+
+        next_cursor = prev_cursor = None
+        if items:
+            if reverse:
+                next_cursor = encode_cursor(self._row_key(items[-1]))
+                if has_more:
+                    prev_cursor = encode_cursor(self._row_key(items[0]), reverse=True)
+            else:
+                if has_more:
+                    next_cursor = encode_cursor(self._row_key(items[-1]))
+                if values is not None:
+                    prev_cursor = encode_cursor(self._row_key(items[0]), reverse=True)
+
+        return items, {'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+    def page(self, cursor=None):
+        queryset, values, reverse = self._page_queryset(cursor)
+        return self._page_result(list(queryset), values, reverse)
+
+    async def apage(self, cursor=None):
+        queryset, values, reverse = self._page_queryset(cursor)
+        return self._page_result([item async for item in queryset], values, reverse)
+
+
+def merged_keyset_page(querysets, ordering, rows, cursor=None):
+    """
+        One keyset page over several querysets of dicts sharing `ordering`, as
+        if they were a single stream. Each queryset contributes at most one
+        page of rows; the key must be unique across all of them. Returns
+        (items, pagination_fields) like KeysetPaginator.page().
+    """
+    paginators = [KeysetPaginator(queryset, ordering, rows) for queryset in querysets]
+    items = []
+    for paginator in paginators:
+        queryset, values, reverse = paginator._page_queryset(cursor)
+        items.extend(queryset)
+
+    # Stable sorts from the last key to the first give the combined ordering.
+    for name, descending in reversed(paginators[0].ordering):
+        items.sort(key=itemgetter(name), reverse=descending != reverse)
+    return paginators[0]._page_result(items[:rows + 1], values, reverse)
+
+
+def paginate(request, queryset, ordering, rows=None):
+    """
+        Paginate `queryset` according to the request and return
+        (items, pagination_fields) where pagination_fields is merged into the
+        response body. Page mode keeps the existing current_page/last_page/total
+        keys; cursor mode returns next_cursor/prev_cursor instead.
+    """
+    if rows is None:
+        rows = int(request.query_params.get('rows', 25))
+
+    if is_cursor_request(request):
+        paginator = KeysetPaginator(queryset, ordering, rows)
+        return paginator.page(request.query_params.get('cursor') or None)
+
+    page = int(request.query_params.get('page', 1))
+    paginator = Paginator(queryset, rows)
+    return paginator.page(page), {
+        "current_page": page,
+        "last_page": paginator.num_pages,
+        "total": paginator.count,
+    }
+
+
+def page_queryset(request, queryset, ordering, rows=None):
+    """
+        The rows of `queryset` that paginate() would return for the request,
+        as an unevaluated queryset, so they can feed a subquery (e.g. the
+        children of a page) without a query of their own. Out-of-range pages
+        are empty instead of raising.
+    """
+    if rows is None:
+        rows = int(request.query_params.get('rows', 25))
+
+    if is_cursor_request(request):
+        return KeysetPaginator(queryset, ordering, rows).page_queryset(request.query_params.get('cursor') or None)
+
+    bottom = (max(int(request.query_params.get('page', 1)), 1) - 1) * rows
+    return queryset[bottom:bottom + rows]
+
+
+async def apaginate(request, queryset, ordering, rows=None):
+    """
+        Async paginate() built on the async ORM. Page mode returns the page's
+        rows as a list instead of a Page.
+    """
+    if rows is None:
+        rows = int(request.query_params.get('rows', 25))
+
+    if is_cursor_request(request):
+        paginator = KeysetPaginator(queryset, ordering, rows)
+        return await paginator.apage(request.query_params.get('cursor') or None)
+
+    page = int(request.query_params.get('page', 1))
+    paginator = Paginator(queryset, rows)
+    # `count` is a cached_property; seed it so page validation needs no sync query.
+    paginator.count = await queryset.acount()
+    number = paginator.validate_number(page)
+    bottom = (number - 1) * rows
+    items = [item async for item in queryset[bottom:bottom + rows]]
+    return items, {
+        "current_page": page,
+        "last_page": paginator.num_pages,
+        "total": paginator.count,
+    }
@@ -21,3 +21,12 @@ class IsManagerOrNoDeleteForAgents(BasePermission):
         return True
 
 
+class IsManager(BasePermission):
+    """
+        Managers only, e.g. for integration settings.
+    """
+    def has_permission(self, request, view):
+        return bool(
+            request.user and request.user.is_authenticated
+            and getattr(request.user, 'is_manager', lambda: False)()
+        )
@@ -1,8 +1,11 @@
 from rest_framework import serializers
-from apps.crm.models import Lead, Contact, Note, Reminder, Correspondence
+from apps.crm.models import AuditTrail, Lead, Contact, Note, Reminder, Correspondence, WebhookEndpoint
 from apps.accounts.serializers import UserSerializer
 from drf_spectacular.utils import extend_schema_field
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from apps.crm.compiled import CompiledSerializer
 
 class ContactSerializer(serializers.ModelSerializer):
     linked_lead_name = serializers.CharField(source='linked_lead.name', read_only=True)
@@ -17,6 +20,10 @@ class ContactSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('linked_lead')
+
 
 class NoteSerializer(serializers.ModelSerializer):
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
@@ -32,6 +39,10 @@ class NoteSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_by', 'created_by_username', 'created_at', 'updated_at']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('created_by', 'lead')
+
 
 class ReminderSerializer(serializers.ModelSerializer):
     lead_name = serializers.CharField(source='lead.name', read_only=True)
@@ -46,6 +57,10 @@ class ReminderSerializer(serializers.ModelSerializer):
             'reminder_type', 'created_by', 'created_by_username', 'created_at', 'updated_at'
         ]
         read_only_fields = ['status', 'created_by', 'created_by_username', 'created_at', 'updated_at']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('created_by', 'lead')
     
     def validate_scheduled_time(self, value):
         if value <= timezone.now():
@@ -66,6 +81,10 @@ class CorrespondenceSerializer(serializers.ModelSerializer):
             'duration', 'created_by', 'created_by_username', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_by', 'created_by_username', 'created_at', 'updated_at']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('created_by', 'contact')
     
     def validate_duration(self, value):
         if value is not None and value <= 0:
@@ -73,6 +92,21 @@ class CorrespondenceSerializer(serializers.ModelSerializer):
         return value
 
 
+def _related_count(model, fk_name):
+    """
+        Correlated COUNT subquery for rows of `model` pointing at the outer lead.
+        Unlike Count() over joins, several of these never multiply rows.
+    """
+    counts = (
+        model.objects.filter(**{fk_name: OuterRef('pk')})
+        .order_by()
+        .values(fk_name)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
 class LeadSerializer(serializers.ModelSerializer):
     owner_username = serializers.CharField(source='owner.username', read_only=True)
     contacts = ContactSerializer(many=True, read_only=True)
@@ -96,17 +130,43 @@ class LeadSerializer(serializers.ModelSerializer):
             'reminders', 'contacts_count', 'notes_count', 'reminders_count'
         ]
         read_only_fields = ['owner', 'owner_username', 'created_at', 'updated_at']
-    
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+            Load everything the serializer touches in a fixed number of queries,
+            independent of how many leads are on the page.
+        """
+        return LeadSerializer.annotate_counts(queryset.select_related('owner').prefetch_related(
+            'contacts',
+            Prefetch('notes', queryset=Note.objects.select_related('created_by')),
+            Prefetch('reminders', queryset=Reminder.objects.select_related('created_by')),
+        ))
+
+    @staticmethod
+    def annotate_counts(queryset):
+        return queryset.annotate(
+            contacts_total=_related_count(Contact, 'linked_lead'),
+            notes_total=_related_count(Note, 'lead'),
+            reminders_total=_related_count(Reminder, 'lead'),
+        )
+
     @extend_schema_field(serializers.IntegerField)
     def get_contacts_count(self, obj):
+        if hasattr(obj, 'contacts_total'):
+            return obj.contacts_total
         return obj.contacts.count()
     
     @extend_schema_field(serializers.IntegerField)
     def get_notes_count(self, obj):
+        if hasattr(obj, 'notes_total'):
+            return obj.notes_total
         return obj.notes.count()
     
     @extend_schema_field(serializers.IntegerField)
     def get_reminders_count(self, obj):
+        if hasattr(obj, 'reminders_total'):
+            return obj.reminders_total
         return obj.reminders.count()
     
     @extend_schema_field(serializers.FloatField)
@@ -118,6 +178,126 @@ class LeadSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Lead value must be positive.")
         return value
 
+
+compiled_contact_serializer = CompiledSerializer(ContactSerializer)
+compiled_note_serializer = CompiledSerializer(NoteSerializer)
+compiled_reminder_serializer = CompiledSerializer(ReminderSerializer)
+compiled_correspondence_serializer = CompiledSerializer(CorrespondenceSerializer)
+
+
+class TimelineAuditSerializer(serializers.ModelSerializer):
+    """
+        Audit entry as shown on a lead's timeline: the field-level changes only.
+    """
+    user_username = serializers.CharField(source='user.username', read_only=True, default=None)
+    created_at = serializers.DateTimeField(format="%b %d, %Y %I:%M %p", read_only=True)
+
+    class Meta:
+        model = AuditTrail
+        fields = ['id', 'action', 'model', 'object_id', 'changes', 'user', 'user_username', 'created_at']
+
+
+compiled_timeline_audit_serializer = CompiledSerializer(
+    TimelineAuditSerializer,
+    # The user is nullable (SET_NULL), so its username comes through a left join.
+    overrides={'user_username': ('user__username', None)},
+)
+compiled_lead_serializer = CompiledSerializer(
+    LeadSerializer,
+    prepare=LeadSerializer.annotate_counts,
+    overrides={
+        'value': ('value', float),
+        'contacts_count': ('contacts_total', None),
+        'notes_count': ('notes_total', None),
+        'reminders_count': ('reminders_total', None),
+    },
+    nested={
+        'contacts': compiled_contact_serializer,
+        'notes': compiled_note_serializer,
+        'reminders': compiled_reminder_serializer,
+    },
+)
+
+
+class LeadBulkSerializer(serializers.ModelSerializer):
+    """
+        Write-side lead row for the bulk endpoint. `id` is required for updates.
+    """
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Lead
+        fields = ['id', 'name', 'status', 'description', 'value', 'source']
+
+    def validate_value(self, value):
+        if value is not None and value <= 0:
+            raise serializers.ValidationError("Lead value must be positive.")
+        return value
+
+
+class ContactBulkSerializer(serializers.ModelSerializer):
+    """
+        Write-side contact row for the bulk endpoint. `linked_lead` is taken as a
+        plain id and checked for all rows at once by the view.
+    """
+    id = serializers.IntegerField(required=False)
+    linked_lead = serializers.IntegerField()
+
+    class Meta:
+        model = Contact
+        fields = ['id', 'name', 'email', 'phone', 'linked_lead', 'title', 'company', 'is_primary']
+
+
+class RecentLeadSerializer(serializers.ModelSerializer):
+    """
+        Flat lead row for the dashboard's recent activity list.
+    """
+    owner_username = serializers.CharField(source='owner.username', read_only=True)
+    value = serializers.FloatField(read_only=True)
+    created_at = serializers.DateTimeField(format="%b %d, %Y %I:%M %p", read_only=True)
+
+    class Meta:
+        model = Lead
+        fields = ['id', 'name', 'status', 'owner', 'owner_username', 'value', 'source', 'created_at']
+
+
+class RecentContactSerializer(serializers.ModelSerializer):
+    linked_lead_name = serializers.CharField(source='linked_lead.name', read_only=True)
+    created_at = serializers.DateTimeField(format="%b %d, %Y %I:%M %p", read_only=True)
+
+    class Meta:
+        model = Contact
+        fields = ['id', 'name', 'email', 'company', 'linked_lead', 'linked_lead_name', 'created_at']
+
+
+class RecentNoteSerializer(serializers.ModelSerializer):
+    created_by_username = serializers.CharField(source='created_by.username', read_only=True)
+    lead_name = serializers.CharField(source='lead.name', read_only=True)
+    created_at = serializers.DateTimeField(format="%b %d, %Y %I:%M %p", read_only=True)
+
+    class Meta:
+        model = Note
+        fields = ['id', 'content', 'note_type', 'lead', 'lead_name', 'created_by_username', 'created_at']
+
+
+class RecentReminderSerializer(serializers.ModelSerializer):
+    lead_name = serializers.CharField(source='lead.name', read_only=True)
+    created_at = serializers.DateTimeField(format="%b %d, %Y %I:%M %p", read_only=True)
+
+    class Meta:
+        model = Reminder
+        fields = ['id', 'message', 'scheduled_time', 'status', 'reminder_type', 'lead', 'lead_name', 'created_at']
+
+
+class RecentCorrespondenceSerializer(serializers.ModelSerializer):
+    contact_name = serializers.CharField(source='contact.name', read_only=True)
+    created_at = serializers.DateTimeField(format="%b %d, %Y %I:%M %p", read_only=True)
+
+    class Meta:
+        model = Correspondence
+        fields = ['id', 'type', 'outcome', 'contact', 'contact_name', 'created_at']
+
+
 class LeadSummarySerializer(serializers.Serializer):
     """
         Serializer for AI summary response.
@@ -126,6 +306,7 @@ class LeadSummarySerializer(serializers.Serializer):
     summary = serializers.CharField()
     ai_available = serializers.BooleanField()
     notes_count = serializers.IntegerField(required=False)
+    cached = serializers.BooleanField(required=False)
 
 
 class AuditEntrySerializer(serializers.Serializer):
@@ -136,7 +317,24 @@ class AuditEntrySerializer(serializers.Serializer):
     object_id = serializers.CharField()
     old_value = serializers.JSONField(required=False, allow_null=True)
     new_value = serializers.JSONField(required=False, allow_null=True)
+    changes = serializers.JSONField(required=False, allow_null=True)
     ip_address = serializers.CharField(allow_null=True, required=False)
     user_agent = serializers.CharField(allow_null=True, required=False)
 
 
+class WebhookEndpointSerializer(serializers.ModelSerializer):
+    """
+        Webhook registration. The secret can be set but is never returned.
+    """
+    MODELS = [model._meta.label for model in (Lead, Contact, Note, Reminder, Correspondence)]
+
+    secret = serializers.CharField(write_only=True, required=False, allow_blank=True, max_length=200)
+    model_labels = serializers.ListField(child=serializers.ChoiceField(choices=MODELS), required=False)
+
+    class Meta:
+        model = WebhookEndpoint
+        fields = [
+            'id', 'url', 'secret', 'model_labels', 'is_active', 'last_event_id', 'failures',
+            'next_attempt_at', 'last_error', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['last_event_id', 'failures', 'next_attempt_at', 'last_error', 'created_at', 'updated_at']
@@ -1,9 +1,14 @@
-from .ai_summary import summarize_notes, AISummaryService
-from .audit import create_audit_entry, get_client_ip
+from .ai_summary import summarize_notes, cached_summarize_notes, AISummaryService
+from .audit import audit_snapshot, build_audit_entry, create_audit_entry, flush_audit_buffer, get_client_ip, save_audit_entries
 
 __all__ = [
     'summarize_notes',
+    'cached_summarize_notes',
     'AISummaryService',
+    'audit_snapshot',
+    'build_audit_entry',
     'create_audit_entry',
+    'save_audit_entries',
+    'flush_audit_buffer',
     'get_client_ip',
 ]
@@ -0,0 +1,36 @@
+"""
+Offline stand-in for the Gemini model, used by `manage.py benchmark` and
+`manage.py summarize_leads --stub` in place of `ai_summary_service.model`.
+"""
+
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+
+class StubModel:
+    """
+        Stands in for the Gemini model: returns a canned summary after an
+        optional fixed delay so the summary endpoint can be measured offline.
+        With `failure_rate` that fraction of calls raises instead.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def _response(self, prompt):
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError("Stub model failure")
+        return SimpleNamespace(text=f"Stub summary of {len(prompt)} prompt characters.")
+
+    def generate_content(self, prompt, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._response(prompt)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._response(prompt)
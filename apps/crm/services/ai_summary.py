@@ -1,23 +1,69 @@
 """
 AI-powered notes summary service using Google Gemini API.
+
+Leads whose notes fit in AI_SUMMARY_WINDOW_TOKENS are summarized with one
+prompt. Longer histories are summarized map-reduce style: the notes, oldest
+first, are packed into windows of at most that many (estimated) tokens, the
+windows are summarized in parallel and the window summaries are combined
+into the final summary. Window summaries are cached by content, and windows
+are filled from the oldest note, so a new note only changes the newest
+window and only that window is summarized again.
 """
 
 import os
+import copy
+import asyncio
+import hashlib
 import logging
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import cache
 import google.generativeai as genai
 
 logger = logging.getLogger(__name__)
 
 GEMINI_AVAILABLE = True
 
+# Rough size of a token in English text; good enough for budgeting prompts.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def note_windows(notes: List[str], budget: int) -> List[List[str]]:
+    """
+    Pack `notes` (oldest first) into consecutive windows of at most `budget`
+    estimated tokens. A window's boundaries only depend on the notes before
+    it, so appending notes leaves every full window unchanged. Notes longer
+    than the budget on their own are truncated.
+    """
+    max_chars = budget * CHARS_PER_TOKEN
+    windows, window, size = [], [], 0
+    for note in notes:
+        note = note[:max_chars]
+        tokens = estimate_tokens(note)
+        if window and size + tokens > budget:
+            windows.append(window)
+            window, size = [], 0
+        window.append(note)
+        size += tokens
+    if window:
+        windows.append(window)
+    return windows
+
+
 class AISummaryService:
     """Service for generating AI-powered summaries of lead notes."""
     
     def __init__(self):
         self.api_key = os.getenv('GEMINI_API_KEY')
         self.model = None
+        # Wraps every async model call when set (see limited()).
+        self.limiter = None
         
         if GEMINI_AVAILABLE and self.api_key:
             try:
@@ -49,13 +95,155 @@ class AISummaryService:
         
         # Prepare context for the AI
         context = self._prepare_context(notes, lead_name)
+        if estimate_tokens(context) > self._window_tokens():
+            return self._map_reduce(notes, lead_name)
             
         # Generate prompt for summary
         prompt = self._create_summary_prompt(context)
             
         # Get AI response
-        response = self.model.generate_content(prompt)
-            
+        response = self.model.generate_content(prompt, request_options=self._request_options())
+        return self._summary_from_response(response, notes, lead_name)
+
+    async def asummarize_notes(self, notes: List[str], lead_name: str = "Lead") -> str:
+        """
+        Async summarize_notes(): awaits the model without holding a thread.
+        """
+        if not notes:
+            return "No notes available for this lead."
+
+        if not self.model:
+            return self._generate_fallback_summary(notes, lead_name)
+
+        context = self._prepare_context(notes, lead_name)
+        if estimate_tokens(context) > self._window_tokens():
+            return await self._amap_reduce(notes, lead_name)
+
+        response = await self._agenerate(self._create_summary_prompt(context))
+        return self._summary_from_response(response, notes, lead_name)
+
+    def limited(self, limiter) -> "AISummaryService":
+        """
+        Copy of the service whose async model calls all go through
+        `limiter.call()`, e.g. the batch job's rate limit and circuit breaker.
+        """
+        service = copy.copy(self)
+        service.limiter = limiter
+        return service
+
+    async def _agenerate(self, prompt: str):
+        if self.limiter:
+            return await self.limiter.call(lambda: self._acall_model(prompt))
+        return await self._acall_model(prompt)
+
+    async def _acall_model(self, prompt: str):
+        if hasattr(self.model, 'generate_content_async'):
+            return await self.model.generate_content_async(prompt, request_options=self._request_options())
+        return await sync_to_async(self.model.generate_content, thread_sensitive=False)(
+            prompt, request_options=self._request_options()
+        )
+
+    def _window_tokens(self) -> int:
+        return getattr(settings, "AI_SUMMARY_WINDOW_TOKENS", 8000)
+
+    def _final_context(self, parts: List[str], lead_name: str) -> Optional[str]:
+        """
+        Context of the final prompt for the summaries `parts`, or None while
+        another round of windows can still merge some of them. When no round
+        can, each summary is cut to an equal share of the budget instead.
+        """
+        budget = self._window_tokens()
+        context = self._prepare_reduce_context(parts, lead_name)
+        if estimate_tokens(context) <= budget:
+            return context
+        if len(note_windows(parts, budget)) < len(parts):
+            return None
+        max_chars = (budget - 1) * CHARS_PER_TOKEN
+        overhead = len(self._prepare_reduce_context([""] * len(parts), lead_name))
+        share = max(max_chars - overhead, 0) // len(parts)
+        return self._prepare_reduce_context([part[:share] for part in parts], lead_name)[:max_chars]
+
+    def _window_summary(self, response, notes: List[str], lead_name: str) -> Tuple[str, bool]:
+        """(summary, from_model); only summaries from the model are cached."""
+        if response and response.text:
+            return response.text.strip(), True
+        logger.warning("Empty response from Gemini AI for a window of %s notes", len(notes))
+        return self._generate_fallback_summary(list(reversed(notes)), lead_name), False
+
+    def _map_reduce(self, notes: List[str], lead_name: str) -> str:
+        """
+        Summarize newest-first `notes` too long for one prompt: window
+        summaries (cached, computed in parallel) are reduced level by level
+        until they fit one prompt.
+        """
+        timeout = getattr(settings, "AI_SUMMARY_CACHE_TIMEOUT", 86400)
+
+        def summarize_window(item):
+            key, window = item
+            response = self.model.generate_content(
+                self._create_window_prompt(window, lead_name), request_options=self._request_options()
+            )
+            summary, from_model = self._window_summary(response, window, lead_name)
+            if from_model:
+                cache.set(key, summary, timeout)
+            return key, summary
+
+        parts = list(reversed(notes))
+        context = None
+        while context is None:
+            windows = note_windows(parts, self._window_tokens())
+            keys = [window_cache_key(window, lead_name) for window in windows]
+            stored = cache.get_many(keys)
+            missing = [(key, window) for key, window in zip(keys, windows) if key not in stored]
+            if missing:
+                workers = min(len(missing), getattr(settings, "AI_SUMMARY_MAP_CONCURRENCY", 4))
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    stored.update(pool.map(summarize_window, missing))
+            parts = [stored[key] for key in keys]
+            context = self._final_context(parts, lead_name)
+
+        response = self.model.generate_content(
+            self._create_summary_prompt(context), request_options=self._request_options()
+        )
+        return self._summary_from_response(response, notes, lead_name)
+
+    async def _amap_reduce(self, notes: List[str], lead_name: str) -> str:
+        """
+        Async _map_reduce(): the window summaries are awaited concurrently,
+        and each is cached as soon as it is ready, so a summary abandoned
+        part way keeps the windows that finished.
+        """
+        semaphore = asyncio.Semaphore(getattr(settings, "AI_SUMMARY_MAP_CONCURRENCY", 4))
+        timeout = getattr(settings, "AI_SUMMARY_CACHE_TIMEOUT", 86400)
+
+        async def summarize_window(key, window):
+            async with semaphore:
+                response = await self._agenerate(self._create_window_prompt(window, lead_name))
+            summary, from_model = self._window_summary(response, window, lead_name)
+            if from_model:
+                await cache.aset(key, summary, timeout)
+            return key, summary
+
+        parts = list(reversed(notes))
+        context = None
+        while context is None:
+            windows = note_windows(parts, self._window_tokens())
+            keys = [window_cache_key(window, lead_name) for window in windows]
+            stored = await cache.aget_many(keys)
+            missing = [(key, window) for key, window in zip(keys, windows) if key not in stored]
+            if missing:
+                stored.update(await asyncio.gather(*[summarize_window(key, window) for key, window in missing]))
+            parts = [stored[key] for key in keys]
+            context = self._final_context(parts, lead_name)
+
+        response = await self._agenerate(self._create_summary_prompt(context))
+        return self._summary_from_response(response, notes, lead_name)
+
+    def _request_options(self) -> dict:
+        # Without a timeout a stalled API call blocks its worker indefinitely.
+        return {"timeout": getattr(settings, "AI_SUMMARY_TIMEOUT", 30)}
+
+    def _summary_from_response(self, response, notes: List[str], lead_name: str) -> str:
         if response and response.text:
             return response.text.strip()
         else:
@@ -75,6 +263,24 @@ class AISummaryService:
         
         return "\n".join(context_parts)
     
+    def _prepare_reduce_context(self, summaries: List[str], lead_name: str) -> str:
+        """Context of window summaries, oldest period first."""
+        context_parts = [f"Summaries of consecutive periods of notes for {lead_name}, oldest first:"]
+        for i, summary in enumerate(summaries, 1):
+            context_parts.append(f"\nPeriod {i}:\n{summary}")
+        return "\n".join(context_parts)
+
+    def _create_window_prompt(self, notes: List[str], lead_name: str) -> str:
+        """Prompt condensing one window of notes (oldest first) for the reduce step."""
+        context = "\n\n".join(notes)
+        return f"""
+You are a sales assistant. The following are consecutive notes about {lead_name}, oldest first. They are one part of a longer history that will be summarized as a whole later.
+
+{context}
+
+Condense them into a short factual summary that keeps names, dates, amounts, commitments, objections, decisions and open action items, in chronological order. Leave out greetings and repetition.
+"""
+
     def _create_summary_prompt(self, context: str) -> str:
         """Create the prompt for the AI model."""
         return f"""
@@ -129,3 +335,67 @@ def summarize_notes(notes: List[str], lead_name: str = "Lead") -> str:
         AI-generated summary or fallback message
     """
     return ai_summary_service.summarize_notes(notes, lead_name)
+
+
+def summary_cache_key(lead_id) -> str:
+    return f"crm:lead-summary:{lead_id}"
+
+
+def window_cache_key(notes: List[str], lead_name: str) -> str:
+    """Key of a window summary: the window's content, so it never needs invalidating."""
+    return f"crm:lead-summary-window:{notes_digest(notes, lead_name)}"
+
+
+def notes_digest(notes: List[str], lead_name: str) -> str:
+    """Hash of everything that goes into the prompt, in order."""
+    digest = hashlib.sha256(lead_name.encode())
+    for note in notes:
+        digest.update(b"\x00")
+        digest.update(note.encode())
+    return digest.hexdigest()
+
+
+def cached_summarize_notes(lead_id, notes: List[str], lead_name: str = "Lead") -> Tuple[str, bool]:
+    """
+    Summarize notes, reusing the stored summary while the note set is unchanged.
+
+    One entry is kept per lead, holding the digest of the notes it was built
+    from; note writes delete it (see apps.crm.signals) and a digest mismatch
+    regenerates it. Entries expire after AI_SUMMARY_CACHE_TIMEOUT seconds.
+
+    Returns:
+        (summary, served_from_cache)
+    """
+    key = summary_cache_key(lead_id)
+    digest = notes_digest(notes, lead_name)
+    stored = cache.get(key)
+    if stored and stored["digest"] == digest:
+        return stored["summary"], True
+
+    summary = summarize_notes(notes, lead_name)
+    if not ai_summary_service.is_available():
+        # Don't pin the basic fallback once the model comes back.
+        return summary, False
+    cache.set(key, {"digest": digest, "summary": summary}, getattr(settings, "AI_SUMMARY_CACHE_TIMEOUT", 86400))
+    return summary, False
+
+
+async def acached_summarize_notes(lead_id, notes: List[str], lead_name: str = "Lead") -> Tuple[str, bool]:
+    """
+    Async cached_summarize_notes(), using the async cache API and AI client.
+    """
+    key = summary_cache_key(lead_id)
+    digest = notes_digest(notes, lead_name)
+    stored = await cache.aget(key)
+    if stored and stored["digest"] == digest:
+        return stored["summary"], True
+
+    summary = await ai_summary_service.asummarize_notes(notes, lead_name)
+    if not ai_summary_service.is_available():
+        return summary, False
+    await cache.aset(key, {"digest": digest, "summary": summary}, getattr(settings, "AI_SUMMARY_CACHE_TIMEOUT", 86400))
+    return summary, False
+
+
+def invalidate_lead_summary(lead_id) -> None:
+    cache.delete(summary_cache_key(lead_id))
@@ -1,57 +1,207 @@
 """
 Audit service for creating audit trail entries.
+
+Entries are written according to settings.AUDIT_DURABILITY:
+- 'sync': INSERT inside the request, as part of the write's transaction.
+- 'buffered': queued in-process once the write's transaction commits and
+  flushed with bulk_create by a background thread every AUDIT_FLUSH_INTERVAL
+  seconds or AUDIT_BATCH_SIZE entries. created_at is stamped when the entry
+  is built, so it is the time of the change whenever the row lands. The queue
+  is drained on interpreter exit and Celery worker shutdown; entries still
+  queued when a process is killed outright (SIGKILL, OOM killer) are lost,
+  i.e. up to AUDIT_FLUSH_INTERVAL seconds of audit rows.
 """
 
+import atexit
+import logging
+import os
+import queue
+import threading
+from functools import lru_cache
+
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.db import connection, transaction
 from apps.crm.models import AuditTrail
-from decimal import Decimal
-from datetime import datetime
+from apps.crm.services.dashboard import invalidate_dashboard, invalidate_dashboard_on_commit
+
+logger = logging.getLogger(__name__)
+
+
+class AuditBuffer:
+    """
+        Per-process queue of unsaved AuditTrail rows, written in batches.
+    """
+
+    def __init__(self, batch_size=200, flush_interval=1.0, max_size=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def put(self, entry):
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            # Apply backpressure instead of dropping audit rows.
+            self._write([entry])
+
+    def flush(self):
+        """
+            Synchronously write everything currently queued.
+        """
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(), so restart the worker in each child process.
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        in_worker = threading.current_thread() is self._thread
+        for attempt in (1, 2):
+            try:
+                AuditTrail.objects.bulk_create(batch, batch_size=self.batch_size)
+                # bulk_create sends no post_save, so refresh dashboards explicitly.
+                invalidate_dashboard()
+                return
+            except Exception:
+                if not in_worker or attempt == 2:
+                    logger.exception("Failed to write %d audit entries", len(batch))
+                    return
+                # The writer's long-lived connection may have gone stale; reconnect once.
+                connection.close()
+
+
+audit_buffer = AuditBuffer(
+    batch_size=getattr(settings, 'AUDIT_BATCH_SIZE', 200),
+    flush_interval=getattr(settings, 'AUDIT_FLUSH_INTERVAL', 1.0),
+    max_size=getattr(settings, 'AUDIT_QUEUE_MAX_SIZE', 10000),
+)
+
+
+def flush_audit_buffer(**kwargs):
+    audit_buffer.flush()
+
 
+atexit.register(flush_audit_buffer)
+worker_process_shutdown.connect(flush_audit_buffer, weak=False)
 
-def make_serializable(value):
+
+@lru_cache(maxsize=None)
+def audit_fields(model):
     """
-    Recursively convert Decimals and datetimes to JSON-serializable types.
+        Concrete fields tracked in audit diffs: everything except the primary
+        key and the automatic timestamps.
     """
-    if isinstance(value, dict):
-        return {k: make_serializable(v) for k, v in value.items()}
-    elif isinstance(value, list):
-        return [make_serializable(v) for v in value]
-    elif isinstance(value, Decimal):
-        return float(value)
-    elif isinstance(value, datetime):
-        return value.isoformat()
-    return value
+    return tuple(
+        field for field in model._meta.concrete_fields
+        if not field.primary_key and not getattr(field, 'auto_now', False)
+        and not getattr(field, 'auto_now_add', False)
+    )
+
 
+def audit_snapshot(instance):
+    """
+        {attname: value} for the audited fields of `instance`, normalized with
+        each field's to_python so e.g. '10' and Decimal('10.00') compare equal.
+    """
+    return {
+        field.attname: field.to_python(field.value_from_object(instance))
+        for field in audit_fields(type(instance))
+    }
 
-def create_audit_entry(user, action, instance, old_value=None, ip_address=None, user_agent=None):
-    if hasattr(instance, 'get_serializer'):
-        new_value = instance.get_serializer(instance).data
+
+def diff_snapshots(before, after):
+    return {
+        name: [before.get(name), value]
+        for name, value in after.items()
+        if before.get(name) != value
+    }
+
+
+def build_audit_entry(user, action, instance, before=None, ip_address=None, user_agent=None):
+    """
+    Build an unsaved AuditTrail row for `action` on `instance`, recording only
+    the changed fields as {field: [old, new]}. `before` is the audit_snapshot
+    taken ahead of an update. Returns None for an update that changed nothing.
+    """
+    snapshot = audit_snapshot(instance)
+    if action == 'update':
+        changes = diff_snapshots(before or {}, snapshot)
+        if not changes:
+            return None
+    elif action == 'delete':
+        changes = {name: [value, None] for name, value in snapshot.items() if value not in (None, '')}
     else:
-        # Fallback serialization
-        new_value = {
-            'id': instance.id,
-            'model': instance._meta.model_name,
-        }
-        # Add common fields if they exist
-        for field in ['name', 'title', 'content', 'message']:
-            if hasattr(instance, field):
-                new_value[field] = getattr(instance, field)
-    
-    # Make old_value and new_value JSON-serializable
-    old_value = make_serializable(old_value)
-    new_value = make_serializable(new_value) if action != 'delete' else None
-
-    AuditTrail.objects.create(
-        user=user,
+        changes = {name: [None, value] for name, value in snapshot.items() if value not in (None, '')}
+
+    return AuditTrail(
+        user_id=getattr(user, 'pk', None),
         action=action,
         model=instance._meta.label,
         object_id=str(instance.pk),
-        old_value=old_value,
-        new_value=new_value,
+        changes=changes,
         ip_address=ip_address,
-        user_agent=user_agent
+        user_agent=user_agent or ''
     )
 
 
+def save_audit_entries(entries):
+    """
+    Persist audit rows according to AUDIT_DURABILITY, in a single batch.
+    None entries (no-op updates) are skipped.
+    """
+    entries = [entry for entry in entries if entry is not None]
+    if not entries:
+        return
+    if getattr(settings, 'AUDIT_DURABILITY', 'sync') == 'buffered':
+        # Only audit writes that actually commit.
+        def enqueue():
+            for entry in entries:
+                audit_buffer.put(entry)
+        transaction.on_commit(enqueue)
+    else:
+        AuditTrail.objects.bulk_create(entries)
+        invalidate_dashboard_on_commit()
+
+
+def create_audit_entry(user, action, instance, before=None, ip_address=None, user_agent=None):
+    save_audit_entries([
+        build_audit_entry(user, action, instance, before, ip_address, user_agent)
+    ])
+
+
 def get_client_ip(request):
     """Get client IP address from request."""
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -0,0 +1,355 @@
+"""
+Month-based storage for the audit trail.
+
+The hot `crm_audittrail` table only holds recent months; older months are
+moved to gzip-compressed JSONL files (one per month, newest entry first) and
+registered in `AuditArchive`.
+
+- PostgreSQL: `convert_to_partitioned()` turns the table into a native
+  RANGE(created_at) partitioned table. Existing rows stay in a single legacy
+  partition, `ensure_partitions()` creates the upcoming monthly partitions and a
+  DEFAULT partition catches anything outside them (its rows of a month move to
+  that month's partition when it is created). Archiving a month that has its
+  own partition detaches and drops it, which is O(1) whatever its size.
+- SQLite (and PostgreSQL months still in the legacy partition): archiving
+  deletes the month's range through the `created_at` index, so the hot table is
+  rolled over one month at a time.
+
+`iter_archived_entries()` reads the archives back for the audit API.
+Archives never change once written, so `count_archived()` caches how many
+entries of an archive match a set of filters, and paging through archived
+entries only opens the archives holding the requested page.
+"""
+
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from apps.crm.models import AuditTrail, AuditArchive
+from apps.crm.services.dashboard import invalidate_dashboard
+
+LEGACY_PARTITION = 'legacy'
+DEFAULT_PARTITION = 'default'
+
+
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def next_month(month):
+    return datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def month_bounds(month):
+    """
+        Aware [start, end) datetimes covering `month` in the current time zone.
+    """
+    start = timezone.make_aware(datetime.datetime.combine(month, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(next_month(month), datetime.time.min))
+    return start, end
+
+
+def partition_name(suffix):
+    if isinstance(suffix, datetime.date):
+        suffix = f'p{suffix:%Y_%m}'
+    return f'{AuditTrail._meta.db_table}_{suffix}'
+
+
+def archive_path(month, directory=None):
+    directory = directory or settings.AUDIT_ARCHIVE_DIR
+    return os.path.join(directory, f'audit-{month:%Y-%m}.jsonl.gz')
+
+
+def _table_exists(cursor, name):
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [name])
+    return cursor.fetchone()[0]
+
+
+def is_partitioned(using='default'):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE relname = %s', [AuditTrail._meta.db_table])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def convert_to_partitioned(using='default'):
+    """
+        Swap the PostgreSQL audit table for a partitioned one, keeping the
+        existing rows as a legacy partition covering everything before next month.
+        Returns False when there is nothing to do.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql' or is_partitioned(using):
+        return False
+
+    table = AuditTrail._meta.db_table
+    legacy = partition_name(LEGACY_PARTITION)
+    user_table = AuditTrail._meta.get_field('user').related_model._meta.db_table
+    boundary = month_bounds(next_month(month_start(timezone.localdate())))[0]
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE "{table}" IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+        cursor.execute(
+            f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING IDENTITY, '
+            f'PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)'
+        )
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), (SELECT coalesce(max(id), 0) + 1 FROM \"{legacy}\"), false)",
+            [table],
+        )
+        cursor.execute(f'ALTER TABLE "{legacy}" ALTER COLUMN id DROP IDENTITY IF EXISTS')
+        cursor.execute(
+            f'ALTER TABLE "{table}" ADD FOREIGN KEY (user_id) REFERENCES "{user_table}" (id) '
+            f'ON DELETE SET NULL DEFERRABLE INITIALLY DEFERRED'
+        )
+        # The model's indexes, under their own names, on the partitioned table.
+        # The legacy table's copies are renamed out of the way; ATTACH PARTITION
+        # then adopts them instead of building new ones.
+        with connection.schema_editor(atomic=False) as editor:
+            for index in AuditTrail._meta.indexes:
+                cursor.execute(f'ALTER INDEX IF EXISTS "{index.name}" RENAME TO "{index.name}_legacy"')
+                cursor.execute(str(index.create_sql(AuditTrail, editor)))
+        cursor.execute(
+            f'ALTER TABLE "{table}" ATTACH PARTITION "{legacy}" FOR VALUES FROM (MINVALUE) TO (%s)',
+            [boundary],
+        )
+        cursor.execute(f'CREATE TABLE "{partition_name(DEFAULT_PARTITION)}" PARTITION OF "{table}" DEFAULT')
+    ensure_partitions(using=using)
+    return True
+
+
+def ensure_partitions(months_ahead=None, using='default'):
+    """
+        Create monthly partitions from the current month up to `months_ahead`
+        months ahead. No-op unless the table is partitioned. Returns the names created.
+    """
+    if not is_partitioned(using):
+        return []
+    if months_ahead is None:
+        months_ahead = settings.AUDIT_PARTITION_MONTHS_AHEAD
+
+    created = []
+    month = month_start(timezone.localdate())
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        legacy_end = _legacy_end(cursor)
+        for _ in range(months_ahead + 1):
+            name = partition_name(month)
+            # Months before legacy_end are still covered by the legacy partition.
+            if (legacy_end is None or month_bounds(month)[0] >= legacy_end) and not _table_exists(cursor, name):
+                if _create_partition(cursor, month):
+                    created.append(name)
+            month = next_month(month)
+    return created
+
+
+def _create_partition(cursor, month):
+    """
+        Create the partition of `month`. PostgreSQL refuses to while the DEFAULT
+        partition holds rows of that month (written before the partition
+        existed), so those are moved into it: DEFAULT is detached, the
+        partition created, the rows moved across and DEFAULT reattached, all
+        under the table lock. Returns False if another process created it first.
+    """
+    table = AuditTrail._meta.db_table
+    name = partition_name(month)
+    default = partition_name(DEFAULT_PARTITION)
+    start, end = month_bounds(month)
+
+    cursor.execute(f'LOCK TABLE "{table}" IN ACCESS EXCLUSIVE MODE')
+    if _table_exists(cursor, name):
+        return False
+    stranded = False
+    if _table_exists(cursor, default):
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM "{default}" WHERE created_at >= %s AND created_at < %s)', [start, end],
+        )
+        stranded = cursor.fetchone()[0]
+
+    if stranded:
+        cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{default}"')
+    cursor.execute(f'CREATE TABLE "{name}" PARTITION OF "{table}" FOR VALUES FROM (%s) TO (%s)', [start, end])
+    if stranded:
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{default}" WHERE created_at >= %s AND created_at < %s RETURNING *) '
+            f'INSERT INTO "{name}" SELECT * FROM moved',
+            [start, end],
+        )
+        cursor.execute(f'ALTER TABLE "{table}" ATTACH PARTITION "{default}" DEFAULT')
+    return True
+
+
+def _legacy_end(cursor):
+    """
+        Upper bound of the legacy partition, or None without one.
+    """
+    cursor.execute(
+        'SELECT pg_get_expr(relpartbound, oid) FROM pg_class WHERE relname = %s',
+        [partition_name(LEGACY_PARTITION)],
+    )
+    row = cursor.fetchone()
+    match = row and row[0] and re.search(r"TO \('([^']+)'\)", row[0])
+    return parse_datetime(match.group(1)) if match else None
+
+
+def _archive_rows(month, using):
+    start, end = month_bounds(month)
+    fields = [f.attname for f in AuditTrail._meta.concrete_fields]
+    queryset = (
+        AuditTrail.objects.using(using)
+        .filter(created_at__gte=start, created_at__lt=end)
+        .order_by('-created_at', 'id')
+        .values(*fields, 'user__username')
+    )
+    for row in queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        row['username'] = row.pop('user__username')
+        yield row
+
+
+def _drop_month(month, using):
+    start, end = month_bounds(month)
+    name = partition_name(month)
+    if is_partitioned(using):
+        with connections[using].cursor() as cursor:
+            if _table_exists(cursor, name):
+                cursor.execute(f'ALTER TABLE "{AuditTrail._meta.db_table}" DETACH PARTITION "{name}"')
+                cursor.execute(f'DROP TABLE "{name}"')
+                return
+    # Plain range DELETE rather than QuerySet.delete(), which would load every
+    # row to send post_delete; those handlers only rotate the dashboard
+    # generation, which archive_month does once instead.
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM "{AuditTrail._meta.db_table}" WHERE created_at >= %s AND created_at < %s',
+            [start, end],
+        )
+
+
+def archive_month(month, directory=None, using='default'):
+    """
+        Write every audit entry of `month` to a compressed JSONL file, register it
+        and remove the rows from the hot table. Returns the AuditArchive.
+    """
+    month = month_start(month)
+    if month >= month_start(timezone.localdate()):
+        raise ValueError(f"{month:%Y-%m} is still the current month")
+    if AuditArchive.objects.using(using).filter(month=month).exists():
+        raise ValueError(f"{month:%Y-%m} is already archived")
+
+    path = archive_path(month, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    row_count = 0
+    with transaction.atomic(using=using):
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as handle:
+            for row in _archive_rows(month, using):
+                handle.write(json.dumps(row, cls=DjangoJSONEncoder, separators=(',', ':')))
+                handle.write('\n')
+                row_count += 1
+        os.replace(tmp_path, path)
+        _drop_month(month, using)
+        archive = AuditArchive.objects.using(using).create(month=month, path=path, row_count=row_count)
+    invalidate_dashboard()
+    return archive
+
+
+def archive_before(cutoff, directory=None, using='default'):
+    """
+        Archive every month older than `cutoff` (a date) that still has rows in
+        the hot table, oldest first.
+    """
+    cutoff = month_start(cutoff)
+    oldest = AuditTrail.objects.using(using).order_by('created_at').values_list('created_at', flat=True).first()
+    archives = []
+    if oldest is None:
+        return archives
+    month = month_start(timezone.localtime(oldest))
+    while month < cutoff:
+        if not AuditArchive.objects.using(using).filter(month=month).exists():
+            archives.append(archive_month(month, directory, using))
+        month = next_month(month)
+    return archives
+
+
+def parse_bound(value):
+    """
+        Parse a date or datetime query parameter the way the ORM filters interpret it.
+    """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            return None
+        parsed = datetime.datetime.combine(date, datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def archives_between(date_from=None, date_to=None, using='default'):
+    """
+        Archives that may hold entries in [date_from, date_to], newest first.
+    """
+    archives = AuditArchive.objects.using(using).order_by('-month')
+    if date_from:
+        archives = archives.filter(month__gte=month_start(timezone.localtime(date_from)))
+    if date_to:
+        archives = archives.filter(month__lte=timezone.localtime(date_to).date())
+    return archives
+
+
+def iter_archive(archive, predicate=None, date_from=None, date_to=None):
+    """
+        Yield the entries of one archive (dicts with a datetime `created_at`)
+        newest first, restricted to [date_from, date_to] and to rows accepted
+        by `predicate`.
+    """
+    with gzip.open(archive.path, 'rt', encoding='utf-8') as handle:
+        for line in handle:
+            row = json.loads(line)
+            row['created_at'] = parse_datetime(row['created_at'])
+            if date_to and row['created_at'] > date_to:
+                continue
+            if date_from and row['created_at'] < date_from:
+                break
+            if predicate is None or predicate(row):
+                yield row
+
+
+def iter_archived_entries(predicate=None, date_from=None, date_to=None, using='default'):
+    """
+        iter_archive() over every archive, newest first. Archives entirely
+        outside the date range are not opened.
+    """
+    for archive in archives_between(date_from, date_to, using):
+        yield from iter_archive(archive, predicate, date_from, date_to)
+
+
+def count_archived(archive, filter_key, predicate=None, date_from=None, date_to=None):
+    """
+        Number of entries of `archive` iter_archive() yields for these filters.
+        `filter_key` must identify the filters (predicate and dates); counts are
+        cached without expiry since an archive never changes.
+    """
+    digest = hashlib.sha1(filter_key.encode()).hexdigest()
+    key = f'crm:audit-archive-count:{archive.pk}:{archive.month:%Y-%m}:{digest}'
+    count = cache.get(key)
+    if count is None:
+        count = sum(1 for _ in iter_archive(archive, predicate, date_from, date_to))
+        cache.set(key, count, None)
+    return count
@@ -0,0 +1,58 @@
+"""
+Helpers shared by the bulk create/update endpoints.
+"""
+
+from django.conf import settings
+from rest_framework import serializers
+
+
+def get_bulk_items(request, key):
+    """
+    Accept either a bare JSON array or {"<key>": [...]}.
+    """
+    items = request.data.get(key) if isinstance(request.data, dict) else request.data
+    if not isinstance(items, list):
+        raise serializers.ValidationError({key: 'Expected a list of items.'})
+    max_items = getattr(settings, 'BULK_MAX_ITEMS', 5000)
+    if len(items) > max_items:
+        raise serializers.ValidationError({key: f'At most {max_items} items per request.'})
+    return items
+
+
+def validate_items(serializer_class, items, partial=False):
+    """
+    Validate every item with one serializer instance.
+
+    Returns:
+        (valid, results): `valid` is a list of (index, validated_data) and
+        `results` maps index -> error result for the items that failed.
+    """
+    serializer = serializer_class(partial=partial)
+    valid = []
+    results = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = error_result(index, {'non_field_errors': ['Expected an object.']})
+            continue
+        try:
+            valid.append((index, serializer.run_validation(item)))
+        except serializers.ValidationError as e:
+            results[index] = error_result(index, e.detail)
+    return valid, results
+
+
+def error_result(index, errors):
+    return {'index': index, 'status': 'error', 'errors': errors}
+
+
+def ok_result(index, status, pk):
+    return {'index': index, 'status': status, 'id': pk}
+
+
+def summarize_results(results, count):
+    ordered = [results[i] for i in range(count)]
+    return {
+        'results': ordered,
+        'succeeded': sum(1 for r in ordered if r['status'] != 'error'),
+        'failed': sum(1 for r in ordered if r['status'] == 'error'),
+    }
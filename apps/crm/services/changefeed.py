@@ -0,0 +1,359 @@
+"""
+Change feed: compact events for CRM writes, streamed to clients over SSE.
+
+Every create/update/delete of a lead, contact, note, reminder or
+correspondence publishes one event per row once its transaction commits.
+Single-row saves and deletes are picked up by the handlers in
+apps.crm.signals; bulk writes call publish_changes() themselves. An event
+looks like
+
+    {"model": "note", "action": "create", "id": 42, "lead": 7, "owner": 3, "at": "2026-10-18T09:30:00.000000Z"}
+
+where `lead` is the lead the row belongs to and `owner` that lead's owner,
+which is all the agent/manager scoping needs.
+
+Events go through a pluggable backend (settings.CHANGE_FEED_BACKEND):
+RedisChangeFeed fans them out across processes with Redis pub/sub,
+InMemoryChangeFeed within one process (tests, runserver). Pub/sub keeps no
+history, so a client refetches its lists (cheaply, with If-None-Match) when
+it (re)connects and applies events from then on.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import aclosing, closing
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.crm.models import Contact, Correspondence, Lead, Note, Reminder
+
+logger = logging.getLogger(__name__)
+
+FEED_MODELS = {
+    Lead: 'lead',
+    Contact: 'contact',
+    Note: 'note',
+    Reminder: 'reminder',
+    Correspondence: 'correspondence',
+}
+
+# Lead (or contact) each model hangs off, as (foreign key name, attname).
+_PARENTS = {
+    Contact: ('linked_lead', 'linked_lead_id'),
+    Note: ('lead', 'lead_id'),
+    Reminder: ('lead', 'lead_id'),
+    Correspondence: ('contact', 'contact_id'),
+}
+
+
+class BaseChangeFeed:
+    """
+        Publishes event batches and streams them to subscribers. subscribe()
+        yields events as they arrive and None after `timeout` seconds without
+        one, so the caller can send keep-alives and notice disconnects.
+    """
+
+    def publish(self, events):
+        raise NotImplementedError
+
+    def subscribe(self, timeout):
+        raise NotImplementedError
+
+    async def asubscribe(self, timeout):
+        # Each wait blocks for up to `timeout`; keep it off the request thread.
+        receive = sync_to_async(next, thread_sensitive=False)
+        with closing(self.subscribe(timeout)) as events:
+            while True:
+                yield await receive(events)
+
+
+class InMemoryChangeFeed(BaseChangeFeed):
+    """
+        Process-local feed. Subscribers only see events published after they
+        subscribed; the last `history` events are kept for slow readers.
+    """
+
+    def __init__(self, history=1000):
+        self._events = deque(maxlen=history)
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    def publish(self, events):
+        with self._condition:
+            for event in events:
+                self._sequence += 1
+                self._events.append((self._sequence, event))
+            self._condition.notify_all()
+
+    def subscribe(self, timeout):
+        with self._condition:
+            seen = self._sequence
+        while True:
+            with self._condition:
+                if self._sequence == seen:
+                    self._condition.wait(timeout)
+                pending = [event for sequence, event in self._events if sequence > seen]
+                seen = self._sequence
+            if not pending:
+                yield None
+            yield from pending
+
+
+class RedisChangeFeed(BaseChangeFeed):
+    """
+        Redis pub/sub feed; each published batch is one message on `channel`.
+    """
+
+    def __init__(self, url=None, channel=None):
+        self.url = url or getattr(settings, 'CHANGE_FEED_REDIS_URL', None) or settings.REDIS_URL
+        self.channel = channel or getattr(settings, 'CHANGE_FEED_CHANNEL', 'crm:changes')
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.url)
+        return self._client
+
+    def publish(self, events):
+        self.client.publish(self.channel, json.dumps(events, separators=(',', ':')))
+
+    def subscribe(self, timeout):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        try:
+            while True:
+                message = pubsub.get_message(timeout=timeout)
+                if message is None:
+                    yield None
+                    continue
+                yield from json.loads(message['data'])
+        finally:
+            pubsub.close()
+
+    async def asubscribe(self, timeout):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self.channel)
+        try:
+            while True:
+                message = await pubsub.get_message(timeout=timeout)
+                if message is None:
+                    yield None
+                    continue
+                for event in json.loads(message['data']):
+                    yield event
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+def get_change_feed():
+    global _feed
+    if _feed is None:
+        with _feed_lock:
+            if _feed is None:
+                _feed = import_string(getattr(
+                    settings, 'CHANGE_FEED_BACKEND', 'apps.crm.services.changefeed.RedisChangeFeed'
+                ))()
+    return _feed
+
+
+def reset_change_feed():
+    """
+        Drop the cached backend, e.g. after overriding CHANGE_FEED_BACKEND.
+    """
+    global _feed
+    _feed = None
+
+
+# Owners of leads and leads of contacts being deleted, recorded on pre_delete.
+# A cascade sends pre_delete for every row before deleting any, so the
+# children's post_delete can be scoped without querying rows that are going away.
+_deleting = threading.local()
+
+
+def _deleting_map(name):
+    if not hasattr(_deleting, name):
+        setattr(_deleting, name, {})
+    return getattr(_deleting, name)
+
+
+def remember_deleted(sender, instance, **kwargs):
+    if sender is Lead:
+        _deleting_map('owners')[instance.pk] = instance.owner_id
+    elif sender is Contact:
+        _deleting_map('contacts')[instance.pk] = instance.linked_lead_id
+
+
+def forget_deleted(sender, instance, **kwargs):
+    if sender is Lead:
+        _deleting_map('owners').pop(instance.pk, None)
+    elif sender is Contact:
+        _deleting_map('contacts').pop(instance.pk, None)
+
+
+def _cached_parent(instance, name):
+    field = instance._meta.get_field(name)
+    return field.get_cached_value(instance) if field.is_cached(instance) else None
+
+
+def _scopes(model, instances):
+    """
+        (lead_id, owner_id) per instance, using loaded relations where possible
+        and at most one query per hop for the rest.
+    """
+    if model is Lead:
+        return [(lead.pk, lead.owner_id) for lead in instances]
+
+    name, attname = _PARENTS[model]
+    parents = [_cached_parent(instance, name) for instance in instances]
+
+    if model is Correspondence:
+        contacts = _deleting_map('contacts')
+        missing = {
+            instance.contact_id for instance, contact in zip(instances, parents)
+            if contact is None and instance.contact_id not in contacts
+        }
+        if missing:
+            contacts = {**contacts, **dict(Contact.objects.filter(pk__in=missing).values_list('pk', 'linked_lead_id'))}
+        lead_ids = [
+            contact.linked_lead_id if contact is not None else contacts.get(instance.contact_id)
+            for instance, contact in zip(instances, parents)
+        ]
+        leads = [
+            _cached_parent(contact, 'linked_lead') if contact is not None else None
+            for contact in parents
+        ]
+    else:
+        lead_ids = [getattr(instance, attname) for instance in instances]
+        leads = parents
+
+    owners = _deleting_map('owners')
+    missing = {lead_id for lead_id, lead in zip(lead_ids, leads) if lead is None and lead_id not in owners}
+    if missing:
+        owners = {**owners, **dict(Lead.objects.filter(pk__in=missing).values_list('pk', 'owner_id'))}
+    return [
+        (lead_id, lead.owner_id if lead is not None else owners.get(lead_id))
+        for lead_id, lead in zip(lead_ids, leads)
+    ]
+
+
+def change_events(model, instances, action):
+    at = timezone.now().isoformat().replace('+00:00', 'Z')
+    return [
+        {'model': FEED_MODELS[model], 'action': action, 'id': instance.pk, 'lead': lead_id, 'owner': owner_id, 'at': at}
+        for instance, (lead_id, owner_id) in zip(instances, _scopes(model, instances))
+    ]
+
+
+def _publish(events):
+    try:
+        get_change_feed().publish(events)
+    except Exception as e:
+        # The write has committed; a feed outage only costs clients freshness.
+        logger.warning("Publishing %s change events failed: %s", len(events), e)
+
+
+def publish_changes(model, instances, action, using='default'):
+    """
+        Publish `action` on `instances` of `model` once the current transaction
+        commits (immediately in autocommit mode).
+    """
+    if not getattr(settings, 'CHANGE_FEED_ENABLED', True) or not instances:
+        return
+    events = change_events(model, list(instances), action)
+    transaction.on_commit(lambda: _publish(events), using=using)
+
+
+def publish_saved(sender, instance, created=False, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    publish_changes(sender, [instance], 'create' if created else 'update', using=using)
+
+
+def publish_deleted(sender, instance, using='default', **kwargs):
+    publish_changes(sender, [instance], 'delete', using=using)
+    forget_deleted(sender, instance)
+
+
+def visible_to(user):
+    """
+        Predicate over events: managers see everything, agents their own leads.
+    """
+    if hasattr(user, 'is_agent') and user.is_agent():
+        return lambda event: event['owner'] == user.pk
+    return lambda event: True
+
+
+class _EventStream:
+    """
+        Turns feed events into SSE text for one subscriber: filters them, sends
+        a keep-alive comment after CHANGE_FEED_KEEPALIVE quiet seconds and
+        expires after CHANGE_FEED_MAX_AGE (EventSource clients reconnect).
+    """
+
+    def __init__(self, user, models=None):
+        self.keepalive = getattr(settings, 'CHANGE_FEED_KEEPALIVE', 15)
+        self.deadline = time.monotonic() + getattr(settings, 'CHANGE_FEED_MAX_AGE', 300)
+        self.visible = visible_to(user)
+        self.models = models
+        self.last_write = time.monotonic()
+
+    def opening(self):
+        return f"retry: {int(getattr(settings, 'CHANGE_FEED_RETRY', 3) * 1000)}\n\n"
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+    def render(self, event):
+        now = time.monotonic()
+        if event is not None and self.visible(event) and (not self.models or event['model'] in self.models):
+            self.last_write = now
+            return f"event: change\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+        if now - self.last_write >= self.keepalive:
+            # Also how a closed connection is noticed: the write fails.
+            self.last_write = now
+            return ": keepalive\n\n"
+        return None
+
+
+def stream_changes(user, models=None):
+    """
+        SSE text for the changes `user` may see, optionally only for `models`.
+    """
+    stream = _EventStream(user, models)
+    yield stream.opening()
+    with closing(get_change_feed().subscribe(stream.keepalive)) as events:
+        for event in events:
+            if stream.expired():
+                return
+            text = stream.render(event)
+            if text:
+                yield text
+
+
+async def astream_changes(user, models=None):
+    stream = _EventStream(user, models)
+    yield stream.opening()
+    async with aclosing(get_change_feed().asubscribe(stream.keepalive)) as events:
+        async for event in events:
+            if stream.expired():
+                return
+            text = stream.render(event)
+            if text:
+                yield text
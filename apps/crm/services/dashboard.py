@@ -0,0 +1,171 @@
+"""
+Dashboard aggregation with per-(user, filter) caching.
+
+All counts and chart series are computed by a single UNION ALL of grouped
+COUNT queries, and the "recent" lists use flat serializers with select_related.
+Results are cached under a generation key that is rotated whenever a write to
+one of the underlying models commits (see apps.crm.signals), so a cached
+dashboard is never served after a change. Rotating on commit rather than on
+save keeps a dashboard computed concurrently from pre-commit data out of the
+new generation. A dashboard computed on a read replica may
+predate the latest rotation, so it is only cached for REPLICA_MAX_LAG seconds.
+"""
+
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import CharField, Count, F, Q, Value
+
+from apps.crm.models import Lead, Contact, Note, Reminder, Correspondence, AuditTrail
+from core.db_router import current_replica
+from apps.crm.serializers import (
+    AuditEntrySerializer,
+    RecentContactSerializer,
+    RecentCorrespondenceSerializer,
+    RecentLeadSerializer,
+    RecentNoteSerializer,
+    RecentReminderSerializer,
+)
+
+GENERATION_KEY = 'crm:dashboard:generation'
+
+# (response key, model, user field, chart group field, recent serializer, select_related)
+DASHBOARD_SOURCES = [
+    ('leads', Lead, 'owner_id', 'status', RecentLeadSerializer, ['owner']),
+    ('contacts', Contact, 'linked_lead__owner_id', None, RecentContactSerializer, ['linked_lead']),
+    ('notes', Note, 'created_by_id', None, RecentNoteSerializer, ['lead', 'created_by']),
+    ('reminders', Reminder, 'created_by_id', 'status', RecentReminderSerializer, ['lead']),
+    ('correspondence', Correspondence, 'created_by_id', None, RecentCorrespondenceSerializer, ['contact']),
+    ('audit_entries', AuditTrail, 'user_id', None, AuditEntrySerializer, ['user']),
+]
+
+
+def invalidate_dashboard(**kwargs):
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate_dashboard_on_commit(using='default', **kwargs):
+    """
+        invalidate_dashboard() once the current transaction commits (at once
+        outside one). Signal handler for writes made inside transactions.
+    """
+    transaction.on_commit(invalidate_dashboard, using=using)
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+async def _ageneration():
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = await cache.aget(GENERATION_KEY)
+    return generation
+
+
+def _cache_key(generation, user_id, filters):
+    digest = hashlib.sha1(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+    return f'crm:dashboard:{generation}:{user_id}:{digest}'
+
+
+def dashboard_cache_key(user_id, filters):
+    return _cache_key(_generation(), user_id, filters)
+
+
+async def adashboard_cache_key(user_id, filters):
+    return _cache_key(await _ageneration(), user_id, filters)
+
+
+def _filter_for(user_field, start_date=None, end_date=None, user_id=None):
+    query = Q()
+    if start_date:
+        query &= Q(created_at__gte=start_date)
+    if end_date:
+        query &= Q(created_at__lte=end_date)
+    if user_id:
+        query &= Q(**{user_field: user_id})
+    return query
+
+
+def _dashboard_queries(start_date=None, end_date=None, user_id=None):
+    """
+        (counts UNION ALL query, [(key, recent rows queryset, serializer class)]).
+    """
+    counts_query = None
+    recent = []
+    for key, model, user_field, group_field, serializer_class, related in DASHBOARD_SOURCES:
+        queryset = model.objects.filter(_filter_for(user_field, start_date, end_date, user_id))
+
+        grouped = queryset.order_by().annotate(
+            kind=Value(key, output_field=CharField()),
+            grp=F(group_field) if group_field else Value('', output_field=CharField()),
+        ).values('kind', 'grp').annotate(n=Count('pk')).values_list('kind', 'grp', 'n')
+        counts_query = grouped if counts_query is None else counts_query.union(grouped, all=True)
+
+        recent.append((key, queryset.select_related(*related).order_by('-created_at')[:5], serializer_class))
+    return counts_query, recent
+
+
+def _assemble(count_rows, recent):
+    counts = {f'{key}_total': 0 for key, *_ in DASHBOARD_SOURCES}
+    charts = {'leads_by_status': [], 'reminders_by_status': []}
+    for kind, group, total in count_rows:
+        counts[f'{kind}_total'] += total
+        if f'{kind}_by_status' in charts and total:
+            charts[f'{kind}_by_status'].append({'status': group, 'count': total})
+
+    return {'counts': counts, 'recent': recent, 'charts': charts}
+
+
+def compute_dashboard(start_date=None, end_date=None, user_id=None):
+    counts_query, recent_queries = _dashboard_queries(start_date, end_date, user_id)
+    recent = {
+        key: serializer_class(recent_rows, many=True).data
+        for key, recent_rows, serializer_class in recent_queries
+    }
+    return _assemble(counts_query, recent)
+
+
+async def acompute_dashboard(start_date=None, end_date=None, user_id=None):
+    counts_query, recent_queries = _dashboard_queries(start_date, end_date, user_id)
+    recent = {}
+    for key, recent_rows, serializer_class in recent_queries:
+        # Related rows are select_related, so serializing does not query.
+        recent[key] = serializer_class([row async for row in recent_rows], many=True).data
+    return _assemble([row async for row in counts_query], recent)
+
+
+def _cache_timeout():
+    timeout = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+    if current_replica() is not None:
+        return min(timeout, getattr(settings, 'REPLICA_MAX_LAG', 10))
+    return timeout
+
+
+def get_dashboard(user, start_date=None, end_date=None, user_id=None):
+    filters = {'start_date': start_date, 'end_date': end_date, 'user_id': user_id}
+    key = dashboard_cache_key(user.pk, filters)
+    data = cache.get(key)
+    if data is None:
+        data = compute_dashboard(**filters)
+        cache.set(key, data, _cache_timeout())
+    return data
+
+
+async def aget_dashboard(user, start_date=None, end_date=None, user_id=None):
+    filters = {'start_date': start_date, 'end_date': end_date, 'user_id': user_id}
+    key = await adashboard_cache_key(user.pk, filters)
+    data = await cache.aget(key)
+    if data is None:
+        data = await acompute_dashboard(**filters)
+        await cache.aset(key, data, _cache_timeout())
+    return data
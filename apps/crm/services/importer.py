@@ -0,0 +1,215 @@
+"""
+Streaming CSV import of leads and contacts.
+
+The file is read row by row and processed in fixed-size chunks, each written
+in its own transaction with bulk_create/bulk_update, so memory is bounded by
+the chunk size rather than the file size.
+
+Contacts are de-duplicated on normalized (trimmed, lower-cased) email: each
+chunk looks up all of its emails in one query served by the LOWER(email)
+index, updates the matches and creates the rest. Leads are created, or updated
+when the row carries an `id`.
+"""
+
+import csv
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from apps.crm.models import Lead, Contact
+from apps.crm.serializers import ContactBulkSerializer, LeadBulkSerializer
+from apps.crm.services.audit import audit_snapshot, build_audit_entry, save_audit_entries
+from apps.crm.services.bulk import validate_items
+from apps.crm.services.changefeed import publish_changes
+from apps.crm.services.dashboard import invalidate_dashboard
+from apps.crm.services.outbox import record_outbox
+from apps.crm.services.search import index_instances
+
+IMPORT_KINDS = ('leads', 'contacts')
+
+LEAD_FIELDS = ['name', 'status', 'description', 'value', 'source']
+CONTACT_FIELDS = ['name', 'email', 'phone', 'title', 'company', 'is_primary']
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < getattr(settings, 'IMPORT_MAX_REPORTED_ERRORS', 100):
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def _clean(row):
+    # Blank cells mean "not provided", so model defaults apply.
+    return {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+
+
+def _chunks(reader, chunk_size):
+    # Row numbers are file lines: the header is line 1.
+    numbered = enumerate(reader, start=2)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _is_agent(user):
+    return hasattr(user, 'is_agent') and user.is_agent()
+
+
+def _import_lead_chunk(chunk, user, report):
+    valid, errors = validate_items(LeadBulkSerializer, [_clean(row) for _, row in chunk])
+    for index, result in errors.items():
+        report.add_error(chunk[index][0], result['errors'])
+
+    existing = Lead.objects.in_bulk([data['id'] for _, data in valid if data.get('id')])
+    now = timezone.now()
+    created, updated, entries = [], [], []
+    for index, data in valid:
+        lead_id = data.pop('id', None)
+        if lead_id is None:
+            created.append(Lead(owner_id=user.pk, **data))
+            continue
+        lead = existing.get(lead_id)
+        if lead is None or (_is_agent(user) and lead.owner_id != user.pk):
+            report.add_error(chunk[index][0], {'id': ['Lead not found.']})
+            continue
+        before = audit_snapshot(lead)
+        for field, value in data.items():
+            setattr(lead, field, value)
+        lead.updated_at = now
+        updated.append(lead)
+        entries.append(build_audit_entry(user=user, action='update', instance=lead, before=before))
+
+    with transaction.atomic():
+        Lead.objects.bulk_create(created)
+        Lead.objects.bulk_update(updated, LEAD_FIELDS + ['updated_at'])
+        index_instances(Lead, created + updated)
+        publish_changes(Lead, created, 'create')
+        record_outbox(Lead, created, 'create')
+        publish_changes(Lead, updated, 'update')
+        record_outbox(Lead, updated, 'update')
+        entries.extend(build_audit_entry(user=user, action='create', instance=lead) for lead in created)
+        save_audit_entries(entries)
+
+    report.created += len(created)
+    report.updated += len(updated)
+
+
+def _import_contact_chunk(chunk, user, report):
+    valid, errors = validate_items(ContactBulkSerializer, [_clean(row) for _, row in chunk])
+    for index, result in errors.items():
+        report.add_error(chunk[index][0], result['errors'])
+
+    lead_owners = dict(
+        Lead.objects.filter(pk__in={data['linked_lead'] for _, data in valid}).values_list('id', 'owner_id')
+    )
+    existing = {}
+    matches = Contact.objects.annotate(
+        email_normalized=Lower('email'), lead_owner_id=F('linked_lead__owner_id'),
+    ).filter(
+        email_normalized__in={normalize_email(data['email']) for _, data in valid}
+    ).order_by('pk')
+    for contact in matches:
+        existing.setdefault(contact.email_normalized, contact)
+
+    now = timezone.now()
+    pending = {}
+    befores = {}
+    created, updated, entries = [], [], []
+    for index, data in valid:
+        lead_id = data.pop('linked_lead')
+        data.pop('id', None)
+        if lead_id not in lead_owners or (_is_agent(user) and lead_owners[lead_id] != user.pk):
+            report.add_error(chunk[index][0], {'linked_lead': ['Lead not found.']})
+            continue
+
+        email = normalize_email(data['email'])
+        contact = existing.get(email) or pending.get(email)
+        if contact is None:
+            contact = Contact(linked_lead_id=lead_id, **data)
+            pending[email] = contact
+            created.append(contact)
+            continue
+
+        # Same rule as the contact PUT: agents only change contacts of their own leads.
+        if contact.pk and _is_agent(user) and contact.lead_owner_id != user.pk:
+            report.add_error(chunk[index][0], {'email': ['A contact with this email belongs to another user\'s lead.']})
+            continue
+        if contact.pk and contact.pk not in befores:
+            befores[contact.pk] = audit_snapshot(contact)
+            updated.append(contact)
+        for field, value in data.items():
+            setattr(contact, field, value)
+        contact.linked_lead_id = lead_id
+        contact.updated_at = now
+
+    with transaction.atomic():
+        Contact.objects.bulk_create(created)
+        Contact.objects.bulk_update(updated, CONTACT_FIELDS + ['linked_lead', 'updated_at'])
+        index_instances(Contact, created + updated)
+        publish_changes(Contact, created, 'create')
+        record_outbox(Contact, created, 'create')
+        publish_changes(Contact, updated, 'update')
+        record_outbox(Contact, updated, 'update')
+        entries.extend(
+            build_audit_entry(user=user, action='update', instance=contact, before=befores[contact.pk])
+            for contact in updated
+        )
+        entries.extend(build_audit_entry(user=user, action='create', instance=contact) for contact in created)
+        save_audit_entries(entries)
+
+    report.created += len(created)
+    report.updated += len(updated)
+
+
+def import_csv(kind, stream, user, chunk_size=None, progress=None):
+    """
+    Import a CSV text stream of `kind` ('leads' or 'contacts') on behalf of `user`.
+
+    Args:
+        stream: text file object; the first row must be a header
+        chunk_size: rows per transaction (settings.IMPORT_CHUNK_SIZE by default)
+        progress: optional callable invoked with the ImportReport after each chunk
+
+    Returns:
+        ImportReport
+    """
+    if kind not in IMPORT_KINDS:
+        raise ValueError(f"Unknown import kind: {kind}")
+    chunk_size = chunk_size or getattr(settings, 'IMPORT_CHUNK_SIZE', 1000)
+    import_chunk = _import_lead_chunk if kind == 'leads' else _import_contact_chunk
+
+    report = ImportReport()
+    for chunk in _chunks(csv.DictReader(stream), chunk_size):
+        report.rows += len(chunk)
+        import_chunk(chunk, user, report)
+        if progress:
+            progress(report)
+
+    invalidate_dashboard()
+    return report
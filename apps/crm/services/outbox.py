@@ -0,0 +1,320 @@
+"""
+Transactional outbox and webhook delivery.
+
+Every create/update/delete of a lead, contact, note, reminder or
+correspondence writes an OutboxEvent in the same transaction as the change:
+single-row saves and deletes through the handlers in apps.crm.signals, bulk
+writes by calling record_outbox() themselves. An event exists exactly when
+its change committed, and writing it costs the request one INSERT.
+
+The deliver_webhooks Celery task drains the outbox to the registered
+WebhookEndpoints. Each endpoint keeps its own cursor (last_event_id): a batch
+of up to WEBHOOK_BATCH_SIZE events past the cursor is coalesced to one event
+per object and POSTed as
+
+    {"events": [{"id": 42, "model": "crm.Lead", "object_id": "7", "action": "update", "data": {...}, "at": "..."}]}
+
+over a pooled keep-alive session. The cursor only advances once the endpoint
+answers 2xx; on failure the endpoint backs off exponentially (with jitter) and
+the same events are retried, so delivery is at-least-once. Receivers dedupe on
+the event ids or the X-CRM-Delivery header and verify X-CRM-Signature, an
+HMAC-SHA256 of the body keyed with the endpoint's secret.
+
+Outbox ids are allocated when a row is inserted but become visible when its
+transaction commits, so a reader could see id 11 before a slower transaction
+commits id 10 and move its cursor past it. Events are therefore only read
+once they are WEBHOOK_SETTLE_SECONDS old, which must exceed the longest
+transaction writing them.
+
+Endpoints are claimed in a short transaction with SELECT ... FOR UPDATE SKIP
+LOCKED that pushes next_attempt_at WEBHOOK_CLAIM_TIMEOUT ahead, so several
+workers can deliver to different endpoints at once without double-sending
+and no row lock or transaction is held while a batch is posted. The endpoint
+is locked again afterwards to move its cursor or schedule the retry; a claim
+left by a crashed worker expires and the batch is sent again.
+Events every active endpoint has received are pruned after each run.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from apps.crm.models import OutboxEvent, WebhookEndpoint
+from apps.crm.services.audit import audit_snapshot
+from core.fastjson import dumps
+
+logger = logging.getLogger(__name__)
+
+_json_default = DjangoJSONEncoder().default
+
+
+def _event_data(instance, action):
+    if action == OutboxEvent.Action.DELETE:
+        return None
+    return {'id': instance.pk, **audit_snapshot(instance)}
+
+
+def record_outbox(model, instances, action, using='default'):
+    """
+        Write outbox events for `action` on `instances` of `model`. Call inside
+        the transaction making the change so both commit or roll back together.
+    """
+    if not getattr(settings, 'OUTBOX_ENABLED', True) or not instances:
+        return
+    label = model._meta.label
+    OutboxEvent.objects.using(using).bulk_create([
+        OutboxEvent(model=label, object_id=str(instance.pk), action=action, data=_event_data(instance, action))
+        for instance in instances
+    ], batch_size=500)
+
+
+def record_saved(sender, instance, created=False, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    record_outbox(sender, [instance], 'create' if created else 'update', using=using)
+
+
+def record_deleted(sender, instance, using='default', **kwargs):
+    record_outbox(sender, [instance], 'delete', using=using)
+
+
+def coalesce(events):
+    """
+        One event per (model, object_id), in order of each object's last change:
+        a create followed by updates stays a create carrying the latest data,
+        anything followed by a delete becomes a delete, and a create followed
+        by a delete cancels out.
+    """
+    merged = {}
+    for event in events:
+        key = (event['model'], event['object_id'])
+        previous = merged.pop(key, None)
+        if previous is not None and previous['action'] == 'create':
+            if event['action'] == 'delete':
+                continue
+            event = {**event, 'action': 'create'}
+        merged[key] = event
+    return list(merged.values())
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+        Per-process requests session; keeps connections to endpoints alive
+        between batches and runs.
+    """
+    global _session, _session_pid
+    # Sockets must not be shared with a forked parent (Celery prefork workers).
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=getattr(settings, 'WEBHOOK_POOL_SIZE', 10),
+                    pool_maxsize=getattr(settings, 'WEBHOOK_POOL_SIZE', 10),
+                    max_retries=0,
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session, _session_pid = session, os.getpid()
+    return _session
+
+
+def _payload(events):
+    return {'events': [
+        {
+            'id': event['id'],
+            'model': event['model'],
+            'object_id': event['object_id'],
+            'action': event['action'],
+            'data': event['data'],
+            'at': event['created_at'],
+        }
+        for event in events
+    ]}
+
+
+def _encode(payload):
+    body = dumps(payload, default=_json_default)
+    if body is None:
+        body = json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+    return body
+
+
+def sign(secret, body):
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def post_events(endpoint, events, first_id, last_id):
+    """
+        POST `events` to `endpoint`; raises on connection errors and non-2xx answers.
+    """
+    body = _encode(_payload(events))
+    headers = {
+        'Content-Type': 'application/json',
+        'User-Agent': 'crm-webhooks',
+        # Identical across retries of the same batch.
+        'X-CRM-Delivery': f'{endpoint.pk}-{first_id}-{last_id}',
+    }
+    if endpoint.secret:
+        headers['X-CRM-Signature'] = sign(endpoint.secret, body)
+    response = get_session().post(
+        endpoint.url, data=body, headers=headers, timeout=getattr(settings, 'WEBHOOK_TIMEOUT', 10),
+    )
+    response.raise_for_status()
+
+
+def backoff_delay(failures):
+    """
+        Seconds before retrying after `failures` consecutive failures: doubling
+        from WEBHOOK_BACKOFF_BASE up to WEBHOOK_BACKOFF_MAX, less up to half as jitter.
+    """
+    base = getattr(settings, 'WEBHOOK_BACKOFF_BASE', 5)
+    cap = getattr(settings, 'WEBHOOK_BACKOFF_MAX', 3600)
+    delay = min(base * 2 ** min(failures - 1, 32), cap)
+    return delay * random.uniform(0.5, 1)
+
+
+def deliver_webhook_batch(batch_size=500, exclude_ids=()):
+    """
+    Claim one endpoint that is due and deliver its next batch of events.
+
+    Args:
+        batch_size: maximum outbox events read past the endpoint's cursor
+        exclude_ids: endpoints already drained or failed in this run
+
+    Returns:
+        (endpoint, events_read, delivered) or None when no endpoint is due
+    """
+    now = timezone.now()
+    settled = now - timedelta(seconds=getattr(settings, 'WEBHOOK_SETTLE_SECONDS', 5))
+
+    with transaction.atomic():
+        endpoint = (
+            WebhookEndpoint.objects
+            .select_for_update(skip_locked=True)
+            .filter(is_active=True)
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            .exclude(pk__in=exclude_ids)
+            .order_by('id')
+            .first()
+        )
+        if endpoint is None:
+            return None
+
+        rows = list(
+            OutboxEvent.objects
+            .filter(id__gt=endpoint.last_event_id, created_at__lte=settled)
+            .order_by('id')
+            .values('id', 'model', 'object_id', 'action', 'data', 'created_at')[:batch_size]
+        )
+        if not rows:
+            return endpoint, 0, True
+
+        # The claim: other workers skip the endpoint until it expires.
+        endpoint.next_attempt_at = now + timedelta(seconds=getattr(settings, 'WEBHOOK_CLAIM_TIMEOUT', 60))
+        endpoint.save(update_fields=['next_attempt_at'])
+
+    cursor = endpoint.last_event_id
+    events = coalesce([row for row in rows if not endpoint.model_labels or row['model'] in endpoint.model_labels])
+    try:
+        if events:
+            post_events(endpoint, events, rows[0]['id'], rows[-1]['id'])
+    except Exception as e:
+        logger.warning("Webhook delivery to %s failed: %s", endpoint.url, e)
+        endpoint = _finish_batch(endpoint, cursor, error=e)
+        return endpoint, len(rows), False
+
+    endpoint = _finish_batch(endpoint, cursor, last_event_id=rows[-1]['id'])
+    return endpoint, len(rows), True
+
+
+def _finish_batch(endpoint, cursor, last_event_id=None, error=None):
+    """
+        Record the outcome of the batch read past `cursor`: advance the cursor
+        to `last_event_id`, or back off after `error`. Does nothing if the
+        cursor moved meanwhile, i.e. the claim expired and another worker
+        delivered the batch.
+    """
+    with transaction.atomic():
+        endpoint = WebhookEndpoint.objects.select_for_update().get(pk=endpoint.pk)
+        if endpoint.last_event_id != cursor:
+            return endpoint
+        if error is None:
+            endpoint.last_event_id = last_event_id
+            endpoint.failures = 0
+            endpoint.next_attempt_at = None
+            endpoint.last_error = ''
+        else:
+            endpoint.failures += 1
+            endpoint.next_attempt_at = timezone.now() + timedelta(seconds=backoff_delay(endpoint.failures))
+            endpoint.last_error = str(error)[:1000]
+        endpoint.save(update_fields=['last_event_id', 'failures', 'next_attempt_at', 'last_error'])
+    return endpoint
+
+
+def prune_outbox():
+    """
+        Delete events every active endpoint has received. Returns the number deleted.
+    """
+    cursor = WebhookEndpoint.objects.filter(is_active=True).aggregate(cursor=Min('last_event_id'))['cursor']
+    events = OutboxEvent.objects.all()
+    if cursor is not None:
+        events = events.filter(id__lte=cursor)
+    deleted, _ = events.delete()
+    return deleted
+
+
+def outbox_position():
+    """
+        Id of the newest outbox event; new endpoints start after it.
+    """
+    return OutboxEvent.objects.aggregate(position=Max('id'))['position'] or 0
+
+
+def dispatch_webhooks(batch_size=None, max_batches=None):
+    """
+    Drain the outbox to every due endpoint, then prune delivered events.
+    Returns counts of events read and delivered, failed batches and pruned events.
+    """
+    batch_size = batch_size or getattr(settings, 'WEBHOOK_BATCH_SIZE', 500)
+    done = set()
+    counts = {'read': 0, 'delivered': 0, 'failed': 0, 'pruned': 0}
+
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        result = deliver_webhook_batch(batch_size, done)
+        if result is None:
+            break
+        endpoint, read, delivered = result
+        if read:
+            batches += 1
+            counts['read'] += read
+        if delivered:
+            counts['delivered'] += read
+        else:
+            counts['failed'] += 1
+        # A full batch may have more behind it; anything else waits for the next run.
+        if not delivered or read < batch_size:
+            done.add(endpoint.pk)
+
+    counts['pruned'] = prune_outbox()
+    return counts
@@ -0,0 +1,181 @@
+"""
+Reminder dispatch: claims due reminders in bounded batches and delivers them
+through a pluggable backend (settings.REMINDER_DELIVERY_BACKEND).
+
+Each batch is claimed in a short transaction: SELECT ... FOR UPDATE SKIP
+LOCKED picks due reminders, which are stamped with `claimed_at` (counting the
+attempt) and committed, so any number of workers can drain the queue
+concurrently and no row lock is held while the backend delivers. Outcomes are
+then recorded in a second transaction, only for reminders still carrying this
+run's stamp. A claim left behind by a crashed worker expires after
+REMINDER_CLAIM_TIMEOUT seconds and the reminder is delivered again.
+
+A failed delivery stays PENDING for the next run until REMINDER_MAX_ATTEMPTS
+is reached, after which it is marked FAILED.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.crm.models import Reminder
+from apps.crm.services.changefeed import publish_changes
+from apps.crm.services.dashboard import invalidate_dashboard
+from apps.crm.services.outbox import record_outbox
+
+logger = logging.getLogger(__name__)
+
+
+class BaseDeliveryBackend:
+    """Delivers a single reminder; raise to signal a failed attempt."""
+
+    def send(self, reminder):
+        raise NotImplementedError
+
+
+class LoggingDeliveryBackend(BaseDeliveryBackend):
+    def send(self, reminder):
+        logger.info("Reminder %s for lead %s: %s", reminder.pk, reminder.lead_id, reminder.message)
+
+
+class EmailDeliveryBackend(BaseDeliveryBackend):
+    def send(self, reminder):
+        send_mail(
+            subject=f"Reminder: {reminder.lead.name}",
+            message=reminder.message,
+            from_email=None,
+            recipient_list=[reminder.created_by.email],
+        )
+
+
+def get_delivery_backend():
+    return import_string(getattr(
+        settings, 'REMINDER_DELIVERY_BACKEND', 'apps.crm.services.reminders.LoggingDeliveryBackend'
+    ))()
+
+
+def claim_due_batch(batch_size=100, exclude_ids=(), shard=None, shards=None):
+    """
+        Stamp up to `batch_size` due, unclaimed reminders as in flight and
+        return them; the claim commits before anything is delivered.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, 'REMINDER_CLAIM_TIMEOUT', 300))
+
+    with transaction.atomic():
+        queryset = (
+            Reminder.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('lead', 'created_by')
+            .filter(status=Reminder.Status.PENDING, scheduled_time__lte=now)
+            .filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=stale))
+            .exclude(pk__in=exclude_ids)
+            .order_by('scheduled_time')
+        )
+        if shards:
+            queryset = queryset.annotate(shard=F('id') % shards).filter(shard=shard)
+        batch = list(queryset[:batch_size])
+
+        for reminder in batch:
+            reminder.claimed_at = now
+            reminder.attempts += 1
+        Reminder.objects.bulk_update(batch, ['claimed_at', 'attempts'])
+    return batch
+
+
+def record_outcomes(batch):
+    """
+        Store the delivery outcome of a claimed batch. Reminders whose claim
+        expired and was taken over, or that were changed meanwhile (e.g.
+        cancelled), are left alone.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        current = dict(
+            Reminder.objects
+            .select_for_update()
+            .filter(pk__in=[reminder.pk for reminder in batch], status=Reminder.Status.PENDING)
+            .values_list('pk', 'claimed_at')
+        )
+        recorded = [reminder for reminder in batch if current.get(reminder.pk) == reminder.claimed_at]
+
+        outcomes = defaultdict(list)
+        for reminder in recorded:
+            reminder.claimed_at = None
+            reminder.updated_at = now
+            outcomes[reminder.status, reminder.last_error].append(reminder.pk)
+        for (outcome, last_error), pks in outcomes.items():
+            Reminder.objects.filter(pk__in=pks).update(
+                status=outcome, last_error=last_error, claimed_at=None, updated_at=now,
+            )
+        publish_changes(Reminder, recorded, 'update')
+        record_outbox(Reminder, recorded, 'update')
+    return recorded
+
+
+def dispatch_due_batch(backend, batch_size=100, exclude_ids=(), shard=None, shards=None):
+    """
+    Claim up to `batch_size` due reminders and deliver them.
+
+    Args:
+        backend: delivery backend instance
+        batch_size: maximum reminders claimed at once
+        exclude_ids: reminders already attempted in this run, skipped until the next one
+        shard, shards: optionally restrict to reminders with id % shards == shard
+
+    Returns:
+        List of reminders processed in this batch (empty when nothing is due)
+    """
+    max_attempts = getattr(settings, 'REMINDER_MAX_ATTEMPTS', 3)
+    batch = claim_due_batch(batch_size, exclude_ids, shard=shard, shards=shards)
+
+    # Outside any transaction: a slow backend holds no locks, and a failure
+    # part-way cannot roll back the claims of reminders already sent.
+    for reminder in batch:
+        try:
+            backend.send(reminder)
+            reminder.status = Reminder.Status.SENT
+            reminder.last_error = ''
+        except Exception as e:
+            logger.warning("Delivery of reminder %s failed: %s", reminder.pk, e)
+            reminder.last_error = str(e)
+            if reminder.attempts >= max_attempts:
+                reminder.status = Reminder.Status.FAILED
+
+    if batch:
+        record_outcomes(batch)
+        invalidate_dashboard()
+    return batch
+
+
+def dispatch_due_reminders(batch_size=None, max_batches=None, shard=None, shards=None):
+    """
+    Drain due reminders batch by batch. Returns counts of sent, failed and retrying reminders.
+    """
+    batch_size = batch_size or getattr(settings, 'REMINDER_BATCH_SIZE', 100)
+    backend = get_delivery_backend()
+    attempted = set()
+    counts = {'sent': 0, 'failed': 0, 'retrying': 0}
+
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        batch = dispatch_due_batch(backend, batch_size, attempted, shard=shard, shards=shards)
+        if not batch:
+            break
+        batches += 1
+        for reminder in batch:
+            attempted.add(reminder.pk)
+            if reminder.status == Reminder.Status.SENT:
+                counts['sent'] += 1
+            elif reminder.status == Reminder.Status.FAILED:
+                counts['failed'] += 1
+            else:
+                counts['retrying'] += 1
+    return counts
@@ -0,0 +1,253 @@
+"""
+Full-text search over leads, contacts, notes, reminders and correspondence.
+
+Each searchable model gets a companion search table holding one document per
+row, kept in sync by the post_save/post_delete handlers in apps.crm.signals:
+
+- PostgreSQL: `<table>_search(object_id, document tsvector)` with a GIN index,
+  ranked with ts_rank. Fields are weighted A..D in declaration order.
+- SQLite: an FTS5 virtual table `<table>_search` keyed by rowid, ranked with bm25.
+- Any other backend falls back to icontains filters: every term must appear
+  in at least one of the fields, as with the full-text backends.
+
+The tables are created on post_migrate; `manage.py rebuild_search_index`
+backfills them for existing rows.
+"""
+
+import re
+
+from django.db import connections
+from django.db.models import F, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+
+from apps.crm.models import Lead, Contact, Note, Reminder, Correspondence
+
+# Fields indexed per model, most important first.
+SEARCH_FIELDS = {
+    Lead: ('name', 'description', 'source'),
+    Contact: ('name', 'email', 'company', 'title'),
+    Note: ('content',),
+    Reminder: ('message',),
+    Correspondence: ('notes', 'outcome'),
+}
+
+TEXT_SEARCH_CONFIG = 'simple'
+
+
+def search_terms(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def search_table(model):
+    return f'{model._meta.db_table}_search'
+
+
+class SearchRank(Func):
+    """
+        Rank of each row of the outer queryset against a full-text query.
+        `template` is a scalar subquery over the search table with `%(query)s`
+        and `%(pk)s` placeholders, in that order; the primary key is an
+        F('pk') expression so the outer alias survives clones and subqueries.
+    """
+    output_field = FloatField()
+
+    def __init__(self, template, query):
+        super().__init__(Value(query), F('pk'))
+        self.template = template
+
+    def as_sql(self, compiler, connection, **extra_context):
+        query_sql, query_params = compiler.compile(self.source_expressions[0])
+        pk_sql, pk_params = compiler.compile(self.source_expressions[1])
+        return self.template % {'query': query_sql, 'pk': pk_sql}, [*query_params, *pk_params]
+
+
+def rank_matches(queryset, match_sql, rank_template, query):
+    """
+        Restrict `queryset` to the primary keys `match_sql` selects, evaluated
+        once as an uncorrelated IN subquery, and annotate the survivors with
+        `search_rank`, a primary key lookup in the search table per row.
+    """
+    return queryset.filter(pk__in=RawSQL(match_sql, [query])).annotate(
+        search_rank=SearchRank(rank_template, query),
+    )
+
+
+class BaseSearchBackend:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self, model):
+        pass
+
+    def index(self, model, rows):
+        """
+            Index `rows`, an iterable of (pk, {field: text}) pairs.
+        """
+        pass
+
+    def remove(self, model, pks):
+        pass
+
+    def search(self, queryset, terms):
+        query = Q()
+        for term in terms:
+            matches_term = Q()
+            for field in SEARCH_FIELDS[queryset.model]:
+                matches_term |= Q(**{f'{field}__icontains': term})
+            query &= matches_term
+        return queryset.filter(query).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    WEIGHTS = 'ABCD'
+
+    def install(self, model):
+        table = search_table(model)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" ('
+                f'object_id bigint PRIMARY KEY REFERENCES "{model._meta.db_table}" (id) ON DELETE CASCADE, '
+                f'document tsvector NOT NULL)'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{table}_document_gin" ON "{table}" USING GIN (document)'
+            )
+
+    def _document_sql(self, model):
+        fields = SEARCH_FIELDS[model]
+        return ' || '.join(
+            f"setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(%s, '')), '{self.WEIGHTS[min(i, 3)]}')"
+            for i in range(len(fields))
+        )
+
+    def index(self, model, rows):
+        table = search_table(model)
+        fields = SEARCH_FIELDS[model]
+        sql = (
+            f'INSERT INTO "{table}" (object_id, document) VALUES (%s, {self._document_sql(model)}) '
+            f'ON CONFLICT (object_id) DO UPDATE SET document = EXCLUDED.document'
+        )
+        params = [[pk] + [values[f] for f in fields] for pk, values in rows]
+        if params:
+            with self.connection.cursor() as cursor:
+                cursor.executemany(sql, params)
+
+    def remove(self, model, pks):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{search_table(model)}" WHERE object_id = ANY(%s)', [list(pks)])
+
+    def search(self, queryset, terms):
+        table = search_table(queryset.model)
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        to_tsquery = f"to_tsquery('{TEXT_SEARCH_CONFIG}', %s)"
+        return rank_matches(
+            queryset,
+            f'SELECT object_id FROM "{table}" WHERE document @@ {to_tsquery}',
+            f'(SELECT ts_rank(document, {to_tsquery % "%(query)s"}) FROM "{table}" WHERE object_id = %(pk)s)',
+            tsquery,
+        )
+
+
+class SqliteSearchBackend(BaseSearchBackend):
+    # bm25 column weights, mirroring the A..D weights used on PostgreSQL.
+    WEIGHTS = (8.0, 4.0, 2.0, 1.0)
+
+    def install(self, model):
+        columns = ', '.join(SEARCH_FIELDS[model])
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS "{search_table(model)}" '
+                f"USING fts5({columns}, tokenize='unicode61')"
+            )
+
+    def index(self, model, rows):
+        fields = SEARCH_FIELDS[model]
+        placeholders = ', '.join(['%s'] * (len(fields) + 1))
+        sql = (
+            f'INSERT OR REPLACE INTO "{search_table(model)}" (rowid, {", ".join(fields)}) '
+            f'VALUES ({placeholders})'
+        )
+        params = [[pk] + [values[f] or '' for f in fields] for pk, values in rows]
+        if params:
+            with self.connection.cursor() as cursor:
+                cursor.executemany(sql, params)
+
+    def remove(self, model, pks):
+        pks = list(pks)
+        placeholders = ', '.join(['%s'] * len(pks))
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{search_table(model)}" WHERE rowid IN ({placeholders})', pks)
+
+    def search(self, queryset, terms):
+        table = search_table(queryset.model)
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(
+            str(self.WEIGHTS[min(i, 3)]) for i in range(len(SEARCH_FIELDS[queryset.model]))
+        )
+        ranks = f'SELECT rowid, -bm25("{table}", {weights}) AS rank FROM "{table}" WHERE "{table}" MATCH %(query)s'
+        if self.connection.Database.sqlite_version_info >= (3, 35):
+            # Materialized, the match runs once per statement instead of once per row.
+            rank_template = f'(WITH ranks AS MATERIALIZED ({ranks}) SELECT rank FROM ranks WHERE rowid = %(pk)s)'
+        else:
+            rank_template = f'(SELECT rank FROM ({ranks}) WHERE rowid = %(pk)s)'
+        return rank_matches(
+            queryset,
+            f'SELECT rowid FROM "{table}" WHERE "{table}" MATCH %s',
+            rank_template,
+            match,
+        )
+
+
+_fts5_support = {}
+
+
+def _has_fts5(connection):
+    if connection.alias not in _fts5_support:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            _fts5_support[connection.alias] = bool(cursor.fetchone()[0])
+    return _fts5_support[connection.alias]
+
+
+def get_backend(using='default'):
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend(connection)
+    if connection.vendor == 'sqlite' and _has_fts5(connection):
+        return SqliteSearchBackend(connection)
+    return BaseSearchBackend(connection)
+
+
+def _document_values(instance):
+    return {field: getattr(instance, field) for field in SEARCH_FIELDS[type(instance)]}
+
+
+def index_instances(model, instances, using='default'):
+    """
+        Add or refresh search documents for saved instances of `model`.
+    """
+    get_backend(using).index(model, ((obj.pk, _document_values(obj)) for obj in instances))
+
+
+def remove_instances(model, pks, using='default'):
+    pks = list(pks)
+    if pks:
+        get_backend(using).remove(model, pks)
+
+
+def install_search_tables(using='default'):
+    backend = get_backend(using)
+    for model in SEARCH_FIELDS:
+        backend.install(model)
+
+
+def search_queryset(queryset, text):
+    """
+        Restrict `queryset` to rows matching every term in `text` (prefix match),
+        annotated with `search_rank` and ordered by it ahead of the existing ordering.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset.none()
+    backend = get_backend(queryset.db)
+    return backend.search(queryset, terms).order_by('-search_rank', *queryset.query.order_by)
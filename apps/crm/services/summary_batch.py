@@ -0,0 +1,265 @@
+"""
+Batch AI summaries: refresh the cached summary of many leads at once.
+
+Leads are processed in chunks of AI_SUMMARY_BATCH_CHUNK: their notes are read
+with one query, leads whose cached summary still matches their notes are
+skipped, and the rest are summarized on an asyncio event loop. Every model
+call, including the window and reduce calls of leads with long notes, goes
+through one CallLimiter, so at most AI_SUMMARY_BATCH_CONCURRENCY calls are in
+flight whatever the leads look like. Each call
+
+- waits for a token from a TokenBucket refilled at AI_SUMMARY_RATE calls per
+  second (bursts of AI_SUMMARY_BURST), keeping the job under the API quota;
+- is abandoned after AI_SUMMARY_TIMEOUT seconds;
+- goes through a CircuitBreaker: after AI_SUMMARY_BREAKER_THRESHOLD
+  consecutive failures no calls are made for AI_SUMMARY_BREAKER_RESET seconds
+  and leads get the basic fallback summary instead, then a single trial call
+  decides whether to resume.
+
+A lead whose model call fails gets the fallback summary.
+
+Summaries are stored under the same cache entries as the summary endpoint
+(see apps.crm.services.ai_summary), which then serves them without calling
+the model. Fallback summaries are not stored, so the endpoint or the next
+run retries those leads.
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.crm.models import Lead, Note
+from apps.crm.services.ai_summary import ai_summary_service, notes_digest, summary_cache_key
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = (Lead.Status.NEW, Lead.Status.IN_PROGRESS)
+
+
+class TokenBucket:
+    """
+        Allows `rate` acquisitions per second on average and up to `capacity`
+        at once. For use from a single event loop.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # The lock queues waiters, so tokens go out in arrival order.
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+        Closed: calls go through. Opens after `threshold` consecutive
+        failures and rejects calls for `reset_timeout` seconds, then lets one
+        trial call through (half-open) that closes or reopens it.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, threshold=5, reset_timeout=60.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def before_call(self):
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpen()
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._trial_running:
+                raise CircuitOpen()
+            self._trial_running = True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_running = False
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN:
+                logger.warning("AI summary circuit opened after %s failures", self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class CallLimiter:
+    """
+        Admits model calls for one event loop: at most `concurrency` in
+        flight, each waiting for a token from `bucket`, passing `breaker` and
+        abandoned after `timeout` seconds. Installed on the summary service
+        with AISummaryService.limited(), so it sees every call the service makes.
+    """
+
+    def __init__(self, concurrency, bucket, breaker, timeout):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = bucket
+        self.breaker = breaker
+        self.timeout = timeout
+
+    async def _admit(self):
+        while True:
+            try:
+                self.breaker.before_call()
+                return
+            except CircuitOpen:
+                if self.breaker.state != CircuitBreaker.HALF_OPEN:
+                    raise
+            # Another call is the trial; its outcome decides for this one.
+            await asyncio.sleep(0.05)
+
+    async def call(self, make_call):
+        """
+            Await `make_call()` within the limits. Raises CircuitOpen without
+            calling while the breaker is open.
+        """
+        async with self.semaphore:
+            await self._admit()
+            await self.bucket.acquire()
+            try:
+                result = await asyncio.wait_for(make_call(), timeout=self.timeout)
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            return result
+
+
+class SummaryBatch:
+    """
+        Shared limits for one run; summarize() handles one chunk of leads.
+    """
+
+    def __init__(self, concurrency=None, rate=None, burst=None, timeout=None, breaker=None):
+        self.concurrency = concurrency or getattr(settings, 'AI_SUMMARY_BATCH_CONCURRENCY', 8)
+        self.rate = rate or getattr(settings, 'AI_SUMMARY_RATE', 2.0)
+        self.burst = burst or getattr(settings, 'AI_SUMMARY_BURST', 5)
+        self.timeout = timeout or getattr(settings, 'AI_SUMMARY_TIMEOUT', 30)
+        self.breaker = breaker or CircuitBreaker(
+            getattr(settings, 'AI_SUMMARY_BREAKER_THRESHOLD', 5),
+            getattr(settings, 'AI_SUMMARY_BREAKER_RESET', 60),
+        )
+        self.counts = {'summarized': 0, 'fresh': 0, 'fallback': 0, 'no_notes': 0}
+
+    async def _summarize_lead(self, service, lead_id, lead_name, notes):
+        try:
+            summary = await service.asummarize_notes(notes, lead_name)
+        except Exception as e:
+            if not isinstance(e, CircuitOpen):
+                logger.warning("AI summary of lead %s failed: %r", lead_id, e)
+            self.counts['fallback'] += 1
+            return lead_id, ai_summary_service._generate_fallback_summary(notes, lead_name), False
+
+        self.counts['summarized'] += 1
+        return lead_id, summary, True
+
+    async def _summarize(self, pending):
+        # Created here: asyncio primitives belong to the loop running this chunk.
+        limiter = CallLimiter(self.concurrency, TokenBucket(self.rate, self.burst), self.breaker, self.timeout)
+        service = ai_summary_service.limited(limiter)
+        return await asyncio.gather(*[
+            self._summarize_lead(service, lead_id, lead_name, notes)
+            for lead_id, lead_name, notes in pending
+        ])
+
+    def summarize(self, leads, force=False):
+        """
+            Refresh the summaries of `leads`, (id, name) pairs.
+        """
+        notes = defaultdict(list)
+        # Same order as the summary endpoint, so the cache entries match.
+        rows = Note.objects.filter(lead_id__in=[lead_id for lead_id, _ in leads]).order_by('-created_at')
+        for lead_id, content in rows.values_list('lead_id', 'content'):
+            notes[lead_id].append(content)
+
+        stored = {} if force else cache.get_many([summary_cache_key(lead_id) for lead_id, _ in leads])
+        pending, digests = [], {}
+        for lead_id, lead_name in leads:
+            if not notes[lead_id]:
+                self.counts['no_notes'] += 1
+                continue
+            digests[lead_id] = notes_digest(notes[lead_id], lead_name)
+            entry = stored.get(summary_cache_key(lead_id))
+            if entry and entry['digest'] == digests[lead_id]:
+                self.counts['fresh'] += 1
+                continue
+            pending.append((lead_id, lead_name, notes[lead_id]))
+
+        if not pending:
+            return
+        if not ai_summary_service.is_available():
+            # Without a model every lead would get the fallback, which is not stored.
+            self.counts['fallback'] += len(pending)
+            return
+        results = async_to_sync(self._summarize)(pending)
+        cache.set_many(
+            {
+                summary_cache_key(lead_id): {'digest': digests[lead_id], 'summary': summary}
+                for lead_id, summary, from_model in results if from_model
+            },
+            getattr(settings, 'AI_SUMMARY_CACHE_TIMEOUT', 86400),
+        )
+
+
+def summarize_leads(lead_ids=None, force=False, chunk_size=None, **limits):
+    """
+    Refresh cached AI summaries of open leads, or of `lead_ids`.
+
+    Args:
+        lead_ids: leads to summarize instead of every open lead
+        force: summarize even when the cached summary matches the notes
+        chunk_size: leads whose notes are loaded at once
+        limits: concurrency, rate, burst, timeout or breaker overriding the settings
+
+    Returns:
+        Counts of leads summarized, skipped as fresh, given the fallback
+        summary and skipped for having no notes
+    """
+    chunk_size = chunk_size or getattr(settings, 'AI_SUMMARY_BATCH_CHUNK', 500)
+    leads = Lead.objects.order_by('id')
+    if lead_ids is not None:
+        leads = leads.filter(pk__in=lead_ids)
+    else:
+        leads = leads.filter(status__in=OPEN_STATUSES)
+
+    batch = SummaryBatch(**limits)
+    chunk = []
+    for lead in leads.values_list('id', 'name').iterator(chunk_size=chunk_size):
+        chunk.append(lead)
+        if len(chunk) >= chunk_size:
+            batch.summarize(chunk, force)
+            chunk = []
+    if chunk:
+        batch.summarize(chunk, force)
+    return batch.counts
@@ -0,0 +1,61 @@
+"""
+Lead activity timeline.
+
+Merges a lead's notes, reminders, correspondence (through its contacts) and
+audit entries into one stream, newest first. Every call reads at most one
+page from each source with a keyset query on its `(lead, created_at)` index
+and merges the pages in Python, so a long-lived lead costs the same as a new
+one. Pagination is cursor-only (`next_cursor` / `prev_cursor`).
+"""
+
+from django.db.models import CharField, Value
+
+from apps.crm.models import AuditTrail, Correspondence, Lead, Note, Reminder
+from apps.crm.pagination import merged_keyset_page
+from apps.crm.serializers import (
+    compiled_correspondence_serializer,
+    compiled_note_serializer,
+    compiled_reminder_serializer,
+    compiled_timeline_audit_serializer,
+)
+
+# `kind` breaks created_at ties between sources, `id` within one.
+TIMELINE_ORDERING = ['-created_at', '-kind', '-id']
+
+
+def timeline_sources(lead, user=None):
+    """
+        (kind, queryset, compiled serializer) per stream. Agents only see the
+        audit entries they made themselves, as on the audit endpoint.
+    """
+    audit = AuditTrail.objects.filter(model=Lead._meta.label, object_id=str(lead.pk))
+    if hasattr(user, 'is_agent') and user.is_agent():
+        audit = audit.filter(user_id=user.pk)
+    return [
+        ('note', Note.objects.filter(lead_id=lead.pk), compiled_note_serializer),
+        ('reminder', Reminder.objects.filter(lead_id=lead.pk), compiled_reminder_serializer),
+        ('correspondence', Correspondence.objects.filter(contact__linked_lead_id=lead.pk), compiled_correspondence_serializer),
+        ('audit', audit, compiled_timeline_audit_serializer),
+    ]
+
+
+def lead_timeline(lead, user=None, rows=25, cursor=None, timestamps=None):
+    """
+        One page of the lead's timeline as ([{'type': kind, 'data': {...}}], pagination_fields).
+    """
+    sources = timeline_sources(lead, user)
+    compiled = {kind: serializer for kind, _, serializer in sources}
+    querysets = [
+        serializer.values(queryset.annotate(kind=Value(kind, output_field=CharField())), 'kind')
+        for kind, queryset, serializer in sources
+    ]
+    page, pagination = merged_keyset_page(querysets, TIMELINE_ORDERING, rows, cursor)
+
+    # Serialize each kind's rows in one pass, then restore the merged order.
+    data = {}
+    for kind, serializer in compiled.items():
+        rows_of_kind = [row for row in page if row['kind'] == kind]
+        for row, item in zip(rows_of_kind, serializer.serialize(rows_of_kind, timestamps)):
+            data[kind, row['id']] = item
+
+    return [{'type': row['kind'], 'data': data[row['kind'], row['id']]} for row in page], pagination
@@ -0,0 +1,50 @@
+"""
+Model signal handlers that keep derived data in sync with CRM writes.
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_delete
+
+from apps.crm.models import Lead, Contact, Note, Reminder, Correspondence, AuditTrail
+from apps.crm.services.ai_summary import invalidate_lead_summary
+from apps.crm.services.changefeed import FEED_MODELS, publish_deleted, publish_saved, remember_deleted
+from apps.crm.services.dashboard import invalidate_dashboard_on_commit
+from apps.crm.services.outbox import record_deleted, record_saved
+from apps.crm.services.search import SEARCH_FIELDS, index_instances, remove_instances
+
+
+def update_search_document(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    index_instances(sender, [instance], using=using)
+
+
+def delete_search_document(sender, instance, using='default', **kwargs):
+    remove_instances(sender, [instance.pk], using=using)
+
+
+for model in SEARCH_FIELDS:
+    post_save.connect(update_search_document, sender=model, dispatch_uid=f'search-save-{model.__name__}')
+    post_delete.connect(delete_search_document, sender=model, dispatch_uid=f'search-delete-{model.__name__}')
+
+for model in (Lead, Contact, Note, Reminder, Correspondence, AuditTrail):
+    post_save.connect(invalidate_dashboard_on_commit, sender=model, dispatch_uid=f'dashboard-save-{model.__name__}')
+    post_delete.connect(invalidate_dashboard_on_commit, sender=model, dispatch_uid=f'dashboard-delete-{model.__name__}')
+
+
+def invalidate_note_summary(sender, instance, **kwargs):
+    invalidate_lead_summary(instance.lead_id)
+
+
+post_save.connect(invalidate_note_summary, sender=Note, dispatch_uid='summary-save-Note')
+post_delete.connect(invalidate_note_summary, sender=Note, dispatch_uid='summary-delete-Note')
+
+for model in FEED_MODELS:
+    post_save.connect(publish_saved, sender=model, dispatch_uid=f'changefeed-save-{model.__name__}')
+    post_delete.connect(publish_deleted, sender=model, dispatch_uid=f'changefeed-delete-{model.__name__}')
+
+for model in (Lead, Contact):
+    pre_delete.connect(remember_deleted, sender=model, dispatch_uid=f'changefeed-pre-delete-{model.__name__}')
+
+for model in FEED_MODELS:
+    post_save.connect(record_saved, sender=model, dispatch_uid=f'outbox-save-{model.__name__}')
+    post_delete.connect(record_deleted, sender=model, dispatch_uid=f'outbox-delete-{model.__name__}')
@@ -1,16 +1,53 @@
 from celery import shared_task
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
 from django.utils import timezone
-from apps.crm.models import Reminder
+
+from apps.crm.services.audit_archive import archive_before, ensure_partitions
+from apps.crm.services.outbox import dispatch_webhooks
+from apps.crm.services.reminders import dispatch_due_reminders
+from apps.crm.services.summary_batch import summarize_leads
+
+
+@shared_task
+def process_due_reminders(batch_size=None, max_batches=None, shard=None, shards=None):
+    """
+        Deliver due reminders. Safe to run on several workers at once; pass
+        shard/shards to split the queue deterministically between them.
+    """
+    return dispatch_due_reminders(
+        batch_size=batch_size,
+        max_batches=max_batches,
+        shard=shard,
+        shards=shards,
+    )
+
+
+@shared_task
+def deliver_webhooks(batch_size=None, max_batches=None):
+    """
+        Deliver outbox events to the registered webhooks and prune delivered
+        ones. Schedule every few seconds; concurrent runs split the endpoints.
+    """
+    return dispatch_webhooks(batch_size=batch_size, max_batches=max_batches)
 
 
 @shared_task
-def process_due_reminders():
+def refresh_lead_summaries(lead_ids=None, force=False):
     """
-        Mark due reminders as sent. In real life, send emails/notifications.
+        Refresh the cached AI summaries of open leads (or `lead_ids`), e.g.
+        every morning before the team starts.
     """
-    now = timezone.now()
-    qs = Reminder.objects.filter(status=Reminder.Status.PENDING, scheduled_time__lte=now)
-    updated = qs.update(status=Reminder.Status.SENT)
-    return updated
+    return summarize_leads(lead_ids=lead_ids, force=force)
 
 
+@shared_task
+def maintain_audit_trail():
+    """
+        Monthly audit housekeeping: create upcoming partitions and archive months
+        older than AUDIT_HOT_MONTHS.
+    """
+    created = ensure_partitions()
+    cutoff = timezone.localdate() - relativedelta(months=max(settings.AUDIT_HOT_MONTHS - 1, 0))
+    archives = archive_before(cutoff)
+    return {'partitions_created': created, 'months_archived': [f'{a.month:%Y-%m}' for a in archives]}
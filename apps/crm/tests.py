@@ -0,0 +1,1050 @@
+import datetime
+import decimal
+import json
+import os
+import uuid
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from apps.accounts.authentication import ClaimsJWTAuthentication, ClaimsUser, UserCache, tokens_for_user
+from apps.crm.benchmarks import build_scenarios, run_scenario, seed
+from apps.crm.views.lead import LeadAsyncAPIView, LeadGenericAPIView
+from apps.crm.models import (
+    AuditArchive, AuditTrail, Contact, Correspondence, Lead, Note, OutboxEvent, Reminder, WebhookEndpoint,
+)
+from apps.crm.services import audit_archive
+from apps.crm.services.ai_stub import StubModel
+from apps.crm.services.changefeed import BaseChangeFeed, reset_change_feed
+from apps.crm.services.ai_summary import ai_summary_service, estimate_tokens, note_windows
+from apps.crm.services.audit import AuditBuffer, build_audit_entry, save_audit_entries
+from apps.crm.services.dashboard import GENERATION_KEY, invalidate_dashboard
+from apps.crm.services.importer import import_csv
+from apps.crm.services.outbox import dispatch_webhooks
+from apps.crm.services.reminders import BaseDeliveryBackend, dispatch_due_reminders
+from apps.crm.services.search import BaseSearchBackend, search_queryset, search_terms
+from apps.crm.services.summary_batch import TokenBucket, summarize_leads
+from core.db_router import _health
+from core import fastjson
+from core.fastjson import FastJSONParser, FastJSONRenderer
+from core.middleware import _record_query
+
+
+def client_for(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(user).access_token}')
+    return client
+
+
+def create_leads(owner, count, notes=1):
+    leads = []
+    for i in range(count):
+        lead = Lead.objects.create(name=f'Lead {i}', owner=owner, value=1000)
+        Contact.objects.create(name=f'Contact {i}', email=f'contact{lead.pk}@example.com', linked_lead=lead)
+        for _ in range(notes):
+            Note.objects.create(lead=lead, created_by=owner, content='Called, follow up next week.')
+        Reminder.objects.create(
+            lead=lead, created_by=owner, message='Follow up', scheduled_time=timezone.now() + timedelta(days=1),
+        )
+        leads.append(lead)
+    return leads
+
+
+class CRMTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.manager = User.objects.create_user('manager', 'manager@example.com', 'pass', role='MANAGER')
+        cls.agent = User.objects.create_user('agent', 'agent@example.com', 'pass', role='AGENT')
+
+
+class LeadListQueryTests(CRMTestCase):
+    """
+        The lead list loads owners, contacts, notes, reminders and counts in a
+        constant number of queries: validators, count, leads and one per relation.
+    """
+    LIST_QUERIES = 6
+
+    def assert_list_queries(self, count):
+        create_leads(self.manager, count)
+        client = client_for(self.manager)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = client.get('/api/leads/', {'rows': 25})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['leads']), count)
+
+    def test_three_leads(self):
+        self.assert_list_queries(3)
+
+    def test_twenty_five_leads(self):
+        self.assert_list_queries(25)
+
+
+class LeadWriteQueryTests(CRMTestCase):
+    """
+        POST and PUT answer with the lead serialized like one row of the list,
+        in a fixed number of queries whatever it has attached.
+    """
+    def assert_write_queries(self, notes):
+        lead = create_leads(self.manager, 1, notes=notes)[0]
+        client = client_for(self.manager)
+        with self.assertNumQueries(9):
+            response = client.post('/api/leads/', {'name': 'Acme', 'value': '1500'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        with self.assertNumQueries(10):
+            response = client.put('/api/leads/', {'id': lead.pk, 'description': 'Renewal'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['lead']['notes_count'], notes)
+
+    def test_one_note(self):
+        self.assert_write_queries(1)
+
+    def test_five_notes(self):
+        self.assert_write_queries(5)
+
+    def test_put_unknown_lead(self):
+        response = client_for(self.manager).put('/api/leads/', {'id': 0}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class ClaimsAuthenticationTests(CRMTestCase):
+    def test_role_claims_authenticate_without_a_query(self):
+        token = tokens_for_user(self.agent).access_token
+        with self.assertNumQueries(0):
+            user, _ = ClaimsJWTAuthentication().authenticate(
+                mock.Mock(META={'HTTP_AUTHORIZATION': f'Bearer {token}'}),
+            )
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual((user.pk, user.username, user.is_agent(), user.is_manager()), (self.agent.pk, 'agent', True, False))
+
+    def test_refresh_rejects_inactive_and_deleted_users_and_picks_up_role_changes(self):
+        client = APIClient()
+        refresh = str(tokens_for_user(self.agent))
+
+        get_user_model().objects.filter(pk=self.agent.pk).update(role='MANAGER')
+        response = client.post('/api/auth/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ClaimsUser(AccessToken(response.json()['access'])).role, 'MANAGER')
+
+        get_user_model().objects.filter(pk=self.agent.pk).update(is_active=False)
+        self.assertEqual(client.post('/api/auth/token/refresh/', {'refresh': refresh}, format='json').status_code, 401)
+        refresh = str(tokens_for_user(self.manager))
+        self.manager.delete()
+        self.assertEqual(client.post('/api/auth/token/refresh/', {'refresh': refresh}, format='json').status_code, 401)
+
+    def test_tokens_without_claims_load_the_user_and_reject_inactive_ones(self):
+        access = RefreshToken.for_user(self.agent).access_token
+        client = APIClient(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(client.get('/api/leads/').status_code, 200)
+        get_user_model().objects.filter(pk=self.agent.pk).update(is_active=False)
+        self.assertEqual(client.get('/api/leads/').status_code, 401)
+
+    def test_user_cache_reuses_rows_until_invalidated(self):
+        users = UserCache(ttl=60)
+        pk = self.agent.pk
+        with self.assertNumQueries(1):
+            self.assertEqual(users.get(pk), self.agent)
+            self.assertEqual(users.get(pk), self.agent)
+
+        self.agent.delete()
+        self.assertIsNotNone(users.get(pk))
+        users.invalidate(pk)
+        self.assertIsNone(users.get(pk))
+
+        with mock.patch('apps.accounts.authentication.time.monotonic', return_value=time.monotonic() + 61):
+            with self.assertNumQueries(1):
+                users.get(self.manager.pk)
+
+
+@override_settings(AUDIT_DURABILITY='sync')
+class BulkEndpointTests(CRMTestCase):
+    def search(self, text):
+        return list(search_queryset(Lead.objects.all(), text).values_list('name', flat=True))
+
+    def test_invalid_items_are_reported_without_blocking_the_rest(self):
+        response = client_for(self.manager).post('/api/leads/bulk/', {'leads': [
+            {'name': 'Acme', 'value': '100'},
+            {'value': '-5'},
+            'not an object',
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['succeeded'], body['failed']), (1, 2))
+        created, missing, malformed = body['results']
+        self.assertEqual(created['status'], 'created')
+        self.assertEqual(set(missing['errors']), {'name', 'value'})
+        self.assertEqual(malformed['errors'], {'non_field_errors': ['Expected an object.']})
+        lead = Lead.objects.get(pk=created['id'])
+        self.assertEqual((lead.name, lead.owner_id), ('Acme', self.manager.pk))
+        self.assertEqual(self.search('Acme'), ['Acme'])
+        self.assertEqual(AuditTrail.objects.filter(model='crm.Lead', object_id=str(lead.pk)).count(), 1)
+
+    def test_agents_only_update_their_own_leads(self):
+        own = Lead.objects.create(name='Own', owner=self.agent, value=1)
+        other = Lead.objects.create(name='Other', owner=self.manager, value=1)
+
+        response = client_for(self.agent).put('/api/leads/bulk/', [
+            {'id': own.pk, 'status': 'WON'},
+            {'id': other.pk, 'status': 'WON'},
+            {'id': 0, 'status': 'WON'},
+        ], format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.json()['results']], ['updated', 'error', 'error'])
+        own.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((own.status, other.status), ('WON', 'NEW'))
+
+    def test_contacts_need_a_lead_the_agent_owns(self):
+        own = Lead.objects.create(name='Own', owner=self.agent, value=1)
+        other = Lead.objects.create(name='Other', owner=self.manager, value=1)
+
+        response = client_for(self.agent).post('/api/contacts/bulk/', {'contacts': [
+            {'name': 'Ann', 'email': 'ann@example.com', 'linked_lead': own.pk},
+            {'name': 'Bob', 'email': 'bob@example.com', 'linked_lead': other.pk},
+        ]}, format='json')
+
+        self.assertEqual([r['status'] for r in response.json()['results']], ['created', 'error'])
+        self.assertEqual(list(Contact.objects.values_list('name', flat=True)), ['Ann'])
+
+    @override_settings(BULK_MAX_ITEMS=2)
+    def test_oversized_batches_are_rejected(self):
+        response = client_for(self.manager).post('/api/leads/bulk/', [{'name': 'A'}] * 3, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Lead.objects.exists())
+
+
+class CompiledSerializerTests(CRMTestCase):
+    LISTS = {
+        '/api/leads/': 'leads',
+        '/api/contacts/': 'contacts',
+        '/api/notes/': 'notes',
+        '/api/reminders/': 'reminders',
+        '/api/correspondence/': 'correspondence',
+    }
+
+    def setUp(self):
+        leads = create_leads(self.agent, 3, notes=2)
+        leads[0].description = ''
+        leads[0].value = None
+        leads[0].save()
+        for contact in Contact.objects.all():
+            Correspondence.objects.create(contact=contact, type='call', created_by=self.agent, duration=5)
+        Correspondence.objects.create(contact=contact, type='email', created_by=self.manager, notes='Sent the deck')
+
+    def test_compiled_rows_equal_the_drf_serializer_output(self):
+        for user in (self.manager, self.agent):
+            client = client_for(user)
+            for path, key in self.LISTS.items():
+                with self.subTest(path=path, user=user.username):
+                    with override_settings(COMPILED_LIST_SERIALIZERS=True):
+                        compiled = client.get(path).json()
+                    with override_settings(COMPILED_LIST_SERIALIZERS=False):
+                        drf = client.get(path).json()
+                    self.assertTrue(drf[key])
+                    self.assertEqual(compiled, drf)
+
+    def test_timestamp_formats(self):
+        client = client_for(self.manager)
+        iso = client.get('/api/notes/', {'timestamps': 'iso'}).json()['notes'][0]
+        epoch = client.get('/api/notes/', {'timestamps': 'epoch'}).json()['notes'][0]
+        note = Note.objects.get(pk=iso['id'])
+        self.assertEqual(iso['created_at'], note.created_at.isoformat().replace('+00:00', 'Z'))
+        self.assertEqual(epoch['created_at'], note.created_at.timestamp())
+        self.assertEqual(client.get('/api/notes/', {'timestamps': 'unix'}).status_code, 400)
+
+
+@override_settings(AUDIT_DURABILITY='sync')
+class TimelineTests(CRMTestCase):
+    def setUp(self):
+        self.lead = Lead.objects.create(name='Acme', owner=self.agent, value=1000)
+        contact = Contact.objects.create(name='Ann', email='ann@example.com', linked_lead=self.lead)
+        start = timezone.now() - timedelta(days=1)
+        self.expected = []
+        # Two items share each timestamp, so ties are broken by kind and id.
+        for minute, (kind, make) in enumerate([
+            ('note', lambda: Note.objects.create(lead=self.lead, created_by=self.agent, content='Called')),
+            ('reminder', lambda: Reminder.objects.create(
+                lead=self.lead, created_by=self.agent, message='Follow up', scheduled_time=start,
+            )),
+            ('correspondence', lambda: Correspondence.objects.create(contact=contact, type='call', created_by=self.agent)),
+            ('audit', lambda: AuditTrail.objects.create(
+                user=self.agent, action='update', model='crm.Lead', object_id=str(self.lead.pk),
+            )),
+        ] * 2):
+            instance = make()
+            type(instance).objects.filter(pk=instance.pk).update(created_at=start + timedelta(minutes=minute // 2))
+            self.expected.append((start + timedelta(minutes=minute // 2), kind, instance.pk))
+        AuditTrail.objects.create(user=self.manager, action='update', model='crm.Lead', object_id=str(self.lead.pk))
+        self.expected.sort(reverse=True)
+        self.url = f'/api/leads/{self.lead.pk}/timeline/'
+
+    def test_pages_follow_the_merged_order_both_ways(self):
+        client = client_for(self.agent)
+        pages = []
+        params = {'rows': 3}
+        while True:
+            with self.assertNumQueries(5):
+                body = client.get(self.url, params).json()
+            pages.append([(item['type'], item['data']['id']) for item in body['timeline']])
+            if not body['next_cursor']:
+                break
+            params = {'rows': 3, 'cursor': body['next_cursor']}
+
+        # The agent does not see the manager's audit entry.
+        self.assertEqual(sum(pages, []), [(kind, pk) for _, kind, pk in self.expected])
+        self.assertEqual([len(page) for page in pages], [3, 3, 2])
+
+        previous = client.get(self.url, {'rows': 3, 'cursor': body['prev_cursor']}).json()
+        self.assertEqual([(item['type'], item['data']['id']) for item in previous['timeline']], pages[-2])
+
+    def test_managers_see_every_audit_entry_and_other_agents_are_refused(self):
+        body = client_for(self.manager).get(self.url, {'rows': 50}).json()
+        self.assertEqual(len(body['timeline']), len(self.expected) + 1)
+        other = get_user_model().objects.create_user('other', 'other@example.com', 'pass', role='AGENT')
+        self.assertEqual(client_for(other).get(self.url).status_code, 403)
+        self.assertEqual(client_for(self.manager).get('/api/leads/0/timeline/').status_code, 404)
+
+
+class ConditionalListTests(CRMTestCase):
+    def test_deleting_a_lead_changes_the_etag_and_if_modified_since_is_ignored(self):
+        leads = create_leads(self.manager, 3)
+        client = client_for(self.manager)
+        response = client.get('/api/leads/')
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(client.get('/api/leads/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        leads[0].delete()
+        self.assertEqual(client.get('/api/leads/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        response = client.get('/api/leads/', HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['leads']), 2)
+
+    def test_only_the_notes_of_the_page_version_it(self):
+        leads = create_leads(self.manager, 4)
+        client = client_for(self.manager)
+        for params in ({'rows': 2}, {'rows': 2, 'pagination': 'cursor'}):
+            with self.subTest(params=params):
+                response = client.get('/api/leads/', params)
+                etag = response['ETag']
+                on_page = {lead['id'] for lead in response.json()['leads']}
+                off_page = next(lead for lead in leads if lead.pk not in on_page)
+                on_page = next(lead for lead in leads if lead.pk in on_page)
+
+                off_page.notes.update(content='Edited', updated_at=timezone.now())
+                self.assertEqual(client.get('/api/leads/', params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                on_page.notes.update(content='Edited', updated_at=timezone.now())
+                self.assertEqual(client.get('/api/leads/', params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SearchTests(CRMTestCase):
+    def search(self, text):
+        return list(search_queryset(Lead.objects.order_by('-created_at'), text).values_list('name', flat=True))
+
+    def test_name_matches_rank_above_description_matches(self):
+        Lead.objects.create(name='Acme', owner=self.manager)
+        Lead.objects.create(name='Globex', description='Competes with acme on price', owner=self.manager)
+        self.assertEqual(self.search('acme'), ['Acme', 'Globex'])
+
+    def test_every_term_must_match_on_every_backend(self):
+        Lead.objects.create(name='Acme', description='Renewal due in May', owner=self.manager)
+        Lead.objects.create(name='Acme', owner=self.manager)
+        Lead.objects.create(name='Renewal', owner=self.manager)
+        self.assertEqual(self.search('acme renew'), ['Acme'])
+
+        fallback = BaseSearchBackend(connection).search(Lead.objects.all(), search_terms('acme renewal'))
+        self.assertEqual(list(fallback.values_list('description', flat=True)), ['Renewal due in May'])
+
+    def test_index_follows_create_update_and_delete(self):
+        lead = Lead.objects.create(name='Globex', owner=self.manager)
+        self.assertEqual(self.search('globex'), ['Globex'])
+        lead.name = 'Initech'
+        lead.save()
+        self.assertEqual((self.search('globex'), self.search('initech')), ([], ['Initech']))
+        lead.delete()
+        self.assertEqual(self.search('initech'), [])
+
+    def test_ranked_queryset_works_as_a_subquery(self):
+        lead = Lead.objects.create(name='Acme', owner=self.manager)
+        Contact.objects.create(name='Jane', email='jane@example.com', linked_lead=lead)
+        leads = search_queryset(Lead.objects.all(), 'acme')
+        self.assertEqual(Contact.objects.filter(linked_lead__in=leads.values('pk')).count(), 1)
+
+    def test_search_with_cursor_pagination_is_rejected(self):
+        response = client_for(self.manager).get('/api/leads/', {'search': 'acme', 'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(AUDIT_DURABILITY='sync')
+class AuditDiffTests(CRMTestCase):
+    def setUp(self):
+        self.lead = Lead.objects.create(name='Acme', owner=self.manager, value=1000, description='Old')
+        self.client = client_for(self.manager)
+
+    def entries(self):
+        return list(AuditTrail.objects.filter(model='crm.Lead', object_id=str(self.lead.pk)).order_by('id'))
+
+    def test_an_update_records_only_the_changed_fields(self):
+        response = self.client.put('/api/leads/', {'id': self.lead.pk, 'description': 'New', 'value': '1000.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        [entry] = self.entries()
+        self.assertEqual((entry.action, entry.changes), ('update', {'description': ['Old', 'New']}))
+        self.assertIsNone(entry.old_value)
+        audit = client_for(self.manager).get('/api/audit/').json()['audit_entries']
+        self.assertEqual(audit[0]['changes'], {'description': ['Old', 'New']})
+
+    def test_an_update_changing_nothing_records_no_entry(self):
+        response = self.client.put('/api/leads/', {'id': self.lead.pk, 'description': 'Old', 'value': '1000'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.entries(), [])
+
+    def test_create_and_delete_record_the_non_empty_fields(self):
+        entry = build_audit_entry(self.manager, 'delete', self.lead)
+        self.assertEqual(entry.changes['name'], ['Acme', None])
+        self.assertNotIn('source', entry.changes)
+        entry = build_audit_entry(self.manager, 'create', self.lead)
+        self.assertEqual(entry.changes['owner_id'], [None, self.manager.pk])
+
+
+class AuditBufferTests(CRMTestCase):
+    def setUp(self):
+        self.buffer = AuditBuffer()
+        # No writer thread: entries stay queued until flushed.
+        for patcher in (
+            mock.patch.object(self.buffer, '_ensure_worker'),
+            mock.patch('apps.crm.services.audit.audit_buffer', self.buffer),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @override_settings(AUDIT_DURABILITY='buffered')
+    def test_queued_entries_are_written_on_worker_shutdown_with_their_build_time(self):
+        lead = Lead.objects.create(name='Acme', owner=self.manager, value=1000)
+        entry = build_audit_entry(self.manager, 'create', lead)
+        built_at = entry.created_at
+        with self.captureOnCommitCallbacks(execute=True):
+            save_audit_entries([entry, None])
+        self.assertFalse(AuditTrail.objects.filter(object_id=str(lead.pk)).exists())
+
+        worker_process_shutdown.send(sender=None)
+
+        self.assertEqual(list(AuditTrail.objects.filter(object_id=str(lead.pk)).values_list('created_at', flat=True)), [built_at])
+        self.assertTrue(self.buffer._queue.empty())
+
+
+@override_settings(AUDIT_DURABILITY='sync')
+class AuditStorageTestCase(CRMTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.this_month = audit_archive.month_start(timezone.localdate())
+
+    def months_ago(self, count):
+        month = self.this_month
+        for _ in range(count):
+            month = audit_archive.month_start(month - timedelta(days=1))
+        return month
+
+    def months_ahead(self, count):
+        month = self.this_month
+        for _ in range(count):
+            month = audit_archive.next_month(month)
+        return month
+
+    def add_entry(self, month, object_id='1'):
+        return AuditTrail.objects.create(
+            user=self.manager, action='update', model='Lead', object_id=object_id,
+            created_at=audit_archive.month_bounds(month)[0] + timedelta(days=1),
+        )
+
+
+class AuditArchiveTests(AuditStorageTestCase):
+
+    def test_archive_month_moves_the_rows_to_a_file(self):
+        old = self.months_ago(2)
+        self.add_entry(old, '1')
+        self.add_entry(old, '2')
+        self.add_entry(self.this_month, '3')
+
+        archive = audit_archive.archive_month(old, self.directory.name)
+
+        self.assertEqual(archive.row_count, 2)
+        self.assertTrue(os.path.exists(archive.path))
+        self.assertEqual(list(AuditTrail.objects.values_list('object_id', flat=True)), ['3'])
+        rows = list(audit_archive.iter_archived_entries())
+        self.assertEqual(sorted(row['object_id'] for row in rows), ['1', '2'])
+        self.assertEqual({row['username'] for row in rows}, {'manager'})
+        with self.assertRaises(ValueError):
+            audit_archive.archive_month(old, self.directory.name)
+
+    def test_the_current_month_is_not_archived(self):
+        with self.assertRaises(ValueError):
+            audit_archive.archive_month(self.this_month, self.directory.name)
+
+    def test_archive_before_rolls_over_every_older_month(self):
+        for months in (5, 3, 1):
+            self.add_entry(self.months_ago(months))
+
+        archives = audit_archive.archive_before(self.months_ago(1), self.directory.name)
+
+        self.assertEqual([a.month for a in archives], [self.months_ago(5), self.months_ago(4), self.months_ago(3), self.months_ago(2)])
+        self.assertEqual([a.row_count for a in archives], [1, 0, 1, 0])
+        self.assertEqual(AuditTrail.objects.count(), 1)
+        self.assertEqual(AuditArchive.objects.count(), 4)
+        self.assertEqual(audit_archive.archive_before(self.months_ago(1), self.directory.name), [])
+
+    def test_audit_api_reads_archived_entries_after_the_hot_ones(self):
+        self.add_entry(self.months_ago(2), 'archived')
+        self.add_entry(self.this_month, 'hot')
+        audit_archive.archive_before(self.this_month, self.directory.name)
+
+        response = client_for(self.manager).get('/api/audit/', {'include_archived': 'true'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['object_id'] for row in response.json()['audit_entries']], ['hot', 'archived'])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'audit partitioning is PostgreSQL-only')
+class AuditPartitionTests(AuditStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.legacy_entry = self.add_entry(self.months_ago(2), 'legacy')
+        self.assertTrue(audit_archive.convert_to_partitioned())
+
+    def partition_rows(self, suffix):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT object_id FROM "{audit_archive.partition_name(suffix)}" ORDER BY id')
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_conversion_keeps_the_rows_and_creates_the_upcoming_partitions(self):
+        self.assertTrue(audit_archive.is_partitioned())
+        self.assertFalse(audit_archive.convert_to_partitioned())
+        self.assertEqual(self.partition_rows(audit_archive.LEGACY_PARTITION), ['legacy'])
+        self.assertEqual(AuditTrail.objects.get().pk, self.legacy_entry.pk)
+        entry = self.add_entry(self.months_ahead(1), 'next')
+        self.assertGreater(entry.pk, self.legacy_entry.pk)
+        self.assertEqual(self.partition_rows(self.months_ahead(1)), ['next'])
+        with connection.cursor() as cursor:
+            for index in AuditTrail._meta.indexes:
+                self.assertTrue(audit_archive._table_exists(cursor, index.name))
+
+    def test_ensure_partitions_moves_stranded_rows_out_of_default(self):
+        far = self.months_ahead(settings.AUDIT_PARTITION_MONTHS_AHEAD + 2)
+        self.add_entry(far, 'stranded')
+        self.assertEqual(self.partition_rows(audit_archive.DEFAULT_PARTITION), ['stranded'])
+
+        created = audit_archive.ensure_partitions(months_ahead=settings.AUDIT_PARTITION_MONTHS_AHEAD + 2)
+
+        self.assertIn(audit_archive.partition_name(far), created)
+        self.assertEqual(self.partition_rows(far), ['stranded'])
+        self.assertEqual(self.partition_rows(audit_archive.DEFAULT_PARTITION), [])
+        self.assertEqual(audit_archive.ensure_partitions(months_ahead=settings.AUDIT_PARTITION_MONTHS_AHEAD + 2), [])
+
+    def test_archiving_a_partitioned_month_drops_its_partition(self):
+        # Partitions only exist from the current month on; backdate the clock
+        # so next month counts as past.
+        month = self.months_ahead(1)
+        self.add_entry(month, 'next')
+        with mock.patch('apps.crm.services.audit_archive.timezone.localdate', return_value=self.months_ahead(2)):
+            archive = audit_archive.archive_month(month, self.directory.name)
+        self.assertEqual(archive.row_count, 1)
+        with connection.cursor() as cursor:
+            self.assertFalse(audit_archive._table_exists(cursor, audit_archive.partition_name(month)))
+
+
+class ScriptedChangeFeed(BaseChangeFeed):
+    """
+        Replays `events` to every subscriber, then ends the stream.
+    """
+    events = []
+
+    def publish(self, events):
+        pass
+
+    def subscribe(self, timeout):
+        yield from self.events
+
+
+@override_settings(
+    CHANGE_FEED_BACKEND='apps.crm.tests.ScriptedChangeFeed', CHANGE_FEED_WSGI_STREAMS=True, WEB_CONCURRENCY=1,
+)
+class ChangeFeedTests(CRMTestCase):
+    def setUp(self):
+        reset_change_feed()
+        self.addCleanup(reset_change_feed)
+        ScriptedChangeFeed.events = [
+            {'model': 'lead', 'action': 'update', 'id': 1, 'lead': 1, 'owner': self.manager.pk, 'at': 'now'},
+            {'model': 'note', 'action': 'create', 'id': 2, 'lead': 2, 'owner': self.agent.pk, 'at': 'now'},
+            {'model': 'lead', 'action': 'create', 'id': 2, 'lead': 2, 'owner': self.agent.pk, 'at': 'now'},
+        ]
+
+    def received(self, client, params=None):
+        response = client.get('/api/changes/', params or {})
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content).decode()
+        return [
+            (event['model'], event['id'])
+            for event in (json.loads(line[len('data: '):]) for line in body.splitlines() if line.startswith('data: '))
+        ]
+
+    def test_agents_only_see_their_own_leads(self):
+        self.assertEqual(self.received(client_for(self.agent)), [('note', 2), ('lead', 2)])
+        self.assertEqual(len(self.received(client_for(self.manager))), 3)
+
+    def test_models_narrow_the_stream(self):
+        self.assertEqual(self.received(client_for(self.manager), {'models': 'lead'}), [('lead', 1), ('lead', 2)])
+
+    def test_unknown_models_are_rejected(self):
+        response = client_for(self.manager).get('/api/changes/', {'models': 'lead,invoice'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_token_authenticates_only_the_feed(self):
+        token = client_for(self.agent).post('/api/changes/token/').json()['token']
+        self.assertEqual(self.received(APIClient(), {'token': token}), [('note', 2), ('lead', 2)])
+
+        stream_client = APIClient()
+        stream_client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(stream_client.get('/api/leads/').status_code, 401)
+        access = str(tokens_for_user(self.agent).access_token)
+        self.assertEqual(APIClient().get('/api/changes/', {'token': access}).status_code, 401)
+
+    @override_settings(CHANGE_FEED_WSGI_STREAMS=False)
+    def test_sync_workers_refuse_to_stream(self):
+        self.assertEqual(client_for(self.manager).get('/api/changes/').status_code, 501)
+
+    @override_settings(CHANGE_FEED_BACKEND='apps.crm.services.changefeed.InMemoryChangeFeed', WEB_CONCURRENCY=4)
+    def test_in_memory_feed_refuses_several_processes(self):
+        reset_change_feed()
+        self.assertEqual(client_for(self.manager).get('/api/changes/').status_code, 501)
+
+
+class DashboardInvalidationTests(CRMTestCase):
+    def test_generation_rotates_when_the_write_commits(self):
+        invalidate_dashboard()
+        generation = cache.get(GENERATION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Lead.objects.create(name='Acme', owner=self.manager)
+                self.assertEqual(cache.get(GENERATION_KEY), generation)
+        self.assertNotEqual(cache.get(GENERATION_KEY), generation)
+
+
+class RecordingBackend(BaseDeliveryBackend):
+    def __init__(self, fail=(), on_send=None):
+        self.fail = set(fail)
+        self.on_send = on_send
+        self.claimed = {}
+
+    def send(self, reminder):
+        self.claimed[reminder.pk] = Reminder.objects.values_list('claimed_at', flat=True).get(pk=reminder.pk)
+        if self.on_send:
+            self.on_send(reminder)
+        if reminder.pk in self.fail:
+            raise RuntimeError('SMTP unavailable')
+
+
+class ReminderDispatchTests(CRMTestCase):
+    def setUp(self):
+        lead = Lead.objects.create(name='Acme', owner=self.manager)
+        self.reminders = [
+            Reminder.objects.create(
+                lead=lead, created_by=self.manager, message=f'Call {i}',
+                scheduled_time=timezone.now() - timedelta(minutes=1),
+            )
+            for i in range(3)
+        ]
+
+    def dispatch(self, backend):
+        with mock.patch('apps.crm.services.reminders.get_delivery_backend', return_value=backend):
+            return dispatch_due_reminders()
+
+    def test_claims_commit_before_delivery_and_outcomes_are_recorded(self):
+        failing = self.reminders[1].pk
+        backend = RecordingBackend(fail=[failing])
+        self.assertEqual(self.dispatch(backend), {'sent': 2, 'failed': 0, 'retrying': 1})
+        self.assertTrue(all(backend.claimed.values()))
+
+        statuses = dict(Reminder.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[failing], Reminder.Status.PENDING)
+        self.assertEqual(list(statuses.values()).count(Reminder.Status.SENT), 2)
+        self.assertFalse(Reminder.objects.filter(claimed_at__isnull=False).exists())
+        self.assertEqual(Reminder.objects.get(pk=failing).attempts, 1)
+
+    def test_unexpired_claims_are_skipped(self):
+        Reminder.objects.filter(pk=self.reminders[0].pk).update(claimed_at=timezone.now())
+        self.assertEqual(self.dispatch(RecordingBackend())['sent'], 2)
+        Reminder.objects.filter(pk=self.reminders[0].pk).update(claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.dispatch(RecordingBackend())['sent'], 1)
+
+    def test_reminder_cancelled_during_delivery_stays_cancelled(self):
+        cancelled = self.reminders[0].pk
+
+        def cancel(reminder):
+            if reminder.pk == cancelled:
+                Reminder.objects.filter(pk=cancelled).update(status=Reminder.Status.CANCELLED)
+
+        self.dispatch(RecordingBackend(on_send=cancel))
+        self.assertEqual(Reminder.objects.get(pk=cancelled).status, Reminder.Status.CANCELLED)
+
+
+@override_settings(WEBHOOK_SETTLE_SECONDS=0)
+class WebhookDeliveryTests(CRMTestCase):
+    def setUp(self):
+        OutboxEvent.objects.all().delete()
+        self.endpoint = WebhookEndpoint.objects.create(url='https://hooks.example.com/crm', secret='s3cret')
+        self.posted = []
+        patcher = mock.patch('apps.crm.services.outbox.post_events', side_effect=self.post)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.fail_with = None
+        self.atomic_depth = len(connection.atomic_blocks)
+
+    def post(self, endpoint, events, first_id, last_id):
+        # No transaction of its own, and the endpoint stays claimed meanwhile.
+        self.assertEqual(len(connection.atomic_blocks), self.atomic_depth)
+        self.assertGreater(WebhookEndpoint.objects.get(pk=endpoint.pk).next_attempt_at, timezone.now())
+        self.posted.append(events)
+        if self.fail_with:
+            raise self.fail_with
+
+    def test_delivery_advances_the_cursor_and_prunes(self):
+        lead = Lead.objects.create(name='Acme', owner=self.manager, value=1000)
+        lead.name = 'Acme Corp'
+        lead.save()
+        last_id = OutboxEvent.objects.latest('id').id
+
+        counts = dispatch_webhooks()
+
+        self.assertEqual(counts, {'read': 2, 'delivered': 2, 'failed': 0, 'pruned': 2})
+        [events] = self.posted
+        self.assertEqual([(e['action'], e['data']['name']) for e in events], [('create', 'Acme Corp')])
+        self.endpoint.refresh_from_db()
+        self.assertEqual((self.endpoint.last_event_id, self.endpoint.failures, self.endpoint.next_attempt_at), (last_id, 0, None))
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_a_create_followed_by_a_delete_sends_nothing(self):
+        Lead.objects.create(name='Acme', owner=self.manager, value=1000).delete()
+        last_id = OutboxEvent.objects.latest('id').id
+
+        counts = dispatch_webhooks()
+
+        self.assertEqual(counts['delivered'], 2)
+        self.assertEqual(self.posted, [])
+        self.endpoint.refresh_from_db()
+        self.assertEqual(self.endpoint.last_event_id, last_id)
+
+    def test_failure_backs_off_and_keeps_the_events(self):
+        Lead.objects.create(name='Acme', owner=self.manager, value=1000)
+        self.fail_with = ConnectionError('refused')
+
+        counts = dispatch_webhooks()
+
+        self.assertEqual((counts['failed'], counts['pruned']), (1, 0))
+        self.endpoint.refresh_from_db()
+        self.assertEqual((self.endpoint.last_event_id, self.endpoint.failures), (0, 1))
+        self.assertGreater(self.endpoint.next_attempt_at, timezone.now())
+        self.assertEqual(self.endpoint.last_error, 'refused')
+        # Backing off: the next run leaves it alone.
+        self.assertEqual(dispatch_webhooks()['read'], 0)
+        self.assertEqual(len(self.posted), 1)
+
+    def test_a_claimed_endpoint_is_skipped_until_the_claim_expires(self):
+        Lead.objects.create(name='Acme', owner=self.manager, value=1000)
+        WebhookEndpoint.objects.filter(pk=self.endpoint.pk).update(next_attempt_at=timezone.now() + timedelta(seconds=30))
+        self.assertEqual(dispatch_webhooks()['read'], 0)
+
+        WebhookEndpoint.objects.filter(pk=self.endpoint.pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(dispatch_webhooks()['delivered'], 1)
+
+
+class ContactImportTests(CRMTestCase):
+    def test_agent_cannot_take_over_another_users_contact(self):
+        manager_lead = Lead.objects.create(name='Manager lead', owner=self.manager)
+        agent_lead = Lead.objects.create(name='Agent lead', owner=self.agent)
+        contact = Contact.objects.create(name='Jane', email='jane@example.com', linked_lead=manager_lead)
+
+        csv = f'name,email,linked_lead\nHijacked,JANE@example.com,{agent_lead.pk}\n'
+        report = import_csv('contacts', StringIO(csv), self.agent).as_dict()
+
+        self.assertEqual((report['updated'], report['created'], report['failed']), (0, 0, 1))
+        self.assertEqual(report['errors'][0]['row'], 2)
+        contact.refresh_from_db()
+        self.assertEqual((contact.name, contact.linked_lead_id), ('Jane', manager_lead.pk))
+
+    def test_agent_updates_own_contact_and_manager_any(self):
+        agent_lead = Lead.objects.create(name='Agent lead', owner=self.agent)
+        contact = Contact.objects.create(name='Jane', email='jane@example.com', linked_lead=agent_lead)
+
+        csv = f'name,email,linked_lead\nJane Doe,jane@example.com,{agent_lead.pk}\n'
+        self.assertEqual(import_csv('contacts', StringIO(csv), self.agent).updated, 1)
+        csv = f'name,email,linked_lead\nJ. Doe,jane@example.com,{agent_lead.pk}\n'
+        self.assertEqual(import_csv('contacts', StringIO(csv), self.manager).updated, 1)
+        contact.refresh_from_db()
+        self.assertEqual(contact.name, 'J. Doe')
+
+
+class LeadSummaryViewTests(CRMTestCase):
+    def setUp(self):
+        self.lead = create_leads(self.agent, 1, notes=2)[0]
+        # Generated summaries are cached by lead id, which later tests reuse.
+        self.addCleanup(cache.clear)
+
+    def summaries(self, lead_id):
+        """
+            (sync, async) responses of the summary endpoint for the agent.
+        """
+        factory = APIRequestFactory()
+        responses = []
+        for view, call in ((LeadGenericAPIView, lambda view, request: view(request, id=lead_id)),
+                           (LeadAsyncAPIView, lambda view, request: async_to_sync(view)(request, id=lead_id))):
+            request = factory.get(f'/api/leads/{lead_id}/summary/')
+            force_authenticate(request, user=self.agent)
+            response = call(view.as_view(), request)
+            response.render()
+            responses.append(response)
+        return responses
+
+    def test_sync_and_async_handlers_answer_alike(self):
+        with mock.patch.object(ai_summary_service, 'model', StubModel()):
+            sync, asynchronous = self.summaries(self.lead.pk)
+        self.assertEqual(sync['ETag'], asynchronous['ETag'])
+        self.assertEqual(sync.status_code, 200)
+        sync, asynchronous = json.loads(sync.content), json.loads(asynchronous.content)
+        # The async handler reuses the summary the sync one stored.
+        self.assertEqual((sync.pop('cached'), asynchronous.pop('cached')), (False, True))
+        self.assertEqual(sync, asynchronous)
+        self.assertEqual([r.status_code for r in self.summaries(0)], [404, 404])
+
+    def test_errors_are_logged_not_returned(self):
+        failure = RuntimeError('password=hunter2')
+        with mock.patch('apps.crm.services.ai_summary.cached_summarize_notes', side_effect=failure), \
+                mock.patch('apps.crm.services.ai_summary.acached_summarize_notes', side_effect=failure), \
+                self.assertLogs('apps.crm.views.lead', 'ERROR') as logs:
+            responses = self.summaries(self.lead.pk)
+
+        for response in responses:
+            self.assertEqual(response.status_code, 500)
+            self.assertEqual(json.loads(response.content), {'error': 'Error generating summary'})
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn('hunter2', logs.output[0])
+
+
+@override_settings(AI_SUMMARY_WINDOW_TOKENS=300)
+class SummaryBatchTests(CRMTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_window_and_reduce_calls_each_take_a_token(self):
+        lead = Lead.objects.create(name='Acme', owner=self.manager)
+        notes = [f'{i} ' + 'Discussed pricing and the renewal. ' * 20 for i in range(6)]
+        Note.objects.bulk_create([Note(lead=lead, created_by=self.manager, content=note) for note in notes])
+        windows = len(note_windows(notes, 300))
+        self.assertGreater(windows, 1)
+
+        acquire = mock.AsyncMock()
+        with mock.patch.object(ai_summary_service, 'model', StubModel()), \
+                mock.patch.object(TokenBucket, 'acquire', acquire):
+            counts = summarize_leads(lead_ids=[lead.pk], force=True)
+        self.assertEqual(counts['summarized'], 1)
+        self.assertEqual(acquire.await_count, windows + 1)
+
+
+class CannedModel:
+    def __init__(self, text):
+        self.text = text
+        self.prompts = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return mock.Mock(text=self.text)
+
+
+@override_settings(AI_SUMMARY_WINDOW_TOKENS=300)
+class MapReduceSummaryTests(TestCase):
+    notes = [f'{i} ' + 'Discussed pricing and the renewal. ' * 20 for i in range(6)]
+
+    def setUp(self):
+        cache.clear()
+
+    def summarize(self, model):
+        with mock.patch.object(ai_summary_service, 'model', model):
+            return ai_summary_service.summarize_notes(self.notes, 'Acme')
+
+    def test_final_prompt_fits_when_summaries_cannot_be_merged(self):
+        model = CannedModel('x' * 1000)
+        self.summarize(model)
+        context = model.prompts[-1].split('following notes:')[1].split('Please provide:')[0]
+        self.assertLessEqual(estimate_tokens(context.strip()), 300)
+
+    def test_fallback_window_summaries_are_not_cached(self):
+        model = CannedModel('')
+        self.summarize(model)
+        calls = len(model.prompts)
+        self.summarize(model)
+        self.assertEqual(len(model.prompts), 2 * calls)
+
+
+class FastJSONTests(TestCase):
+    PAYLOAD = {
+        'aware': datetime.datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc),
+        'offset': datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone(timedelta(hours=2))),
+        'naive': datetime.datetime(2024, 1, 2, 3, 4, 5),
+        'date': datetime.date(2024, 1, 2),
+        'time': datetime.time(1, 2, 3, 4567),
+        'decimal': decimal.Decimal('10.50'),
+        'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'duration': timedelta(seconds=90),
+        'lazy': gettext_lazy('Lead'),
+        'error': [ErrorDetail('This field is required.', code='required')],
+        'text': 'Café \u2028 \u2029 "quoted" </script>',
+        1: 'int key',
+        'nested': [{'value': 1.5, 'none': None, 'flag': True}],
+    }
+
+    @skipUnless(fastjson.orjson, 'orjson is not installed')
+    def test_output_matches_the_drf_renderer(self):
+        self.assertIsNotNone(fastjson.dumps(self.PAYLOAD))
+        self.assertEqual(FastJSONRenderer().render(self.PAYLOAD), JSONRenderer().render(self.PAYLOAD))
+
+    def test_values_orjson_rejects_fall_back_to_the_drf_renderer(self):
+        payload = {**self.PAYLOAD, 'big': 2 ** 70}
+        self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload))
+        with mock.patch('core.fastjson.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.PAYLOAD), JSONRenderer().render(self.PAYLOAD))
+
+    def test_indented_output_falls_back_to_the_drf_renderer(self):
+        media_type = 'application/json; indent=2'
+        self.assertEqual(
+            FastJSONRenderer().render(self.PAYLOAD, media_type), JSONRenderer().render(self.PAYLOAD, media_type),
+        )
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_parser_matches_the_drf_parser(self):
+        body = JSONRenderer().render({'name': 'Café', 'values': [1, 2.5, None], 'big': 2 ** 70})
+        self.assertEqual(FastJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body)))
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(BytesIO(b'{"name": '))
+
+    def test_api_responses_round_trip(self):
+        manager = get_user_model().objects.create_user('manager', 'manager@example.com', 'pass', role='MANAGER')
+        response = client_for(manager).post(
+            '/api/leads/', json.dumps({'name': 'Café ☕', 'value': '10.5'}), content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(Lead.objects.get().name, 'Café ☕')
+
+
+class RequestMetricsTests(CRMTestCase):
+    def test_outer_execute_wrapper_counts_each_query_once_and_is_removed(self):
+        create_leads(self.manager, 3)
+        client = client_for(self.manager)
+        calls = []
+
+        def counter(execute, sql, params, many, context):
+            calls.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(counter):
+            for _ in range(2):
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get('/api/leads/')
+                self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(calls), 2 * len(queries))
+        self.assertNotIn(counter, connection.execute_wrappers)
+        self.assertEqual(connection.execute_wrappers[:1], [_record_query])
+        self.assertEqual(connection.execute_wrappers.count(_record_query), 1)
+
+    def test_server_timing_reports_the_query_count(self):
+        create_leads(self.manager, 3)
+        response = client_for(self.manager).get('/api/leads/')
+        self.assertIn(f'desc="{LeadListQueryTests.LIST_QUERIES} queries"', response['Server-Timing'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], AUDIT_DURABILITY='sync', WEB_CONCURRENCY=1)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+        `replica` is a second connection to the test database (in-memory
+        SQLite shares it between connections), so every read it serves is
+        visible in its own query log. Hence committed data, not TestCase.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings['replica'] = {**connections['default'].settings_dict, 'TEST': {'MIRROR': 'default'}}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        _health.clear()
+        self.manager = get_user_model().objects.create_user('manager', 'manager@example.com', 'pass', role='MANAGER')
+        create_leads(self.manager, 2)
+        self.client = client_for(self.manager)
+
+    def replica_queries(self, method, path, **kwargs):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = getattr(self.client, method)(path, **kwargs)
+        self.assertLess(response.status_code, 300)
+        return len(queries)
+
+    def test_reads_use_the_replica_until_the_user_writes(self):
+        self.assertGreater(self.replica_queries('get', '/api/leads/'), 0)
+        self.assertEqual(
+            self.replica_queries('post', '/api/leads/', data={'name': 'New', 'value': '10', 'status': 'NEW'}), 0,
+        )
+        self.assertEqual(self.replica_queries('get', '/api/leads/'), 0)
+
+    @override_settings(WEB_CONCURRENCY=2)
+    def test_a_per_process_cache_keeps_reads_on_the_primary(self):
+        self.assertEqual(self.replica_queries('get', '/api/leads/'), 0)
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        self.ctx = seed(leads=10)
+        self.scenarios = {scenario.name: scenario for scenario in build_scenarios()}
+
+    def run_scenario(self, name):
+        return run_scenario(self.scenarios[name], self.ctx, iterations=3, warmup=1, alloc_iterations=1)
+
+    def test_query_counts_are_per_request_under_an_outer_wrapper(self):
+        def passthrough(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(passthrough):
+            result = self.run_scenario('leads.list')
+        self.assertTrue(result['ok'])
+        self.assertEqual((result['queries'], result['queries_max']), (LeadListQueryTests.LIST_QUERIES,) * 2)
+
+    @override_settings(CHANGE_FEED_WSGI_STREAMS=True)
+    def test_change_feed_scenario_reads_the_opening_chunk(self):
+        result = self.run_scenario('changes')
+        self.assertTrue(result['ok'])
+        self.assertEqual(result['route'], 'changes')
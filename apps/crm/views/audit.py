@@ -1,26 +1,173 @@
+import math
+from itertools import islice
+
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 from apps.crm.models import AuditTrail
 from apps.crm.serializers import AuditEntrySerializer
+from apps.crm.pagination import is_cursor_request, paginate
+from apps.crm.services.audit_archive import archives_between, count_archived, iter_archive, parse_bound
+from apps.crm.services.export import stream_export
 from rest_framework import generics, permissions, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from django.core.paginator import Paginator, EmptyPage
 from django.db.models import Q
 
 
 class AuditGenericAPIView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = AuditEntrySerializer
+    query_budget = 5
+    replica_reads = True
 
     def get(self, request):
+        audit_entries = self.get_list_queryset(request).select_related('user')
+
+        if request.query_params.get('include_archived', '').lower() in ('1', 'true', 'yes'):
+            audit_page, pagination = self.paginate_with_archive(request, audit_entries)
+        else:
+            audit_page, pagination = paginate(request, audit_entries, ['-created_at', 'id'])
+            audit_page = [self.entry_values(entry) for entry in audit_page]
+
+        # Format results for response
+        results = []
+        for entry in audit_page:
+            def truncate_val(val, length=65):
+                if not val:
+                    return "—"
+                val_str = str(val)
+                return val_str if len(val_str) <= length else val_str[:length] + "…"
+
+            old_value, new_value, changes = entry['old_value'], entry['new_value'], entry.get('changes')
+            if changes is not None:
+                # Diff-only entries: show the before/after sides of the changed fields.
+                old_value = {name: pair[0] for name, pair in changes.items() if pair[0] is not None}
+                new_value = {name: pair[1] for name, pair in changes.items() if pair[1] is not None}
+
+            results.append({
+                'id': entry['id'],
+                'user': entry['username'],
+                'action': entry['action'],
+                'model': entry['model'],
+                'object_id': entry['object_id'],
+                'old_value': truncate_val(old_value, 65),
+                'new_value': truncate_val(new_value, 65),
+                'changes': changes,
+                'ip_address': entry['ip_address'],
+                'user_agent': entry['user_agent'],
+                'timestamp': entry['created_at'],
+            })
+
+
+        # Validate with serializer for schema consistency
+        serializer = self.get_serializer(results, many=True)
+
+        return Response({
+            'message': "Audit Trail Fetched Successfully",
+            "audit_entries": serializer.data,
+            **pagination,
+        }, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def entry_values(entry):
+        return {
+            'id': entry.id,
+            'username': getattr(entry.user, 'username', None),
+            'action': entry.action,
+            'model': entry.model,
+            'object_id': entry.object_id,
+            'old_value': entry.old_value,
+            'new_value': entry.new_value,
+            'changes': entry.changes,
+            'ip_address': entry.ip_address,
+            'user_agent': entry.user_agent,
+            'created_at': entry.created_at,
+        }
+
+    def paginate_with_archive(self, request, audit_entries):
+        """
+            Page through the hot entries followed by the archived months, both
+            newest first. Per-archive match counts are cached, so only the
+            archives holding the requested slice are read.
+        """
+        if is_cursor_request(request):
+            raise ValidationError({'include_archived': 'Archived entries are only available with page pagination.'})
+
+        page = int(request.query_params.get('page', 1))
+        rows = int(request.query_params.get('rows', 25))
+        offset = (page - 1) * rows
+
+        hot_total = audit_entries.count()
+        items = [self.entry_values(entry) for entry in audit_entries[offset:offset + rows]] if offset < hot_total else []
+
+        skip = max(offset - hot_total, 0)
+        predicate = self.archive_predicate(request)
+        date_from = parse_bound(request.query_params.get('date_from'))
+        date_to = parse_bound(request.query_params.get('date_to'))
+        filter_key = self.archive_filter_key(request, date_from, date_to)
+
+        archived_total = 0
+        for archive in archives_between(date_from, date_to):
+            count = count_archived(archive, filter_key, predicate, date_from, date_to)
+            wanted = rows - len(items)
+            if wanted > 0 and skip < archived_total + count:
+                start = max(skip - archived_total, 0)
+                items.extend(islice(iter_archive(archive, predicate, date_from, date_to), start, start + wanted))
+            archived_total += count
+
+        total = hot_total + archived_total
+        return items, {
+            "current_page": page,
+            "last_page": max(math.ceil(total / rows), 1),
+            "total": total,
+        }
+
+    def archive_filter_key(self, request, date_from, date_to):
+        """
+            Identifies the filters archive_predicate() and the dates apply.
+        """
+        agent_id = request.user.pk if hasattr(request.user, 'is_agent') and request.user.is_agent() else None
+        return '|'.join(str(value) for value in (
+            request.query_params.get('user') or '',
+            (request.query_params.get('model') or '').lower(),
+            (request.query_params.get('action') or '').lower(),
+            agent_id,
+            date_from and date_from.isoformat(),
+            date_to and date_to.isoformat(),
+        ))
+
+    def archive_predicate(self, request):
+        """
+            The non-date filters of get_list_queryset, applied to archived rows.
+        """
+        user = request.query_params.get('user')
+        model = (request.query_params.get('model') or '').lower()
+        action = (request.query_params.get('action') or '').lower()
+        agent_id = request.user.pk if hasattr(request.user, 'is_agent') and request.user.is_agent() else None
+
+        def predicate(row):
+            if user and str(row['user_id']) != user:
+                return False
+            if model and model not in row['model'].lower():
+                return False
+            if action and row['action'].lower() != action:
+                return False
+            if agent_id is not None and row['user_id'] != agent_id:
+                return False
+            return True
+
+        return predicate
+
+    def get_list_queryset(self, request):
+        """
+            Audit entries matching the request's filters, scoped to the caller.
+        """
         user = request.query_params.get('user')
         model = request.query_params.get('model')
         action = request.query_params.get('action')
         date_from = request.query_params.get('date_from')
         date_to = request.query_params.get('date_to')
-        page = int(request.query_params.get('page', 1))
-        rows = int(request.query_params.get('rows', 25))
 
         query = Q(pk__isnull=False)
 
@@ -37,43 +184,30 @@ class AuditGenericAPIView(generics.GenericAPIView):
 
         # Filter by user role
         if hasattr(request.user, 'is_agent') and request.user.is_agent():
-            query &= Q(user=request.user)
+            query &= Q(user_id=request.user.pk)
 
-        audit_entries = AuditTrail.objects.filter(query).select_related('user').order_by('-created_at')
+        return AuditTrail.objects.filter(query).order_by('-created_at')
 
-        paginator = Paginator(audit_entries, rows)
-        audit_page = paginator.page(page)
 
-        # Format results for response
-        results = []
-        for entry in audit_page:
-            def truncate_val(val, length=65):
-                if not val:
-                    return "—"
-                val_str = str(val)
-                return val_str if len(val_str) <= length else val_str[:length] + "…"
-
-            results.append({
-                'id': entry.id,
-                'user': getattr(entry.user, 'username', None),
-                'action': entry.action,
-                'model': entry.model,
-                'object_id': entry.object_id,
-                'old_value': truncate_val(entry.old_value, 65),
-                'new_value': truncate_val(entry.new_value, 65),
-                'ip_address': entry.ip_address,
-                'user_agent': entry.user_agent,
-                'timestamp': entry.created_at,
-            })
+class AuditExportAPIView(AuditGenericAPIView):
+    """
+        Stream the full (untruncated) audit trail matching the list filters.
+    """
+    http_method_names = ['get', 'head', 'options']
 
+    COLUMNS = [
+        ('id', 'id'),
+        ('user', 'user__username'),
+        ('action', 'action'),
+        ('model', 'model'),
+        ('object_id', 'object_id'),
+        ('old_value', 'old_value'),
+        ('new_value', 'new_value'),
+        ('changes', 'changes'),
+        ('ip_address', 'ip_address'),
+        ('user_agent', 'user_agent'),
+        ('timestamp', 'created_at'),
+    ]
 
-        # Validate with serializer for schema consistency
-        serializer = self.get_serializer(results, many=True)
-
-        return Response({
-            'message': "Audit Trail Fetched Successfully",
-            "audit_entries": serializer.data,
-            "current_page": page,
-            "last_page": paginator.num_pages,
-            "total": paginator.count,
-        }, status=status.HTTP_200_OK)
+    def get(self, request):
+        return stream_export(request, self.get_list_queryset(request), self.COLUMNS, 'audit')
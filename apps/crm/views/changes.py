@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from apps.accounts.authentication import ClaimsJWTAuthentication, QueryTokenAuthentication, stream_token_for
+from apps.crm.services.changefeed import FEED_MODELS, InMemoryChangeFeed, astream_changes, get_change_feed, stream_changes
+from core.fastjson import FastJSONRenderer
+
+
+class EventStreamRenderer(FastJSONRenderer):
+    """
+        Lets `Accept: text/event-stream` through content negotiation; errors
+        raised before the stream starts are still sent as JSON.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+
+class ChangeFeedAPIView(generics.GenericAPIView):
+    """
+        Server-sent events for lead, contact, note, reminder and correspondence
+        writes the caller can see. `?models=lead,note` narrows the stream.
+        Authenticates with the Bearer header or a `?token=` stream token.
+    """
+    authentication_classes = [QueryTokenAuthentication, ClaimsJWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, EventStreamRenderer]
+    http_method_names = ['get', 'options']
+    query_budget = 1
+
+    def get(self, request):
+        models = None
+        if request.query_params.get('models'):
+            models = set(request.query_params['models'].split(','))
+            unknown = models - set(FEED_MODELS.values())
+            if unknown:
+                raise ValidationError({'models': f"Unknown models: {', '.join(sorted(unknown))}."})
+
+        asgi = isinstance(request._request, ASGIRequest)
+        if not asgi and not getattr(settings, 'CHANGE_FEED_WSGI_STREAMS', False):
+            # Each open stream would hold a sync worker for CHANGE_FEED_MAX_AGE seconds.
+            return Response({
+                'error': 'The change feed is only served by the ASGI deployment'
+            }, status=status.HTTP_501_NOT_IMPLEMENTED)
+        if isinstance(get_change_feed(), InMemoryChangeFeed) and getattr(settings, 'WEB_CONCURRENCY', 1) > 1:
+            # Streams would only see writes handled by their own process.
+            return Response({
+                'error': 'The in-memory change feed cannot serve several worker processes; configure REDIS_URL'
+            }, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        # ASGI servers need an async iterator to stream without a thread per response.
+        if asgi:
+            events = astream_changes(request.user, models)
+        else:
+            events = stream_changes(request.user, models)
+
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream.
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class ChangeFeedTokenAPIView(generics.GenericAPIView):
+    """
+        Issue a short-lived token for `GET /api/changes/?token=`, for
+        EventSource clients that cannot send an Authorization header.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['post', 'options']
+    query_budget = 0
+
+    def post(self, request):
+        return Response({
+            'message': 'Stream token issued',
+            'token': str(stream_token_for(request.user)),
+            'expires_in': getattr(settings, 'CHANGE_FEED_TOKEN_LIFETIME', 60),
+        }, status=status.HTTP_200_OK)
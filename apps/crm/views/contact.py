@@ -2,26 +2,49 @@ from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 from apps.crm.models import Contact
-from apps.crm.serializers import ContactSerializer
+from apps.crm.serializers import ContactBulkSerializer, ContactSerializer, compiled_contact_serializer
+from apps.crm.compiled import apaginate_serialized, paginate_serialized
 from apps.crm.permissions import IsManagerOrNoDeleteForAgents
-from apps.crm.services.audit import create_audit_entry, get_client_ip
+from apps.crm.services.audit import audit_snapshot, build_audit_entry, create_audit_entry, get_client_ip, save_audit_entries
+from apps.crm.services.changefeed import publish_changes
+from apps.crm.services.outbox import record_outbox
+from apps.crm.services.bulk import error_result, get_bulk_items, ok_result, summarize_results, validate_items
+from apps.crm.services.dashboard import invalidate_dashboard
+from apps.crm.services.export import stream_export
+from apps.crm.services.search import index_instances, search_queryset
+from core.async_views import AsyncAPIViewMixin
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from django.core.paginator import Paginator, EmptyPage
+from asgiref.sync import sync_to_async
+from django.db import transaction
 from django.db.models import Q
+from django.utils import timezone
 from apps.crm.models import Lead
 
 
 class ContactGenericAPIView(generics.GenericAPIView):
     permission_classes = [IsManagerOrNoDeleteForAgents]
     serializer_class = ContactSerializer
+    replica_reads = True
 
     def get(self, request):
+        contacts = self.get_list_queryset(request)
+
+        contacts_data, pagination = paginate_serialized(request, contacts, ['name', 'id'], compiled_contact_serializer)
+
+        return Response({
+            'message': "Contacts Fetched Successfully",
+            "contacts": contacts_data,
+            **pagination,
+        }, status=status.HTTP_200_OK)
+
+    def get_list_queryset(self, request):
+        """
+            Contacts matching the request's filters and search, scoped to the caller.
+        """
         linked_lead = request.query_params.get('linked_lead')
         is_primary = request.query_params.get('is_primary')
         search = request.query_params.get('search')
-        page = int(request.query_params.get('page', 1))
-        rows = int(request.query_params.get('rows', 25))
 
         query = Q(pk__isnull=False)
 
@@ -29,31 +52,17 @@ class ContactGenericAPIView(generics.GenericAPIView):
             query &= Q(linked_lead_id=linked_lead)
         if is_primary is not None:
             query &= Q(is_primary=is_primary.lower() in ('true', '1', 'yes', 'on'))
-        if search:
-            query &= Q(
-                Q(name__icontains=search) |
-                Q(email__icontains=search) |
-                Q(company__icontains=search) |
-                Q(title__icontains=search)
-            )
 
         # Filter by user role
         if hasattr(request.user, 'is_agent') and request.user.is_agent():
-            query &= Q(linked_lead__owner=request.user)
+            query &= Q(linked_lead__owner_id=request.user.pk)
 
         contacts = Contact.objects.filter(query).order_by('name')
+        if search:
+            contacts = search_queryset(contacts, search)
+        return contacts
 
-        paginator = Paginator(contacts, rows)
-        contacts_page = paginator.page(page)
-
-        return Response({
-            'message': "Contacts Fetched Successfully",
-            "contacts": self.serializer_class(contacts_page, many=True).data,
-            "current_page": page,
-            "last_page": paginator.num_pages,
-            "total": paginator.count,
-        }, status=status.HTTP_200_OK)
-
+    @transaction.atomic
     def post(self, request):
         name = request.data.get('name')
         email = request.data.get('email')
@@ -65,7 +74,7 @@ class ContactGenericAPIView(generics.GenericAPIView):
 
 
         linked_lead = Lead.objects.get(pk=linked_lead_id)
-        if hasattr(request.user, 'is_agent') and request.user.is_agent() and linked_lead.owner != request.user:
+        if hasattr(request.user, 'is_agent') and request.user.is_agent() and linked_lead.owner_id != request.user.pk:
             return Response({
                 'error': 'You can only create contacts for your own leads'
             }, status=status.HTTP_403_FORBIDDEN)
@@ -95,25 +104,19 @@ class ContactGenericAPIView(generics.GenericAPIView):
             'contact': self.serializer_class(contact).data,
         }, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def put(self, request):
         contact_id = request.data.get('id') or request.query_params.get('id')
         contact = Contact.objects.filter(pk=contact_id).first()
 
         # Check permissions
-        if hasattr(request.user, 'is_agent') and request.user.is_agent() and contact.linked_lead.owner != request.user:
+        if hasattr(request.user, 'is_agent') and request.user.is_agent() and contact.linked_lead.owner_id != request.user.pk:
             return Response({
                 'error': 'You can only update contacts for your own leads'
             }, status=status.HTTP_403_FORBIDDEN)
 
-        # Store old values for audit
-        old_values = {
-            'name': contact.name,
-            'email': contact.email,
-            'phone': contact.phone,
-            'title': contact.title,
-            'company': contact.company,
-            'is_primary': contact.is_primary
-        }
+        # Snapshot for the audit diff
+        before = audit_snapshot(contact)
 
         contact.name = request.data.get('name', contact.name)
         contact.email = request.data.get('email', contact.email)
@@ -128,7 +131,7 @@ class ContactGenericAPIView(generics.GenericAPIView):
             user=request.user,
             action='update',
             instance=contact,
-            old_value=old_values,
+            before=before,
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
@@ -138,6 +141,7 @@ class ContactGenericAPIView(generics.GenericAPIView):
             'contact': self.serializer_class(contact).data,
         }, status=status.HTTP_200_OK)
 
+    @transaction.atomic
     def delete(self, request):
         contact_id = request.query_params.get('id')
         contact = Contact.objects.filter(pk=contact_id).first()
@@ -148,22 +152,11 @@ class ContactGenericAPIView(generics.GenericAPIView):
                 'error': 'Agents cannot delete contacts'
             }, status=status.HTTP_403_FORBIDDEN)
 
-        # Store old values for audit
-        old_values = {
-            'name': contact.name,
-            'email': contact.email,
-            'phone': contact.phone,
-            'title': contact.title,
-            'company': contact.company,
-            'is_primary': contact.is_primary
-        }
-
         # Create audit entry before deletion
         create_audit_entry(
             user=request.user,
             action='delete',
             instance=contact,
-            old_value=old_values,
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
@@ -173,3 +166,154 @@ class ContactGenericAPIView(generics.GenericAPIView):
         return Response({
             'message': 'Contact deleted successfully'
         }, status=status.HTTP_200_OK)
+
+
+class ContactAsyncAPIView(AsyncAPIViewMixin, ContactGenericAPIView):
+    """
+        ContactGenericAPIView serving the list with the async ORM.
+    """
+
+    async def get(self, request):
+        # Building the search filter may probe the database backend once.
+        contacts = await sync_to_async(self.get_list_queryset)(request)
+
+        contacts_data, pagination = await apaginate_serialized(request, contacts, ['name', 'id'], compiled_contact_serializer)
+
+        return Response({
+            'message': "Contacts Fetched Successfully",
+            "contacts": contacts_data,
+            **pagination,
+        }, status=status.HTTP_200_OK)
+
+
+class ContactBulkAPIView(generics.GenericAPIView):
+    """
+        Create or update many contacts in one request and one transaction.
+        Lead ownership is checked for all rows with a single query.
+    """
+    permission_classes = [IsManagerOrNoDeleteForAgents]
+    serializer_class = ContactBulkSerializer
+
+    FIELDS = ['name', 'email', 'phone', 'title', 'company', 'is_primary']
+
+    def _lead_owners(self, lead_ids):
+        return dict(Lead.objects.filter(pk__in=set(lead_ids)).values_list('id', 'owner_id'))
+
+    def post(self, request):
+        items = get_bulk_items(request, 'contacts')
+        valid, results = validate_items(self.serializer_class, items)
+
+        owners = self._lead_owners(data['linked_lead'] for _, data in valid)
+        is_agent = hasattr(request.user, 'is_agent') and request.user.is_agent()
+
+        created = []
+        contacts = []
+        for index, data in valid:
+            lead_id = data.pop('linked_lead')
+            if lead_id not in owners:
+                results[index] = error_result(index, {'linked_lead': ['Lead not found.']})
+                continue
+            if is_agent and owners[lead_id] != request.user.pk:
+                results[index] = error_result(index, {'linked_lead': ['You can only create contacts for your own leads.']})
+                continue
+            data.pop('id', None)
+            created.append(index)
+            contacts.append(Contact(linked_lead_id=lead_id, **data))
+
+        with transaction.atomic():
+            Contact.objects.bulk_create(contacts, batch_size=500)
+            index_instances(Contact, contacts)
+            publish_changes(Contact, contacts, 'create')
+            record_outbox(Contact, contacts, 'create')
+            save_audit_entries([
+                build_audit_entry(
+                    user=request.user,
+                    action='create',
+                    instance=contact,
+                    ip_address=get_client_ip(request),
+                    user_agent=request.META.get('HTTP_USER_AGENT', '')
+                )
+                for contact in contacts
+            ])
+        invalidate_dashboard()
+
+        for index, contact in zip(created, contacts):
+            results[index] = ok_result(index, 'created', contact.pk)
+
+        return Response({
+            'message': 'Contacts processed',
+            **summarize_results(results, len(items)),
+        }, status=status.HTTP_200_OK)
+
+    def put(self, request):
+        items = get_bulk_items(request, 'contacts')
+        valid, results = validate_items(self.serializer_class, items, partial=True)
+
+        ids = [data.get('id') for _, data in valid]
+        existing = Contact.objects.select_related('linked_lead').in_bulk([pk for pk in ids if pk is not None])
+        is_agent = hasattr(request.user, 'is_agent') and request.user.is_agent()
+
+        now = timezone.now()
+        updated = []
+        entries = []
+        for index, data in valid:
+            contact = existing.get(data.get('id'))
+            if contact is None:
+                results[index] = error_result(index, {'id': ['Contact not found.']})
+                continue
+            if is_agent and contact.linked_lead.owner_id != request.user.pk:
+                results[index] = error_result(index, {'id': ['You can only update contacts for your own leads.']})
+                continue
+
+            before = audit_snapshot(contact)
+            for field in self.FIELDS:
+                if field in data:
+                    setattr(contact, field, data[field])
+            contact.updated_at = now
+            updated.append(contact)
+            entries.append(build_audit_entry(
+                user=request.user,
+                action='update',
+                instance=contact,
+                before=before,
+                ip_address=get_client_ip(request),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            ))
+            results[index] = ok_result(index, 'updated', contact.pk)
+
+        with transaction.atomic():
+            Contact.objects.bulk_update(updated, self.FIELDS + ['updated_at'], batch_size=500)
+            index_instances(Contact, updated)
+            publish_changes(Contact, updated, 'update')
+            record_outbox(Contact, updated, 'update')
+            save_audit_entries(entries)
+        invalidate_dashboard()
+
+        return Response({
+            'message': 'Contacts processed',
+            **summarize_results(results, len(items)),
+        }, status=status.HTTP_200_OK)
+
+
+class ContactExportAPIView(ContactGenericAPIView):
+    """
+        Stream every contact matching the list filters as CSV or NDJSON.
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    COLUMNS = [
+        ('id', 'id'),
+        ('name', 'name'),
+        ('email', 'email'),
+        ('phone', 'phone'),
+        ('linked_lead', 'linked_lead_id'),
+        ('linked_lead_name', 'linked_lead__name'),
+        ('title', 'title'),
+        ('company', 'company'),
+        ('is_primary', 'is_primary'),
+        ('created_at', 'created_at'),
+        ('updated_at', 'updated_at'),
+    ]
+
+    def get(self, request):
+        return stream_export(request, self.get_list_queryset(request), self.COLUMNS, 'contacts')
@@ -1,25 +1,26 @@
 from apps.crm.models.contact import Contact
 
 from apps.crm.models import Correspondence
-from apps.crm.serializers import CorrespondenceSerializer
-from apps.crm.services.audit import create_audit_entry, get_client_ip
+from apps.crm.serializers import CorrespondenceSerializer, compiled_correspondence_serializer
+from apps.crm.compiled import paginate_serialized
+from apps.crm.services.audit import audit_snapshot, create_audit_entry, get_client_ip
+from apps.crm.services.search import search_queryset
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from django.core.paginator import Paginator, EmptyPage
+from django.db import transaction
 from django.db.models import Q
 
 
 class CorrespondenceGenericAPIView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = CorrespondenceSerializer
+    replica_reads = True
 
     def get(self, request):
         contact = request.query_params.get('contact')
         type_q = request.query_params.get('type')
         created_by = request.query_params.get('created_by')
         search = request.query_params.get('search')
-        page = int(request.query_params.get('page', 1))
-        rows = int(request.query_params.get('rows', 25))
 
         query = Q(pk__isnull=False)
 
@@ -29,29 +30,24 @@ class CorrespondenceGenericAPIView(generics.GenericAPIView):
             query &= Q(type=type_q)
         if created_by:
             query &= Q(created_by_id=created_by)
-        if search:
-            query &= Q(
-                Q(notes__icontains=search) |
-                Q(outcome__icontains=search)
-            )
 
         # Filter by user role
         if hasattr(request.user, 'is_agent') and request.user.is_agent():
-            query &= Q(contact__linked_lead__owner=request.user)
+            query &= Q(contact__linked_lead__owner_id=request.user.pk)
 
         correspondence = Correspondence.objects.filter(query).order_by('-created_at')
+        if search:
+            correspondence = search_queryset(correspondence, search)
 
-        paginator = Paginator(correspondence, rows)
-        correspondence_page = paginator.page(page)
+        correspondence_data, pagination = paginate_serialized(request, correspondence, ['-created_at', 'id'], compiled_correspondence_serializer)
 
         return Response({
             'message': "Correspondence Fetched Successfully",
-            "correspondence": self.serializer_class(correspondence_page, many=True).data,
-            "current_page": page,
-            "last_page": paginator.num_pages,
-            "total": paginator.count,
+            "correspondence": correspondence_data,
+            **pagination,
         }, status=status.HTTP_200_OK)
 
+    @transaction.atomic
     def post(self, request):
         contact_id = request.data.get('contact')
         type_q = request.data.get('type')
@@ -60,7 +56,7 @@ class CorrespondenceGenericAPIView(generics.GenericAPIView):
         duration = request.data.get('duration')
 
         contact = Contact.objects.get(pk=contact_id)
-        if hasattr(request.user, 'is_agent') and request.user.is_agent() and contact.linked_lead.owner != request.user:
+        if hasattr(request.user, 'is_agent') and request.user.is_agent() and contact.linked_lead.owner_id != request.user.pk:
             return Response({
                 'error': 'You can only create correspondence for your own leads'
             }, status=status.HTTP_403_FORBIDDEN)
@@ -80,7 +76,7 @@ class CorrespondenceGenericAPIView(generics.GenericAPIView):
         correspondence.notes = notes
         correspondence.outcome = outcome
         correspondence.duration = duration
-        correspondence.created_by = request.user
+        correspondence.created_by_id = request.user.pk
         correspondence.save()
 
         # Create audit entry
@@ -97,23 +93,19 @@ class CorrespondenceGenericAPIView(generics.GenericAPIView):
             'correspondence': self.serializer_class(correspondence).data,
         }, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def put(self, request):
         correspondence_id = request.data.get('id') or request.query_params.get('id')
         correspondence = Correspondence.objects.filter(pk=correspondence_id).first()
 
         # Check permissions
-        if hasattr(request.user, 'is_agent') and request.user.is_agent() and correspondence.contact.linked_lead.owner != request.user:
+        if hasattr(request.user, 'is_agent') and request.user.is_agent() and correspondence.contact.linked_lead.owner_id != request.user.pk:
             return Response({
                 'error': 'You can only update correspondence for your own leads'
             }, status=status.HTTP_403_FORBIDDEN)
 
-        # Store old values for audit
-        old_values = {
-            'type': correspondence.type,
-            'notes': correspondence.notes,
-            'outcome': correspondence.outcome,
-            'duration': correspondence.duration
-        }
+        # Snapshot for the audit diff
+        before = audit_snapshot(correspondence)
 
         correspondence.type = request.data.get('type', correspondence.type)
         correspondence.notes = request.data.get('notes', correspondence.notes)
@@ -140,7 +132,7 @@ class CorrespondenceGenericAPIView(generics.GenericAPIView):
             user=request.user,
             action='update',
             instance=correspondence,
-            old_value=old_values,
+            before=before,
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
@@ -150,6 +142,7 @@ class CorrespondenceGenericAPIView(generics.GenericAPIView):
             'correspondence': self.serializer_class(correspondence).data,
         }, status=status.HTTP_200_OK)
 
+    @transaction.atomic
     def delete(self, request):
         correspondence_id = request.query_params.get('id')
         correspondence = Correspondence.objects.filter(pk=correspondence_id).first()
@@ -160,25 +153,16 @@ class CorrespondenceGenericAPIView(generics.GenericAPIView):
             }, status=status.HTTP_404_NOT_FOUND)
 
         # Check permissions
-        if hasattr(request.user, 'is_agent') and request.user.is_agent() and correspondence.contact.linked_lead.owner != request.user:
+        if hasattr(request.user, 'is_agent') and request.user.is_agent() and correspondence.contact.linked_lead.owner_id != request.user.pk:
             return Response({
                 'error': 'You can only delete correspondence for your own leads'
             }, status=status.HTTP_403_FORBIDDEN)
 
-        # Store old values for audit
-        old_values = {
-            'type': correspondence.type,
-            'notes': correspondence.notes,
-            'outcome': correspondence.outcome,
-            'duration': correspondence.duration
-        }
-
         # Create audit entry before deletion
         create_audit_entry(
             user=request.user,
             action='delete',
             instance=correspondence,
-            old_value=old_values,
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
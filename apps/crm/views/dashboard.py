@@ -1,66 +1,64 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from django.db.models import Count, Q
-from apps.crm.models import Lead, Contact, Note, Reminder, Correspondence, AuditTrail
-from apps.crm.serializers import (
-    LeadSerializer,
-    ContactSerializer,
-    NoteSerializer,
-    ReminderSerializer,
-    CorrespondenceSerializer,
-    AuditEntrySerializer
-)
+from apps.crm.conditional import key_validators, not_modified_response, set_validators
+from apps.crm.services.dashboard import adashboard_cache_key, aget_dashboard, dashboard_cache_key, get_dashboard
+from core.async_views import AsyncAPIViewMixin
+
 
 class DashboardAPIView(generics.GenericAPIView):
     """
     Aggregated CRM dashboard: counts, recent activity, chart data.
     """
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 10
+    replica_reads = True
 
-    def get(self, request):
+    @staticmethod
+    def get_filters(request):
         # Optional filters
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-        user_id = request.query_params.get('user_id')
+        return {
+            'start_date': request.query_params.get('start_date'),
+            'end_date': request.query_params.get('end_date'),
+            'user_id': request.query_params.get('user_id'),
+        }
 
-        # Base filter
-        base_filter = Q()
-        if start_date:
-            base_filter &= Q(created_at__gte=start_date)
-        if end_date:
-            base_filter &= Q(created_at__lte=end_date)
-        if user_id:
-            base_filter &= Q(owner_id=user_id) | Q(created_by_id=user_id) | Q(user_id=user_id)
+    def get(self, request):
+        filters = self.get_filters(request)
 
-        # Counts
-        counts = {
-            'leads_total': Lead.objects.filter(base_filter).count(),
-            'contacts_total': Contact.objects.filter(base_filter).count(),
-            'notes_total': Note.objects.filter(base_filter).count(),
-            'reminders_total': Reminder.objects.filter(base_filter).count(),
-            'correspondence_total': Correspondence.objects.filter(base_filter).count(),
-            'audit_entries_total': AuditTrail.objects.filter(base_filter).count(),
-        }
+        # The cache key embeds the write generation, so it doubles as the version.
+        etag = key_validators(request, dashboard_cache_key(request.user.pk, filters))
+        not_modified = not_modified_response(request, etag)
+        if not_modified:
+            return not_modified
 
-        # Recent activity (limit 5 each)
-        recent_data = {
-            'leads': LeadSerializer(Lead.objects.filter(base_filter).order_by('-created_at')[:5], many=True).data,
-            'contacts': ContactSerializer(Contact.objects.filter(base_filter).order_by('-created_at')[:5], many=True).data,
-            'notes': NoteSerializer(Note.objects.filter(base_filter).order_by('-created_at')[:5], many=True).data,
-            'reminders': ReminderSerializer(Reminder.objects.filter(base_filter).order_by('-created_at')[:5], many=True).data,
-            'correspondence': CorrespondenceSerializer(Correspondence.objects.filter(base_filter).order_by('-created_at')[:5], many=True).data,
-            'audit_entries': AuditEntrySerializer(AuditTrail.objects.filter(base_filter).select_related('user').order_by('-created_at')[:5], many=True).data,
-        }
+        data = get_dashboard(request.user, **filters)
 
-        # Chart data
-        charts = {
-            'leads_by_status': list(Lead.objects.filter(base_filter).values('status').annotate(count=Count('id'))),
-            'reminders_by_status': list(Reminder.objects.filter(base_filter).values('status').annotate(count=Count('id'))),
-        }
+        return set_validators(Response({
+            'message': "Dashboard data fetched successfully",
+            'counts': data['counts'],
+            'recent': data['recent'],
+            'charts': data['charts'],
+        }, status=status.HTTP_200_OK), etag)
+
+
+class DashboardAsyncAPIView(AsyncAPIViewMixin, DashboardAPIView):
+    """
+    DashboardAPIView reading the cache and the database asynchronously.
+    """
+
+    async def get(self, request):
+        filters = self.get_filters(request)
+
+        etag = key_validators(request, await adashboard_cache_key(request.user.pk, filters))
+        not_modified = not_modified_response(request, etag)
+        if not_modified:
+            return not_modified
+
+        data = await aget_dashboard(request.user, **filters)
 
-        return Response({
+        return set_validators(Response({
             'message': "Dashboard data fetched successfully",
-            'counts': counts,
-            'recent': recent_data,
-            'charts': charts,
-        }, status=status.HTTP_200_OK)
+            'counts': data['counts'],
+            'recent': data['recent'],
+            'charts': data['charts'],
+        }, status=status.HTTP_200_OK), etag)
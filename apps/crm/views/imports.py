@@ -0,0 +1,34 @@
+import io
+
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+
+from apps.crm.services.importer import IMPORT_KINDS, import_csv
+
+
+class ImportAPIView(generics.GenericAPIView):
+    """
+        Import a CSV upload of leads or contacts (multipart: `kind`, `file`).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        kind = request.data.get('kind')
+        upload = request.FILES.get('file')
+
+        if kind not in IMPORT_KINDS:
+            return Response({
+                'error': f"kind must be one of: {', '.join(IMPORT_KINDS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if upload is None:
+            return Response({
+                'error': 'A CSV file is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        report = import_csv(kind, stream, request.user)
+
+        return Response({
+            'message': 'Import completed',
+            **report.as_dict(),
+        }, status=status.HTTP_200_OK)
@@ -1,28 +1,86 @@
+import logging
+
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from apps.crm.models import Lead
-from apps.crm.serializers import LeadSerializer
+from apps.crm.models import Contact, Lead, Note, Reminder
+from apps.crm.serializers import LeadBulkSerializer, LeadSerializer, compiled_lead_serializer
+from apps.crm.conditional import aqueryset_validators, not_modified_response, queryset_validators, set_validators
+from apps.crm.compiled import apaginate_serialized, paginate_serialized, timestamp_format
+from apps.crm.pagination import page_queryset
 from apps.crm.permissions import IsManagerOrNoDeleteForAgents
-from apps.crm.services.audit import create_audit_entry, get_client_ip
+from apps.crm.services.audit import audit_snapshot, build_audit_entry, create_audit_entry, get_client_ip, save_audit_entries
+from apps.crm.services.changefeed import publish_changes
+from apps.crm.services.outbox import record_outbox
+from apps.crm.services.bulk import error_result, get_bulk_items, ok_result, summarize_results, validate_items
+from apps.crm.services.dashboard import invalidate_dashboard
+from apps.crm.services.export import stream_export
+from apps.crm.services.search import index_instances, search_queryset
+from apps.crm.services.timeline import lead_timeline
+from core.async_views import AsyncAPIViewMixin
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from django.core.paginator import Paginator, EmptyPage
+from asgiref.sync import sync_to_async
+from django.db import transaction
 from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+LIST_ORDERING = ['-created_at', 'id']
 
 
 class LeadGenericAPIView(generics.GenericAPIView):
     permission_classes = [IsManagerOrNoDeleteForAgents]
     serializer_class = LeadSerializer
+    # PUT with synchronous audit writes is the most expensive request: the lookup,
+    # update, search index, outbox and audit rows, four queries to reload the
+    # response and the transaction's BEGIN / COMMIT. None of it grows with the lead.
+    query_budget = 11
+    replica_reads = True
 
+    def get(self, request, id=None):
+        if id is not None:
+            return self.summary(request, id)
 
-    def get(self, request):
+        leads = self.get_list_queryset(request)
+
+        etag = queryset_validators(request, *self.version_querysets(request, leads))
+        not_modified = not_modified_response(request, etag)
+        if not_modified:
+            return not_modified
+
+        leads_data, pagination = paginate_serialized(request, leads, LIST_ORDERING, compiled_lead_serializer)
+
+        return set_validators(Response({
+            'message': "Leads Fetched Successfully",
+            "leads": leads_data,
+            **pagination,
+        }, status=status.HTTP_200_OK), etag)
+
+    @staticmethod
+    def version_querysets(request, leads):
+        """
+            Every lead carries its contacts, notes and reminders, so those of
+            the requested page's leads version the page too. All filtered leads
+            count, as they decide the page's members and the totals.
+        """
+        lead_ids = page_queryset(request, leads.values('pk'), LIST_ORDERING)
+        return (
+            leads,
+            Contact.objects.filter(linked_lead__in=lead_ids),
+            Note.objects.filter(lead__in=lead_ids),
+            Reminder.objects.filter(lead__in=lead_ids),
+        )
+
+    def get_list_queryset(self, request):
+        """
+            Leads matching the request's filters and search, scoped to the caller.
+        """
         lead_id = request.query_params.get('id')
         status_q = request.query_params.get('status')
         owner = request.query_params.get('owner')
         search = request.query_params.get('search')
-        page = int(request.query_params.get('page', 1))
-        rows = int(request.query_params.get('rows', 25))
 
         query = Q(pk__isnull=False)
 
@@ -32,30 +90,17 @@ class LeadGenericAPIView(generics.GenericAPIView):
             query &= Q(pk=lead_id) 
         if owner:
             query &= Q(owner_id=owner)
-        if search:
-            query &= Q(
-                Q(name__icontains=search) |
-                Q(description__icontains=search) |
-                Q(source__icontains=search)
-            )
 
         # Filter by user role
         if hasattr(request.user, 'is_agent') and request.user.is_agent():
-            query &= Q(owner=request.user)
+            query &= Q(owner_id=request.user.pk)
 
         leads = Lead.objects.filter(query).order_by('-created_at')
+        if search:
+            leads = search_queryset(leads, search)
+        return leads
 
-        paginator = Paginator(leads, rows)
-        leads_page = paginator.page(page)
-
-        return Response({
-            'message': "Leads Fetched Successfully",
-            "leads": self.serializer_class(leads_page, many=True).data,
-            "current_page": page,
-            "last_page": paginator.num_pages,
-            "total": paginator.count,
-        }, status=status.HTTP_200_OK)
-
+    @transaction.atomic
     def post(self, request):
         name = request.data.get('name')
         lead_status = request.data.get('status', 'NEW') 
@@ -69,7 +114,7 @@ class LeadGenericAPIView(generics.GenericAPIView):
         lead.description = description
         lead.value = value
         lead.source = source
-        lead.owner = request.user
+        lead.owner_id = request.user.pk
         lead.save()
 
         # Create audit entry
@@ -83,28 +128,27 @@ class LeadGenericAPIView(generics.GenericAPIView):
 
         return Response({
             'message': 'Lead created successfully',
-            'lead': self.serializer_class(lead).data,
+            'lead': self.serializer_class(self.reload(lead)).data,
         }, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def put(self, request):
         lead_id = request.data.get('id') or request.query_params.get('id')
         lead = Lead.objects.filter(pk=lead_id).first()
 
+        if not lead:
+            return Response({
+                'error': 'Lead not found'
+            }, status=status.HTTP_404_NOT_FOUND)
 
         # Check permissions
-        if hasattr(request.user, 'is_agent') and request.user.is_agent() and lead.owner != request.user:
+        if hasattr(request.user, 'is_agent') and request.user.is_agent() and lead.owner_id != request.user.pk:
             return Response({
                 'error': 'You can only update your own leads'
             }, status=status.HTTP_403_FORBIDDEN)
 
-        # Store old values for audit
-        old_values = {
-            'name': lead.name,
-            'status': lead.status,
-            'description': lead.description,
-            'value': lead.value,
-            'source': lead.source
-        }
+        # Snapshot for the audit diff
+        before = audit_snapshot(lead)
 
         lead.name = request.data.get('name', lead.name)
         lead.status = request.data.get('status', lead.status)
@@ -118,16 +162,24 @@ class LeadGenericAPIView(generics.GenericAPIView):
             user=request.user,
             action='update',
             instance=lead,
-            old_value=old_values,
+            before=before,
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
 
         return Response({
             'message': 'Lead updated successfully',
-            'lead': self.serializer_class(lead).data,
+            'lead': self.serializer_class(self.reload(lead)).data,
         }, status=status.HTTP_200_OK)
 
+    def reload(self, lead):
+        """
+            Re-fetch a saved lead with everything the serializer touches, so
+            the response costs the same fixed queries as one row of the list.
+        """
+        return self.serializer_class.setup_eager_loading(Lead.objects.filter(pk=lead.pk)).get()
+
+    @transaction.atomic
     def delete(self, request):
         lead_id = request.query_params.get('id')
         lead = Lead.objects.filter(pk=lead_id).first()
@@ -143,21 +195,11 @@ class LeadGenericAPIView(generics.GenericAPIView):
                 'error': 'Agents cannot delete leads'
             }, status=status.HTTP_403_FORBIDDEN)
 
-        # Store old values for audit
-        old_values = {
-            'name': lead.name,
-            'status': lead.status,
-            'description': lead.description,
-            'value': lead.value,
-            'source': lead.source
-        }
-
         # Create audit entry before deletion
         create_audit_entry(
             user=request.user,
             action='delete',
             instance=lead,
-            old_value=old_values,
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
@@ -175,43 +217,293 @@ class LeadGenericAPIView(generics.GenericAPIView):
         """
         try:
             lead = Lead.objects.get(pk=id)
-            
-            # Check permissions
-            if hasattr(request.user, 'is_agent') and request.user.is_agent() and lead.owner != request.user:
-                return Response({
-                    'error': 'You can only view summaries for your own leads'
-                }, status=status.HTTP_403_FORBIDDEN)
-            
-            notes = lead.notes.all().order_by('-created_at')
-            
-            if not notes.exists():
-                return Response({
-                    'lead': lead.name,
-                    'summary': 'No notes available for this lead.',
-                    'ai_available': False
-                }, status=status.HTTP_200_OK)
-            
-            # Extract note content for AI processing
-            note_contents = [note.content for note in notes]
-            
-            # Generate AI summary
-            from apps.crm.services.ai_summary import summarize_notes
-            summary = summarize_notes(note_contents, lead.name)
-            
+
+            forbidden = self.summary_forbidden(request, lead)
+            if forbidden:
+                return forbidden
+
+            from apps.crm.services.ai_summary import cached_summarize_notes
+
+            etag = self.summary_etag(queryset_validators(
+                request,
+                Lead.objects.filter(pk=lead.pk),
+                Note.objects.filter(lead_id=lead.pk),
+            ))
+            not_modified = not_modified_response(request, etag)
+            if not_modified:
+                return not_modified
+
+            note_contents = list(lead.notes.order_by('-created_at').values_list('content', flat=True))
+            if not note_contents:
+                return self.summary_response(lead, note_contents, etag)
+
+            # Generate AI summary, reusing the stored one if the notes are unchanged
+            summary, cached = cached_summarize_notes(lead.pk, note_contents, lead.name)
+            return self.summary_response(lead, note_contents, etag, summary, cached)
+
+        except Exception as e:
+            return self.summary_error(id, e)
+
+    @staticmethod
+    def summary_forbidden(request, lead):
+        if hasattr(request.user, 'is_agent') and request.user.is_agent() and lead.owner_id != request.user.pk:
             return Response({
+                'error': 'You can only view summaries for your own leads'
+            }, status=status.HTTP_403_FORBIDDEN)
+        return None
+
+    @staticmethod
+    def summary_etag(etag):
+        from apps.crm.services.ai_summary import ai_summary_service
+
+        # The body also depends on whether the model is configured.
+        return f'{etag}-{int(ai_summary_service.is_available())}'
+
+    @staticmethod
+    def summary_response(lead, note_contents, etag, summary=None, cached=False):
+        """
+            The summary response shared by the sync and async handlers.
+        """
+        if not note_contents:
+            body = {
+                'lead': lead.name,
+                'summary': 'No notes available for this lead.',
+                'ai_available': False
+            }
+        else:
+            body = {
                 'lead': lead.name,
                 'summary': summary,
                 'ai_available': True,
-                'notes_count': len(note_contents)
-            }, status=status.HTTP_200_OK)
-            
-        except Lead.DoesNotExist:
+                'notes_count': len(note_contents),
+                'cached': cached,
+            }
+        return set_validators(Response(body, status=status.HTTP_200_OK), etag)
+
+    @staticmethod
+    def summary_error(id, error):
+        """
+            Response for an exception raised while summarizing; call from the except block.
+        """
+        if isinstance(error, Lead.DoesNotExist):
             return Response(
-                {'error': 'Lead not found'}, 
+                {'error': 'Lead not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        # Exception messages may carry upstream or database details; keep them in the log.
+        logger.exception("Error generating summary for lead %s", id)
+        return Response(
+            {'error': 'Error generating summary'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+class LeadAsyncAPIView(AsyncAPIViewMixin, LeadGenericAPIView):
+    """
+        LeadGenericAPIView serving the list and the AI summary on the event
+        loop (async ORM, async AI client). Writes run in a worker thread.
+    """
+
+    async def get(self, request, id=None):
+        if id is not None:
+            return await self.asummary(request, id)
+
+        # Building the search filter may probe the database backend once.
+        leads = await sync_to_async(self.get_list_queryset)(request)
+
+        etag = await aqueryset_validators(request, *self.version_querysets(request, leads))
+        not_modified = not_modified_response(request, etag)
+        if not_modified:
+            return not_modified
+
+        leads_data, pagination = await apaginate_serialized(request, leads, LIST_ORDERING, compiled_lead_serializer)
+
+        return set_validators(Response({
+            'message': "Leads Fetched Successfully",
+            "leads": leads_data,
+            **pagination,
+        }, status=status.HTTP_200_OK), etag)
+
+    async def asummary(self, request, id):
+        """
+            Get AI-powered summary of lead notes.
+        """
+        try:
+            lead = await Lead.objects.aget(pk=id)
+
+            forbidden = self.summary_forbidden(request, lead)
+            if forbidden:
+                return forbidden
+
+            from apps.crm.services.ai_summary import acached_summarize_notes
+
+            etag = self.summary_etag(await aqueryset_validators(
+                request,
+                Lead.objects.filter(pk=lead.pk),
+                Note.objects.filter(lead_id=lead.pk),
+            ))
+            not_modified = not_modified_response(request, etag)
+            if not_modified:
+                return not_modified
+
+            note_contents = [
+                content async for content in lead.notes.order_by('-created_at').values_list('content', flat=True)
+            ]
+            if not note_contents:
+                return self.summary_response(lead, note_contents, etag)
+
+            # The model call is awaited, so a slow response holds no thread.
+            summary, cached = await acached_summarize_notes(lead.pk, note_contents, lead.name)
+            return self.summary_response(lead, note_contents, etag, summary, cached)
+
         except Exception as e:
-            return Response(
-                {'error': f'Error generating summary: {str(e)}'}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+            return self.summary_error(id, e)
+
+
+class LeadTimelineAPIView(generics.GenericAPIView):
+    """
+        A lead's notes, reminders, correspondence and audit entries merged
+        newest first, one cursor page per call.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['get', 'head', 'options']
+    query_budget = 5
+    replica_reads = True
+
+    def get(self, request, id):
+        lead = Lead.objects.filter(pk=id).only('pk', 'owner_id').first()
+        if lead is None:
+            return Response({'error': 'Lead not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if hasattr(request.user, 'is_agent') and request.user.is_agent() and lead.owner_id != request.user.pk:
+            return Response({
+                'error': 'You can only view the timeline of your own leads'
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        timeline, pagination = lead_timeline(
+            lead,
+            user=request.user,
+            rows=int(request.query_params.get('rows', 25)),
+            cursor=request.query_params.get('cursor') or None,
+            timestamps=timestamp_format(request),
+        )
+
+        return Response({
+            'message': "Lead Timeline Fetched Successfully",
+            'timeline': timeline,
+            **pagination,
+        }, status=status.HTTP_200_OK)
+
+
+class LeadBulkAPIView(generics.GenericAPIView):
+    """
+        Create or update many leads in one request and one transaction.
+        Each item gets its own result; invalid items do not block the rest.
+    """
+    permission_classes = [IsManagerOrNoDeleteForAgents]
+    serializer_class = LeadBulkSerializer
+
+    FIELDS = ['name', 'status', 'description', 'value', 'source']
+
+    def post(self, request):
+        items = get_bulk_items(request, 'leads')
+        valid, results = validate_items(self.serializer_class, items)
+
+        leads = [Lead(owner_id=request.user.pk, **data) for _, data in valid]
+
+        with transaction.atomic():
+            Lead.objects.bulk_create(leads, batch_size=500)
+            index_instances(Lead, leads)
+            publish_changes(Lead, leads, 'create')
+            record_outbox(Lead, leads, 'create')
+            save_audit_entries([
+                build_audit_entry(
+                    user=request.user,
+                    action='create',
+                    instance=lead,
+                    ip_address=get_client_ip(request),
+                    user_agent=request.META.get('HTTP_USER_AGENT', '')
+                )
+                for lead in leads
+            ])
+        invalidate_dashboard()
+
+        for (index, _), lead in zip(valid, leads):
+            results[index] = ok_result(index, 'created', lead.pk)
+
+        return Response({
+            'message': 'Leads processed',
+            **summarize_results(results, len(items)),
+        }, status=status.HTTP_200_OK)
+
+    def put(self, request):
+        items = get_bulk_items(request, 'leads')
+        valid, results = validate_items(self.serializer_class, items, partial=True)
+
+        ids = [data.get('id') for _, data in valid]
+        existing = Lead.objects.in_bulk([pk for pk in ids if pk is not None])
+        is_agent = hasattr(request.user, 'is_agent') and request.user.is_agent()
+
+        now = timezone.now()
+        updated = []
+        entries = []
+        for index, data in valid:
+            lead = existing.get(data.get('id'))
+            if lead is None:
+                results[index] = error_result(index, {'id': ['Lead not found.']})
+                continue
+            if is_agent and lead.owner_id != request.user.pk:
+                results[index] = error_result(index, {'id': ['You can only update your own leads.']})
+                continue
+
+            before = audit_snapshot(lead)
+            for field in self.FIELDS:
+                if field in data:
+                    setattr(lead, field, data[field])
+            lead.updated_at = now
+            updated.append(lead)
+            entries.append(build_audit_entry(
+                user=request.user,
+                action='update',
+                instance=lead,
+                before=before,
+                ip_address=get_client_ip(request),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            ))
+            results[index] = ok_result(index, 'updated', lead.pk)
+
+        with transaction.atomic():
+            Lead.objects.bulk_update(updated, self.FIELDS + ['updated_at'], batch_size=500)
+            index_instances(Lead, updated)
+            publish_changes(Lead, updated, 'update')
+            record_outbox(Lead, updated, 'update')
+            save_audit_entries(entries)
+        invalidate_dashboard()
+
+        return Response({
+            'message': 'Leads processed',
+            **summarize_results(results, len(items)),
+        }, status=status.HTTP_200_OK)
+
+
+class LeadExportAPIView(LeadGenericAPIView):
+    """
+        Stream every lead matching the list filters as CSV or NDJSON.
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    COLUMNS = [
+        ('id', 'id'),
+        ('name', 'name'),
+        ('status', 'status'),
+        ('owner', 'owner_id'),
+        ('owner_username', 'owner__username'),
+        ('description', 'description'),
+        ('value', 'value'),
+        ('source', 'source'),
+        ('created_at', 'created_at'),
+        ('updated_at', 'updated_at'),
+    ]
+
+    def get(self, request):
+        return stream_export(request, self.get_list_queryset(request), self.COLUMNS, 'leads')
@@ -3,26 +3,43 @@ from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 from apps.crm.models import Note
-from apps.crm.serializers import NoteSerializer
-from apps.crm.services.audit import create_audit_entry, get_client_ip
+from apps.crm.serializers import NoteSerializer, compiled_note_serializer
+from apps.crm.compiled import apaginate_serialized, paginate_serialized
+from apps.crm.services.audit import audit_snapshot, create_audit_entry, get_client_ip
+from apps.crm.services.search import search_queryset
+from asgiref.sync import sync_to_async
+from core.async_views import AsyncAPIViewMixin
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from django.core.paginator import Paginator, EmptyPage
+from django.db import transaction
 from django.db.models import Q
 
 
 class NoteGenericAPIView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = NoteSerializer
+    replica_reads = True
 
 
     def get(self, request):
+        notes = self.get_list_queryset(request)
+
+        notes_data, pagination = paginate_serialized(request, notes, ['-created_at', 'id'], compiled_note_serializer)
+
+        return Response({
+            'message': "Notes Fetched Successfully",
+            "notes": notes_data,
+            **pagination,
+        }, status=status.HTTP_200_OK)
+
+    def get_list_queryset(self, request):
+        """
+            Notes matching the request's filters and search, scoped to the caller.
+        """
         lead = request.query_params.get('lead')
         note_type = request.query_params.get('note_type')
         created_by = request.query_params.get('created_by')
         search = request.query_params.get('search')
-        page = int(request.query_params.get('page', 1))
-        rows = int(request.query_params.get('rows', 25))
 
         query = Q(pk__isnull=False)
 
@@ -32,26 +49,17 @@ class NoteGenericAPIView(generics.GenericAPIView):
             query &= Q(note_type=note_type)
         if created_by:
             query &= Q(created_by_id=created_by)
-        if search:
-            query &= Q(content__icontains=search)
 
         # Filter by user role
         if hasattr(request.user, 'is_agent') and request.user.is_agent():
-            query &= Q(lead__owner=request.user)
+            query &= Q(lead__owner_id=request.user.pk)
 
         notes = Note.objects.filter(query).order_by('-created_at')
+        if search:
+            notes = search_queryset(notes, search)
+        return notes
 
-        paginator = Paginator(notes, rows)
-        notes_page = paginator.page(page)
-
-        return Response({
-            'message': "Notes Fetched Successfully",
-            "notes": self.serializer_class(notes_page, many=True).data,
-            "current_page": page,
-            "last_page": paginator.num_pages,
-            "total": paginator.count,
-        }, status=status.HTTP_200_OK)
-
+    @transaction.atomic
     def post(self, request):
         content = request.data.get('content')
         lead_id = request.data.get('lead')
@@ -59,7 +67,7 @@ class NoteGenericAPIView(generics.GenericAPIView):
 
         # Check if lead exists and user has access
         lead = Lead.objects.get(pk=lead_id)
-        if hasattr(request.user, 'is_agent') and request.user.is_agent() and lead.owner != request.user:
+        if hasattr(request.user, 'is_agent') and request.user.is_agent() and lead.owner_id != request.user.pk:
             return Response({
                 'error': 'You can only create notes for your own leads'
             }, status=status.HTTP_403_FORBIDDEN)
@@ -68,7 +76,7 @@ class NoteGenericAPIView(generics.GenericAPIView):
         note.content = content
         note.lead = lead
         note.note_type = note_type
-        note.created_by = request.user
+        note.created_by_id = request.user.pk
         note.save()
 
         # Create audit entry
@@ -85,21 +93,19 @@ class NoteGenericAPIView(generics.GenericAPIView):
             'note': self.serializer_class(note).data,
         }, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def put(self, request):
         note_id = request.data.get('id') or request.query_params.get('id')
         note = Note.objects.filter(pk=note_id).first()
 
         # Check permissions
-        if hasattr(request.user, 'is_agent') and request.user.is_agent() and note.lead.owner != request.user:
+        if hasattr(request.user, 'is_agent') and request.user.is_agent() and note.lead.owner_id != request.user.pk:
             return Response({
                 'error': 'You can only update notes for your own leads'
             }, status=status.HTTP_403_FORBIDDEN)
 
-        # Store old values for audit
-        old_values = {
-            'content': note.content,
-            'note_type': note.note_type
-        }
+        # Snapshot for the audit diff
+        before = audit_snapshot(note)
 
         note.content = request.data.get('content', note.content)
         note.note_type = request.data.get('note_type', note.note_type)
@@ -110,7 +116,7 @@ class NoteGenericAPIView(generics.GenericAPIView):
             user=request.user,
             action='update',
             instance=note,
-            old_value=old_values,
+            before=before,
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
@@ -120,28 +126,22 @@ class NoteGenericAPIView(generics.GenericAPIView):
             'note': self.serializer_class(note).data,
         }, status=status.HTTP_200_OK)
 
+    @transaction.atomic
     def delete(self, request):
         note_id = request.query_params.get('id')
         note = Note.objects.filter(pk=note_id).first()
 
         # Check permissions
-        if hasattr(request.user, 'is_agent') and request.user.is_agent() and note.lead.owner != request.user:
+        if hasattr(request.user, 'is_agent') and request.user.is_agent() and note.lead.owner_id != request.user.pk:
             return Response({
                 'error': 'You can only delete notes for your own leads'
             }, status=status.HTTP_403_FORBIDDEN)
 
-        # Store old values for audit
-        old_values = {
-            'content': note.content,
-            'note_type': note.note_type
-        }
-
         # Create audit entry before deletion
         create_audit_entry(
             user=request.user,
             action='delete',
             instance=note,
-            old_value=old_values,
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
@@ -151,3 +151,21 @@ class NoteGenericAPIView(generics.GenericAPIView):
         return Response({
             'message': 'Note deleted successfully'
         }, status=status.HTTP_200_OK)
+
+
+class NoteAsyncAPIView(AsyncAPIViewMixin, NoteGenericAPIView):
+    """
+        NoteGenericAPIView serving the list with the async ORM.
+    """
+
+    async def get(self, request):
+        # Building the search filter may probe the database backend once.
+        notes = await sync_to_async(self.get_list_queryset)(request)
+
+        notes_data, pagination = await apaginate_serialized(request, notes, ['-created_at', 'id'], compiled_note_serializer)
+
+        return Response({
+            'message': "Notes Fetched Successfully",
+            "notes": notes_data,
+            **pagination,
+        }, status=status.HTTP_200_OK)
@@ -3,11 +3,14 @@ from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 from apps.crm.models import Reminder
-from apps.crm.serializers import ReminderSerializer
-from apps.crm.services.audit import create_audit_entry, get_client_ip
+from apps.crm.serializers import ReminderSerializer, compiled_reminder_serializer
+from apps.crm.conditional import not_modified_response, queryset_validators, set_validators
+from apps.crm.compiled import paginate_serialized
+from apps.crm.services.audit import audit_snapshot, create_audit_entry, get_client_ip
+from apps.crm.services.search import search_queryset
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from django.core.paginator import Paginator, EmptyPage
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
 from dateutil import parser 
@@ -15,6 +18,7 @@ from dateutil import parser
 class ReminderGenericAPIView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ReminderSerializer
+    replica_reads = True
 
 
     def get(self, request):
@@ -23,8 +27,6 @@ class ReminderGenericAPIView(generics.GenericAPIView):
         reminder_type = request.query_params.get('reminder_type')
         created_by = request.query_params.get('created_by')
         search = request.query_params.get('search')
-        page = int(request.query_params.get('page', 1))
-        rows = int(request.query_params.get('rows', 25))
 
         query = Q(pk__isnull=False)
 
@@ -36,28 +38,36 @@ class ReminderGenericAPIView(generics.GenericAPIView):
             query &= Q(reminder_type=reminder_type)
         if created_by:
             query &= Q(created_by_id=created_by)
-        if search:
-            query &= Q(message__icontains=search)
 
         # Filter by user role
         if hasattr(request.user, 'is_agent') and request.user.is_agent():
-            query &= Q(lead__owner=request.user)
+            query &= Q(lead__owner_id=request.user.pk)
 
         reminders = Reminder.objects.filter(query).order_by('scheduled_time')
+        if search:
+            reminders = search_queryset(reminders, search)
 
-        paginator = Paginator(reminders, rows)
-        reminders_page = paginator.page(page)
+        # lead_name comes from the lead, so lead renames version the list too.
+        etag = queryset_validators(
+            request,
+            reminders,
+            Lead.objects.filter(pk__in=reminders.values('lead_id')),
+        )
+        not_modified = not_modified_response(request, etag)
+        if not_modified:
+            return not_modified
 
-        return Response({
+        reminders_data, pagination = paginate_serialized(request, reminders, ['scheduled_time', 'id'], compiled_reminder_serializer)
+
+        return set_validators(Response({
             'message': "Reminders Fetched Successfully",
-            "reminders": self.serializer_class(reminders_page, many=True).data,
-            "current_page": page,
-            "last_page": paginator.num_pages,
-            "total": paginator.count,
-        }, status=status.HTTP_200_OK)
+            "reminders": reminders_data,
+            **pagination,
+        }, status=status.HTTP_200_OK), etag)
 
  
 
+    @transaction.atomic
     def post(self, request):
         lead_id = request.data.get('lead_id')
         message = request.data.get('message')
@@ -68,7 +78,7 @@ class ReminderGenericAPIView(generics.GenericAPIView):
         # Lead exists & access check
         lead = Lead.objects.get(pk=lead_id)
 
-        if getattr(request.user, 'is_agent', lambda: False)() and lead.owner != request.user:
+        if getattr(request.user, 'is_agent', lambda: False)() and lead.owner_id != request.user.pk:
             return Response({'error': 'You can only create reminders for your own leads'}, status=status.HTTP_403_FORBIDDEN)
 
         # Parse scheduled_time as aware datetime
@@ -83,7 +93,7 @@ class ReminderGenericAPIView(generics.GenericAPIView):
             scheduled_time=scheduled_time,
             reminder_type=reminder_type,
             status='PENDING',
-            created_by=request.user
+            created_by_id=request.user.pk
         )
         reminder.save()
 
@@ -102,23 +112,19 @@ class ReminderGenericAPIView(generics.GenericAPIView):
         )
 
 
+    @transaction.atomic
     def put(self, request):
         reminder_id = request.data.get('id') or request.query_params.get('id')
         reminder = Reminder.objects.filter(pk=reminder_id).first()
 
         # Check permissions
-        if hasattr(request.user, 'is_agent') and request.user.is_agent() and reminder.lead.owner != request.user:
+        if hasattr(request.user, 'is_agent') and request.user.is_agent() and reminder.lead.owner_id != request.user.pk:
             return Response({
                 'error': 'You can only update reminders for your own leads'
             }, status=status.HTTP_403_FORBIDDEN)
 
-        # Store old values for audit
-        old_values = {
-            'message': reminder.message,
-            'scheduled_time': reminder.scheduled_time,
-            'reminder_type': reminder.reminder_type,
-            'status': reminder.status
-        }
+        # Snapshot for the audit diff
+        before = audit_snapshot(reminder)
 
         reminder.message = request.data.get('message', reminder.message)
         reminder.reminder_type = request.data.get('reminder_type', reminder.reminder_type)
@@ -146,7 +152,7 @@ class ReminderGenericAPIView(generics.GenericAPIView):
             user=request.user,
             action='update',
             instance=reminder,
-            old_value=old_values,
+            before=before,
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
@@ -156,30 +162,22 @@ class ReminderGenericAPIView(generics.GenericAPIView):
             'reminder': self.serializer_class(reminder).data,
         }, status=status.HTTP_200_OK)
 
+    @transaction.atomic
     def delete(self, request):
         reminder_id = request.query_params.get('id')
         reminder = Reminder.objects.filter(pk=reminder_id).first()
 
         # Check permissions
-        if hasattr(request.user, 'is_agent') and request.user.is_agent() and reminder.lead.owner != request.user:
+        if hasattr(request.user, 'is_agent') and request.user.is_agent() and reminder.lead.owner_id != request.user.pk:
             return Response({
                 'error': 'You can only delete reminders for your own leads'
             }, status=status.HTTP_403_FORBIDDEN)
 
-        # Store old values for audit
-        old_values = {
-            'message': reminder.message,
-            'scheduled_time': reminder.scheduled_time,
-            'reminder_type': reminder.reminder_type,
-            'status': reminder.status
-        }
-
         # Create audit entry before deletion
         create_audit_entry(
             user=request.user,
             action='delete',
             instance=reminder,
-            old_value=old_values,
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
@@ -0,0 +1,62 @@
+from apps.crm.models import WebhookEndpoint
+from apps.crm.pagination import paginate
+from apps.crm.permissions import IsManager
+from apps.crm.serializers import WebhookEndpointSerializer
+from apps.crm.services.outbox import outbox_position
+from rest_framework import generics, status
+from rest_framework.response import Response
+
+
+class WebhookGenericAPIView(generics.GenericAPIView):
+    """
+        Register the URLs CRM changes are delivered to (managers only).
+    """
+    permission_classes = [IsManager]
+    serializer_class = WebhookEndpointSerializer
+    query_budget = 3
+
+    def get(self, request):
+        endpoints, pagination = paginate(request, WebhookEndpoint.objects.all(), ['id'])
+
+        return Response({
+            'message': "Webhooks Fetched Successfully",
+            'webhooks': self.serializer_class(endpoints, many=True).data,
+            **pagination,
+        }, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # Only changes made from now on are delivered.
+        endpoint = serializer.save(last_event_id=outbox_position())
+
+        return Response({
+            'message': 'Webhook created successfully',
+            'webhook': self.serializer_class(endpoint).data,
+        }, status=status.HTTP_201_CREATED)
+
+    def put(self, request):
+        endpoint_id = request.data.get('id') or request.query_params.get('id')
+        endpoint = WebhookEndpoint.objects.filter(pk=endpoint_id).first()
+        if endpoint is None:
+            return Response({'error': 'Webhook not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = self.serializer_class(endpoint, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        # Any update also retries a backed-off endpoint on the next run.
+        endpoint = serializer.save(failures=0, next_attempt_at=None)
+
+        return Response({
+            'message': 'Webhook updated successfully',
+            'webhook': self.serializer_class(endpoint).data,
+        }, status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        endpoint_id = request.query_params.get('id')
+        deleted, _ = WebhookEndpoint.objects.filter(pk=endpoint_id).delete()
+        if not deleted:
+            return Response({'error': 'Webhook not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'message': 'Webhook deleted successfully'
+        }, status=status.HTTP_200_OK)
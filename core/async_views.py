@@ -0,0 +1,58 @@
+"""
+Async views on top of DRF.
+
+DRF only dispatches synchronously. AsyncAPIViewMixin turns a view into an
+async Django view: `async def` handlers are awaited on the event loop, while
+authentication, permission checks and the remaining sync handlers run through
+sync_to_async. Under ASGI a request waiting on the database or on an upstream
+API then holds no worker thread.
+
+Mix it in front of an existing view class and override the read handlers:
+
+    class LeadAsyncAPIView(AsyncAPIViewMixin, LeadGenericAPIView):
+        async def get(self, request, id=None):
+            ...
+"""
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.utils.functional import classproperty
+
+
+class AsyncAPIViewMixin:
+    @classproperty
+    def view_is_async(cls):
+        # Handlers may be a mix of sync and async; dispatch() adapts each one.
+        return True
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # DRF wraps the view in csrf_exempt(), a plain function; mark it again.
+        return markcoroutinefunction(view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication falls back to a user lookup for tokens without role claims.
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
@@ -0,0 +1,280 @@
+"""
+Read-replica routing.
+
+Databases listed in settings.DATABASE_REPLICAS are read-only copies of
+`default`. ReplicaRouter sends every write to `default`; reads go to a
+replica only inside a GET/HEAD request to a view that opts in with
+`replica_reads = True` (lists, exports, audit, dashboard) and only once the
+request's user is known:
+
+- A user whose request wrote anything is pinned to the primary for
+  REPLICA_PIN_SECONDS (a cache key, so every process sees it), so they read
+  their own writes even while the replicas catch up. A per-process cache
+  (LocMem with WEB_CONCURRENCY > 1, or the dummy cache) would hide the pin
+  from the other processes, so then every read stays on the primary.
+- Replicas lagging more than REPLICA_MAX_LAG seconds, or failing the lag
+  check, are skipped until the next check, REPLICA_LAG_CHECK_INTERVAL
+  seconds later. With no healthy replica, reads stay on the primary.
+
+One replica is picked per request, so all of its reads see the same copy.
+Queries outside requests (Celery tasks, management commands) use `default`.
+"""
+
+import contextvars
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('replica_routing', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_UNRESOLVED = object()
+
+# alias -> (checked_at, healthy); per process.
+_health = {}
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pins_are_shared():
+    """
+        Whether a pin set by one process is seen by the others.
+    """
+    backend = caches['default']
+    if isinstance(backend, DummyCache):
+        return False
+    return not isinstance(backend, LocMemCache) or getattr(settings, 'WEB_CONCURRENCY', 1) <= 1
+
+
+def routing_enabled():
+    return bool(replicas()) and pins_are_shared()
+
+
+def pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def replica_lag(alias):
+    """
+        Seconds `alias` trails the primary. Only PostgreSQL standbys report it;
+        other backends count as up to date.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        # Everything received has been replayed: caught up, however long ago the last write was.
+        cursor.execute(
+            "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+        )
+        return float(cursor.fetchone()[0] or 0)
+
+
+def is_healthy(alias):
+    now = time.monotonic()
+    checked = _health.get(alias)
+    if checked is not None and now - checked[0] < getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 5):
+        return checked[1]
+    try:
+        lag = replica_lag(alias)
+        healthy = lag <= getattr(settings, 'REPLICA_MAX_LAG', 10)
+        if not healthy:
+            logger.warning("Replica %s is %.1fs behind; reading from the primary", alias, lag)
+    except Exception as e:
+        logger.warning("Replica %s is unavailable: %s", alias, e)
+        healthy = False
+    _health[alias] = (now, healthy)
+    return healthy
+
+
+def choose_replica():
+    healthy = [alias for alias in replicas() if is_healthy(alias)]
+    return random.choice(healthy) if healthy else None
+
+
+class ReplicaRouting:
+    """
+        Routing state of one request, kept in a context variable so async ORM
+        calls running in worker threads share it.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.eligible = False
+        self.wrote = False
+        self._alias = _UNRESOLVED
+        self._resolving = False
+
+    def read_alias(self):
+        if not self.eligible:
+            return None
+        if self._alias is _UNRESOLVED:
+            if self._resolving:
+                return None
+            self._resolving = True
+            try:
+                # DRF authenticates inside the view and stores the user on the
+                # request; until then (e.g. its own user lookup) read the primary.
+                user = getattr(self.request, 'user', None)
+                if user is None or not user.is_authenticated:
+                    return None
+                self._alias = None if cache.get(pin_key(user.pk)) else choose_replica()
+            finally:
+                self._resolving = False
+        return self._alias
+
+
+def current_replica():
+    """
+        Replica the current request reads from, or None for the primary. Does
+        not pick one, so it is safe to call from async code.
+    """
+    routing = _current.get()
+    if routing is None or routing._alias is _UNRESOLVED:
+        return None
+    return routing._alias
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _current.get()
+        if routing is None:
+            return None
+        return routing.read_alias()
+
+    def db_for_write(self, model, **hints):
+        routing = _current.get()
+        if routing is not None:
+            routing.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        if db in replicas():
+            return False
+        return None
+
+
+def _bound(iterator, routing):
+    iterator = iter(iterator)
+    while True:
+        token = _current.set(routing)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _current.reset(token)
+        yield chunk
+
+
+async def _abound(iterator, routing):
+    iterator = aiter(iterator)
+    while True:
+        token = _current.set(routing)
+        try:
+            chunk = await anext(iterator)
+        except StopAsyncIteration:
+            return
+        finally:
+            _current.reset(token)
+        yield chunk
+
+
+class ReplicaRoutingMiddleware:
+    """
+        Sets up ReplicaRouter for each request and pins users who wrote to the
+        primary. Does nothing without DATABASE_REPLICAS or a shared cache.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        if replicas() and not pins_are_shared():
+            logger.warning(
+                "Read replicas are disabled: the default cache is not shared between processes, "
+                "so users could miss their own writes. Set CACHE_URL."
+            )
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not routing_enabled():
+            return self.get_response(request)
+        routing = ReplicaRouting(request)
+        token = _current.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        key = self.pin_key_for(request, routing)
+        if key:
+            cache.set(key, 1, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+        return self.bind_streaming(response, routing)
+
+    async def __acall__(self, request):
+        if not routing_enabled():
+            return await self.get_response(request)
+        routing = ReplicaRouting(request)
+        token = _current.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        key = self.pin_key_for(request, routing)
+        if key:
+            await cache.aset(key, 1, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+        return self.bind_streaming(response, routing)
+
+    @staticmethod
+    def pin_key_for(request, routing):
+        if not routing.wrote or request.method in SAFE_METHODS:
+            return None
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return None
+        return pin_key(user.pk)
+
+    @staticmethod
+    def bind_streaming(response, routing):
+        """
+            Streaming responses (exports) query while the server consumes them,
+            after this middleware has returned; route those reads the same way.
+        """
+        if response.streaming and routing.eligible:
+            if response.is_async:
+                response.streaming_content = _abound(response.streaming_content, routing)
+            else:
+                response.streaming_content = _bound(response.streaming_content, routing)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routing = _current.get()
+        if routing is None:
+            return None
+        view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+        routing.eligible = request.method in ('GET', 'HEAD') and getattr(view_class, 'replica_reads', False)
+        return None
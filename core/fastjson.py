@@ -0,0 +1,69 @@
+"""
+JSON rendering and parsing backed by orjson when it is installed.
+
+FastJSONRenderer / FastJSONParser are drop-in replacements for DRF's
+JSONRenderer / JSONParser. With orjson they encode and decode in C: datetimes,
+dates, UUIDs and dict/list/str subclasses (ReturnDict, ErrorDetail, ...) are
+handled natively, and only the remaining types (Decimal, timedelta, lazy
+strings) go through DRF's encoder. The output matches DRF's compact,
+non-ASCII-escaping JSON. Without orjson, for indented output (`indent=` media
+type parameter, browsable API), with COMPACT_JSON / UNICODE_JSON turned off or
+for values orjson rejects, both fall back to the stdlib implementation.
+"""
+
+from django.conf import settings
+from rest_framework.utils import encoders
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_drf_default = encoders.JSONEncoder().default
+
+
+def dumps(obj, default=_drf_default, passthrough_datetime=False):
+    """
+        Encode `obj` to UTF-8 JSON bytes with orjson, or None when orjson is
+        unavailable or cannot encode it. Datetimes go to `default` when
+        `passthrough_datetime` is set, e.g. to keep DjangoJSONEncoder's format.
+    """
+    if orjson is None:
+        return None
+    option = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+    if passthrough_datetime:
+        option |= orjson.OPT_PASSTHROUGH_DATETIME
+    try:
+        return orjson.dumps(obj, default=default, option=option)
+    except orjson.JSONEncodeError:
+        # e.g. integers beyond 64 bits, which the stdlib encoder accepts.
+        return None
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is None and self.compact and not self.ensure_ascii:
+            ret = dumps(data)
+            if ret is not None:
+                # Same escaping as JSONRenderer: keeps the output valid JavaScript.
+                return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
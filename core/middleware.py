@@ -0,0 +1,179 @@
+"""
+Per-request instrumentation.
+
+RequestMetricsMiddleware records, for every request, the resolved view, the
+number of SQL queries and time spent in the database (through a wrapper
+installed once on every database connection), the time spent in functions
+wrapped with `timed_serialization` (and, with REQUEST_METRICS_SERIALIZERS, in
+every DRF serializer's `.data`), the total time and the response size. The
+numbers are returned as a `Server-Timing` header and a sampled fraction of
+requests is logged as one JSON line on the `crm.metrics` logger. It runs
+natively in both sync (WSGI) and async (ASGI) stacks.
+
+Views can declare `query_budget = N`; a request issuing more than N queries
+logs a warning regardless of sampling.
+
+Queries run while a streaming response is being consumed happen after the
+middleware returns and are not counted.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import random
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework import serializers
+
+logger = logging.getLogger('crm.metrics')
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.view = None
+        self.query_budget = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def _instrument_connection(connection, **kwargs):
+    # Connections are per thread, and async ORM calls run in worker threads,
+    # so every connection carries the wrapper and finds the request through
+    # the context variable, which sync_to_async propagates. It goes first,
+    # once: connection.execute_wrapper() blocks append and pop their own
+    # wrapper at the end of the list, which must stay theirs.
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def timed_serialization(func):
+    """
+        Count the time spent in `func` as serializer time of the current request.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        metrics = _current.get()
+        if metrics is None:
+            return func(*args, **kwargs)
+        # Nested serializers run inside the outer one; only time the outermost.
+        metrics.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.serializer_depth -= 1
+            if metrics.serializer_depth == 0:
+                metrics.serializer_time += time.perf_counter() - start
+    wrapper._request_metrics = True
+    return wrapper
+
+
+def _instrument_serializers():
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        prop = cls.__dict__['data']
+        if not getattr(prop.fget, '_request_metrics', False):
+            cls.data = property(timed_serialization(prop.fget))
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 0.0)
+        self.server_timing = getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', True)
+        if getattr(settings, 'REQUEST_METRICS_SERIALIZERS', False):
+            _instrument_serializers()
+        connection_created.connect(_instrument_connection)
+        # Connections opened before this middleware was loaded.
+        for connection in connections.all(initialized_only=True):
+            _instrument_connection(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def finish(self, request, response, metrics, total):
+        if self.server_timing:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+                f'serializer;dur={metrics.serializer_time * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ])
+
+        over_budget = metrics.query_budget is not None and metrics.queries > metrics.query_budget
+        if over_budget or (self.sample_rate and random.random() < self.sample_rate):
+            line = json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': metrics.view,
+                'status': response.status_code,
+                'queries': metrics.queries,
+                'db_ms': round(metrics.db_time * 1000, 2),
+                'serializer_ms': round(metrics.serializer_time * 1000, 2),
+                'total_ms': round(total * 1000, 2),
+                'response_bytes': None if response.streaming else len(response.content),
+                'query_budget': metrics.query_budget,
+            })
+            if over_budget:
+                logger.warning(line)
+            else:
+                logger.info(line)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is None:
+            return None
+        view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+        match = request.resolver_match
+        metrics.view = (match.view_name if match and match.url_name else None) or getattr(
+            view_class or view_func, '__qualname__', None
+        )
+        metrics.query_budget = getattr(view_class, 'query_budget', None)
+        return None
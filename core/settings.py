@@ -53,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -61,6 +62,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.db_router.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -116,6 +118,24 @@ else:
         }
     }
 
+# Read replicas: SQLite files (locally) or PostgreSQL standby hosts (host[:port]),
+# comma-separated. Lists, exports, audit and the dashboard read from them.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+        DATABASES[alias]['NAME'] = BASE_DIR / replica.strip()
+    else:
+        host, _, port = replica.strip().partition(':')
+        DATABASES[alias].update(HOST=host, PORT=port or DATABASES['default']['PORT'])
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+# Users are pinned to the primary this long after a write; keep it above the usual replica lag.
+REPLICA_PIN_SECONDS = float(os.getenv('REPLICA_PIN_SECONDS', '5'))
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', '10'))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', '5'))
+
 
 
 # Password validation
@@ -157,11 +177,20 @@ STATIC_URL = 'static/'
 # REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.accounts.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.fastjson.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.SearchFilter',
@@ -182,6 +211,8 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=int(os.getenv('ACCESS_TOKEN_LIFETIME_MIN', '60'))),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=int(os.getenv('REFRESH_TOKEN_LIFETIME_DAYS', '7'))),
 }
+# Seconds a full User row fetched via request.user.instance is reused in-process
+AUTH_USER_CACHE_TTL = float(os.getenv('AUTH_USER_CACHE_TTL', '30'))
 
 # Celery / Redis
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
@@ -192,14 +223,129 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = os.getenv('TIME_ZONE', 'UTC')
 
+# Reminder dispatch
+REMINDER_DELIVERY_BACKEND = os.getenv('REMINDER_DELIVERY_BACKEND', 'apps.crm.services.reminders.LoggingDeliveryBackend')
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', '100'))
+REMINDER_MAX_ATTEMPTS = int(os.getenv('REMINDER_MAX_ATTEMPTS', '3'))
+# Seconds before a claimed but unfinished reminder (crashed worker) is delivered again
+REMINDER_CLAIM_TIMEOUT = int(os.getenv('REMINDER_CLAIM_TIMEOUT', '300'))
+
+# Cache: shared Redis when CACHE_URL is set, per-process memory otherwise.
+CACHE_URL = os.getenv('CACHE_URL')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', '300'))
+
+# Change feed (GET /api/changes/): Redis pub/sub when REDIS_URL is set, per-process memory otherwise.
+CHANGE_FEED_ENABLED = os.getenv('CHANGE_FEED_ENABLED', 'True').lower() == 'true'
+CHANGE_FEED_BACKEND = os.getenv('CHANGE_FEED_BACKEND', (
+    'apps.crm.services.changefeed.RedisChangeFeed' if os.getenv('REDIS_URL')
+    else 'apps.crm.services.changefeed.InMemoryChangeFeed'
+))
+CHANGE_FEED_KEEPALIVE = float(os.getenv('CHANGE_FEED_KEEPALIVE', '15'))
+# Streams end after this many seconds and the client reconnects, re-checking its token.
+CHANGE_FEED_MAX_AGE = float(os.getenv('CHANGE_FEED_MAX_AGE', '300'))
+# Each open stream holds a sync worker, so WSGI answers 501 unless this is on (runserver).
+CHANGE_FEED_WSGI_STREAMS = os.getenv('CHANGE_FEED_WSGI_STREAMS', str(DEBUG)).lower() == 'true'
+# Seconds a `?token=` from POST /api/changes/token/ can be used to connect
+CHANGE_FEED_TOKEN_LIFETIME = int(os.getenv('CHANGE_FEED_TOKEN_LIFETIME', '60'))
+# Worker processes per server (gunicorn reads it too). The in-memory feed refuses to stream with more than one.
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+# Transactional outbox and webhooks (POST /api/webhooks/, delivered by the deliver_webhooks task)
+OUTBOX_ENABLED = os.getenv('OUTBOX_ENABLED', 'True').lower() == 'true'
+WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', '500'))
+WEBHOOK_TIMEOUT = float(os.getenv('WEBHOOK_TIMEOUT', '10'))
+WEBHOOK_POOL_SIZE = int(os.getenv('WEBHOOK_POOL_SIZE', '10'))
+# Seconds an endpoint stays claimed while its batch is posted; a claim left by a crashed worker
+# expires after this. Keep it above WEBHOOK_TIMEOUT.
+WEBHOOK_CLAIM_TIMEOUT = float(os.getenv('WEBHOOK_CLAIM_TIMEOUT', '60'))
+# Events are delivered once this old, so transactions still writing earlier ids have committed.
+WEBHOOK_SETTLE_SECONDS = float(os.getenv('WEBHOOK_SETTLE_SECONDS', '5'))
+WEBHOOK_BACKOFF_BASE = float(os.getenv('WEBHOOK_BACKOFF_BASE', '5'))
+WEBHOOK_BACKOFF_MAX = float(os.getenv('WEBHOOK_BACKOFF_MAX', '3600'))
+
 # CORS
 CORS_ALLOW_ALL_ORIGINS = os.getenv('DJANGO_CORS_ALLOW_ALL', 'True').lower() == 'true'
 CORS_ALLOWED_ORIGINS = os.getenv('DJANGO_CORS_ORIGIN_WHITELIST', 'http://localhost:5173').split(',')
 CORS_ALLOW_CREDENTIALS = True
 
+# Maximum items accepted by the bulk create/update endpoints
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', '5000'))
+
+# Rows fetched per round trip by the streaming export endpoints
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+# Build list pages from .values() rows instead of the DRF field machinery (same output)
+COMPILED_LIST_SERIALIZERS = os.getenv('COMPILED_LIST_SERIALIZERS', 'True').lower() == 'true'
+
+# Serve the lead/contact/note lists, lead summary and dashboard with async views (ASGI deployments)
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False').lower() == 'true'
+
+# CSV import
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '1000'))
+IMPORT_MAX_REPORTED_ERRORS = int(os.getenv('IMPORT_MAX_REPORTED_ERRORS', '100'))
+
+# Audit trail
+# 'sync' writes each entry inside the request; 'buffered' batches them in a background thread.
+# Buffered entries are flushed on shutdown, but a killed process (SIGKILL, OOM) loses the last
+# AUDIT_FLUSH_INTERVAL seconds of them; use 'sync' where every entry must be kept.
+AUDIT_DURABILITY = os.getenv('AUDIT_DURABILITY', 'buffered')
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', '200'))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', '1.0'))
+AUDIT_QUEUE_MAX_SIZE = int(os.getenv('AUDIT_QUEUE_MAX_SIZE', '10000'))
+# Months kept in the hot table before `archive_audit_trail` moves them to AUDIT_ARCHIVE_DIR.
+AUDIT_HOT_MONTHS = int(os.getenv('AUDIT_HOT_MONTHS', '12'))
+AUDIT_ARCHIVE_DIR = os.getenv('AUDIT_ARCHIVE_DIR', str(BASE_DIR / 'audit_archive'))
+AUDIT_PARTITION_MONTHS_AHEAD = int(os.getenv('AUDIT_PARTITION_MONTHS_AHEAD', '3'))
+
+# Request metrics: Server-Timing headers and a sampled JSON log line per request
+REQUEST_METRICS_SERVER_TIMING = os.getenv('REQUEST_METRICS_SERVER_TIMING', 'True').lower() == 'true'
+REQUEST_METRICS_SAMPLE_RATE = float(os.getenv('REQUEST_METRICS_SAMPLE_RATE', '0.01'))
+# Also time every DRF serializer's .data (patches Serializer.data process-wide)
+REQUEST_METRICS_SERIALIZERS = os.getenv('REQUEST_METRICS_SERIALIZERS', 'False').lower() == 'true'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'crm.metrics': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # AI Configuration
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 GEMINI_API_URL = os.getenv("GEMINI_API_URL")
+AI_SUMMARY_CACHE_TIMEOUT = int(os.getenv('AI_SUMMARY_CACHE_TIMEOUT', '86400'))
+# Seconds before a model call is abandoned
+AI_SUMMARY_TIMEOUT = float(os.getenv('AI_SUMMARY_TIMEOUT', '30'))
+# Notes longer than this many (estimated) tokens are summarized in windows of that size
+AI_SUMMARY_WINDOW_TOKENS = int(os.getenv('AI_SUMMARY_WINDOW_TOKENS', '8000'))
+# Window summaries generated at once for one lead
+AI_SUMMARY_MAP_CONCURRENCY = int(os.getenv('AI_SUMMARY_MAP_CONCURRENCY', '4'))
+# Batch summaries (refresh_lead_summaries task / summarize_leads command)
+AI_SUMMARY_BATCH_CONCURRENCY = int(os.getenv('AI_SUMMARY_BATCH_CONCURRENCY', '8'))
+AI_SUMMARY_BATCH_CHUNK = int(os.getenv('AI_SUMMARY_BATCH_CHUNK', '500'))
+# Model calls per second and burst size; keep below the API quota
+AI_SUMMARY_RATE = float(os.getenv('AI_SUMMARY_RATE', '2'))
+AI_SUMMARY_BURST = int(os.getenv('AI_SUMMARY_BURST', '5'))
+# Consecutive failures that stop model calls, and seconds before trying again
+AI_SUMMARY_BREAKER_THRESHOLD = int(os.getenv('AI_SUMMARY_BREAKER_THRESHOLD', '5'))
+AI_SUMMARY_BREAKER_RESET = float(os.getenv('AI_SUMMARY_BREAKER_RESET', '60'))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -14,36 +14,60 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from apps.crm.views.audit import AuditGenericAPIView
-from apps.crm.views.contact import ContactGenericAPIView
+from apps.crm.views.audit import AuditExportAPIView, AuditGenericAPIView
+from apps.crm.views.changes import ChangeFeedAPIView, ChangeFeedTokenAPIView
+from apps.crm.views.contact import ContactAsyncAPIView, ContactBulkAPIView, ContactExportAPIView, ContactGenericAPIView
 from apps.crm.views.correspondence import CorrespondenceGenericAPIView
-from apps.crm.views.lead import LeadGenericAPIView
-from apps.crm.views.note import NoteGenericAPIView
+from apps.crm.views.lead import LeadAsyncAPIView, LeadBulkAPIView, LeadExportAPIView, LeadGenericAPIView, LeadTimelineAPIView
+from apps.crm.views.note import NoteAsyncAPIView, NoteGenericAPIView
 from apps.crm.views.reminder import ReminderGenericAPIView
-from apps.crm.views.dashboard import DashboardAPIView
+from apps.crm.views.webhooks import WebhookGenericAPIView
+from apps.crm.views.dashboard import DashboardAPIView, DashboardAsyncAPIView
+from apps.crm.views.imports import ImportAPIView
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from apps.accounts.views import RoleTokenObtainPairView, RoleTokenRefreshView
+
+# Under ASGI the read endpoints are served by their async variants.
+if settings.ASYNC_READ_VIEWS:
+    LeadView, ContactView, NoteView, DashboardView = (
+        LeadAsyncAPIView, ContactAsyncAPIView, NoteAsyncAPIView, DashboardAsyncAPIView,
+    )
+else:
+    LeadView, ContactView, NoteView, DashboardView = (
+        LeadGenericAPIView, ContactGenericAPIView, NoteGenericAPIView, DashboardAPIView,
+    )
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='docs'),
-    path('api/leads/', LeadGenericAPIView.as_view(), name='leads'),
-    path('api/leads/<int:id>/summary/', LeadGenericAPIView.as_view(), name='lead-summary'),
-    path('api/contacts/', ContactGenericAPIView.as_view(), name='contacts'),
-    path('api/notes/', NoteGenericAPIView.as_view(), name='notes'),
+    path('api/leads/', LeadView.as_view(), name='leads'),
+    path('api/leads/bulk/', LeadBulkAPIView.as_view(), name='leads-bulk'),
+    path('api/leads/export/', LeadExportAPIView.as_view(), name='leads-export'),
+    path('api/leads/<int:id>/summary/', LeadView.as_view(), name='lead-summary'),
+    path('api/leads/<int:id>/timeline/', LeadTimelineAPIView.as_view(), name='lead-timeline'),
+    path('api/contacts/', ContactView.as_view(), name='contacts'),
+    path('api/contacts/bulk/', ContactBulkAPIView.as_view(), name='contacts-bulk'),
+    path('api/contacts/export/', ContactExportAPIView.as_view(), name='contacts-export'),
+    path('api/notes/', NoteView.as_view(), name='notes'),
     path('api/reminders/', ReminderGenericAPIView.as_view(), name='reminders'),
     path('api/correspondence/', CorrespondenceGenericAPIView.as_view(), name='correspondence'),
     path('api/audit/', AuditGenericAPIView.as_view(), name='audit'),
+    path('api/audit/export/', AuditExportAPIView.as_view(), name='audit-export'),
+    path('api/import/', ImportAPIView.as_view(), name='import'),
+    path('api/changes/', ChangeFeedAPIView.as_view(), name='changes'),
+    path('api/changes/token/', ChangeFeedTokenAPIView.as_view(), name='changes-token'),
+    path('api/webhooks/', WebhookGenericAPIView.as_view(), name='webhooks'),
     # Dashboard endpoint
-    path('api/dashboard/', DashboardAPIView.as_view(), name='dashboard'),
+    path('api/dashboard/', DashboardView.as_view(), name='dashboard'),
     
     # JWT Auth endpoints (explicitly defined for clarity)
-    path('api/auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/auth/token/', RoleTokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/auth/token/refresh/', RoleTokenRefreshView.as_view(), name='token_refresh'),
 
     path('api/auth/', include('apps.accounts.urls')),
 ]